@@ -0,0 +1,398 @@
+#! /usr/bin/env python
+#
+"""
+This module provides an asyncio interface to the magnitude conversions, for
+programs built on an event loop that must not be held up for the seconds a
+catalogue conversion takes.  The coroutines of an AsyncConverter do the work
+in executors and only wait for it in the loop:
+
+    -- the model grids are read, and the catalogue chunks read and the output
+       written, in the default (thread) executor of the loop
+
+    -- the fits are made in the same executor, one at a time; fit requests
+       that are the same as one already running do not start another fit but
+       wait for that one, so many conversions started at once for the same
+       filters make only one fit
+
+    -- the transformations are evaluated in the executor given, a
+       concurrent.futures.ThreadPoolExecutor or ProcessPoolExecutor (by
+       default the loop's thread executor, as numpy does the evaluation
+       without holding the python interpreter lock)
+
+so many catalogues can be converted at the same time from one loop:
+
+    import asyncio
+    import async_converter
+
+    async def main(cfgfiles):
+        converter = async_converter.AsyncConverter()
+        await asyncio.gather(*[converter.convert_catalog(x) for x in cfgfiles])
+
+    asyncio.run(main(['field1.cfg', 'field2.cfg']))
+
+The array conversions give the same values as MagnitudeConverter.convert and
+MagnitudeConverter.systematics (see magnitude_converter.py), and
+convert_catalog writes the same text output file as a non-interactive run of
+jwst_magnitude_converter.py, reading the next chunk of the catalogue and
+writing the last one while a chunk is converted.  Errors are raised as
+exceptions in the coroutines.
+"""
+import asyncio
+import threading
+
+import numpy
+from configobj import ConfigObj
+
+import catalog_io
+import fit_engine
+import grid_parameters
+import magnitude_converter
+
+# The number of catalogue rows read, converted, and written at a time by
+# convert_catalog when the chunksize parameter is not given.
+DEFAULT_CHUNK_SIZE = 100000
+
+# The cfg file parameters of jwst_magnitude_converter.py that convert_catalog
+# does not do; use autoTransform for these.
+unsupported_parameters = ['error1column', 'error2column', 'outputformat', 'plots', 'profile']
+
+
+def evaluate(xdata, ydata, coefficients, fit_range, yopt, dtype, table=None, scatter=None):
+    """
+This routine evaluates the transformations, and optionally the systematic
+uncertainties, for the colours and magnitudes of a catalogue.  It is the work
+sent to the evaluation executor, so it is a module level function of arrays
+that can be run in another process.
+
+Parameters:
+
+    xdata, ydata  :  numpy float arrays
+
+        The colour and magnitude values (see magnitude_converter.colour_magnitude).
+
+    coefficients  :  numpy float array
+
+        The (norder+1) x K fit coefficients.
+
+    fit_range  :  tuple of two floats
+
+        The model colour range of the fits.
+
+    yopt  :  integer
+
+        0 or 1, the yvalue parameter less one.
+
+    dtype  :  numpy dtype
+
+        The type of the values returned.
+
+    table  :  numpy float array or None
+
+        The lookup table to interpolate in (the 'lut' engine), or None to
+        evaluate the polynomials.
+
+    scatter  :  numpy float array or None
+
+        The binned model scatter of the fits, to give the systematic
+        uncertainties, or None.
+
+Returns:
+
+    magnitudes  :  numpy array
+
+        The N x K transformed magnitudes.
+
+    systematics  :  numpy array or None
+
+        The N x K systematic uncertainties, if scatter is given.
+
+    """
+    if table is None:
+        magnitudes = fit_engine.evaluate_transformations(xdata, ydata, coefficients, fit_range[0]-0.5,
+                                                         fit_range[1]+0.5, yopt, dtype)
+    else:
+        magnitudes = fit_engine.evaluate_lookup_table(xdata, ydata, table, yopt, dtype)
+    systematics = None
+    if scatter is not None:
+        systematics = fit_engine.evaluate_scatter(xdata, scatter, fit_range[0], fit_range[1], dtype)
+    return magnitudes, systematics
+
+
+def colour_magnitude_labels(filter1, filter2, column_types):
+    """
+Return the labels of the colour and magnitude made from two input columns,
+as magConGUI.makexy gives them for the output file header.
+    """
+    if column_types[0] != 'magnitude':
+        return filter2+' - '+filter1, filter1
+    return filter1+' - '+filter2, filter1
+
+
+def output_header(xlabel, ylabel, labels, systematics, radec):
+    """
+Return the header line of a text output file, the same as that of
+magConGUI.writeMagsHeader.
+    """
+    header = '# %s | %s ' % (xlabel, ylabel)
+    for label in labels:
+        header = header+' | '+label
+    if systematics:
+        for label in labels:
+            header = header+' | '+label.strip()+' systematic'
+    header = header.rstrip(' ,')
+    if radec:
+        header = header+' | RA | Dec '
+    return header+'\n'
+
+
+class AsyncConverter():
+    """
+This class does magnitude conversions from an asyncio event loop.
+    """
+    def __init__(self, fit_cache_file=None, directory=None, executor=None):
+        """
+Set up the converter; the model grids are read when first used.
+
+Parameters:
+
+    fit_cache_file  :  string or None
+
+        The fit cache database, as for MagnitudeConverter.
+
+    directory  :  string or None
+
+        The directory of the grid files, as for MagnitudeConverter.
+
+    executor  :  concurrent.futures.Executor or None
+
+        The executor for the evaluation of the transformations, or None for
+        the default executor of the loop.
+        """
+        self.fit_cache_file = fit_cache_file
+        self.directory = directory
+        self.executor = executor
+        self.converters = {}
+        # The number of requests that waited for a fit or grid read already
+        # running rather than starting their own.
+        self.coalesced = 0
+        self._running = {}
+        self._fit_lock = threading.Lock()
+
+    async def _coalesce(self, key, function, *args):
+        """
+Run function(*args) in the default executor, or if a call with the same key
+is already running, wait for its result instead.
+        """
+        if key in self._running:
+            self.coalesced = self.coalesced+1
+            return await asyncio.shield(self._running[key])
+        future = asyncio.get_running_loop().run_in_executor(None, function, *args)
+        self._running[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self._running.get(key) is future:
+                del self._running[key]
+
+    async def converter(self, model_set='Kurucz'):
+        """
+Return the MagnitudeConverter of a model set, reading its grid the first
+time.
+        """
+        if model_set not in self.converters:
+            self.converters[model_set] = await self._coalesce(
+                ('grid', model_set), magnitude_converter.MagnitudeConverter, model_set, self.fit_cache_file,
+                self.directory)
+        return self.converters[model_set]
+
+    def _fit(self, converter, input_filters, target_filters, yvalue, norder, lut_step, selection):
+        """
+Do the fits for a conversion in an executor thread, one at a time, and
+return the coefficients, the model colour range, the statistics, the target
+filter labels, the binned scatter, and the lookup table if lut_step is not
+None.
+        """
+        with self._fit_lock:
+            coefficients, fit_range, statistics, labels = converter.fit(input_filters, target_filters,
+                                                                        yvalue, norder, selection)
+            scatter, fit_range = converter.fit_scatter(input_filters, target_filters, yvalue, norder, selection)
+            table = None
+            if lut_step is not None:
+                table = converter.lookup_table(input_filters, target_filters, yvalue, norder, lut_step,
+                                               selection)[0]
+        return coefficients, fit_range, statistics, labels, scatter, table
+
+    async def fits(self, input_filters, target_filters, yvalue=1, norder=4, model_set='Kurucz', lut_step=None,
+                   selection=None):
+        """
+This routine returns the fits for a conversion: the coefficients, the model
+colour range, the statistics, and the target filter labels as from
+MagnitudeConverter.fit, then the binned scatter as from
+MagnitudeConverter.fit_scatter and the lookup table of the 'lut' engine for
+the colour step lut_step (None if lut_step is None).  The selection of the
+grid rows to fit is as for MagnitudeConverter.fit.  Requests for the same
+fits as one still running wait for it.
+        """
+        converter = await self.converter(model_set)
+        columns = (converter.filter_column(input_filters[0]), converter.filter_column(input_filters[1]),
+                   tuple(converter.target_columns(target_filters)))
+        selection_key = grid_parameters.selection_key(grid_parameters.parse_selection(selection))
+        key = ('fit', model_set, columns, int(yvalue), int(norder), lut_step, selection_key)
+        return await self._coalesce(key, self._fit, converter, input_filters, target_filters, yvalue, norder,
+                                    lut_step, selection)
+
+    async def evaluate(self, xdata, ydata, fits, yvalue, dtype=numpy.float32, systematics=False):
+        """
+Evaluate the transformations of fits (from the fits coroutine) for colours
+and magnitudes in the evaluation executor, returning the magnitudes and the
+systematic uncertainties (None if systematics is False).
+        """
+        coefficients, fit_range, statistics, labels, scatter, table = fits
+        if not systematics:
+            scatter = None
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, evaluate, xdata, ydata, coefficients, fit_range, yvalue-1, dtype, table, scatter)
+
+    async def convert(self, mag1, mag2, input_filters, target_filters, column_types=('magnitude', 'magnitude'),
+                      yvalue=1, norder=4, dtype=numpy.float32, engine='legendre',
+                      lut_step=fit_engine.DEFAULT_TABLE_STEP, model_set='Kurucz', systematics=False,
+                      selection=None):
+        """
+This routine converts arrays of input magnitudes to JWST magnitudes.  The
+parameters are those of MagnitudeConverter.convert, with the model set and
+systematics, True to return the systematic uncertainties as well.
+
+Returns:
+
+    magnitudes  :  numpy array
+
+        The N x K array of the transformed magnitudes.
+
+    systematics  :  numpy array
+
+        The N x K array of the systematic uncertainties, only returned if
+        systematics is True.
+
+        """
+        if engine not in ['legendre', 'lut']:
+            raise ValueError('Unknown engine %s; the engines are legendre and lut.' % (engine))
+        xdata, ydata = magnitude_converter.colour_magnitude(mag1, mag2, column_types)
+        fits = await self.fits(input_filters, target_filters, yvalue, norder, model_set,
+                               lut_step if engine == 'lut' else None, selection)
+        magnitudes, values = await self.evaluate(xdata, ydata, fits, yvalue, dtype, systematics)
+        if systematics:
+            return magnitudes, values
+        return magnitudes
+
+    async def convert_catalog(self, parameters):
+        """
+This routine converts a catalogue as a non-interactive run of
+jwst_magnitude_converter.py does, writing the same text output file.
+
+Parameters:
+
+    parameters  :  string or dictionary
+
+        The name of a cfg file, or its parameters (a ConfigObj or a
+        dictionary of the Input_Magnitude_Parameters and Output_Filter_Values
+        sections).  The parameters in unsupported_parameters are not done
+        here.  The catalogue is converted chunksize rows at a time
+        (DEFAULT_CHUNK_SIZE if it is not given).  The fitcache parameter is
+        not used; the fit cache is that of the AsyncConverter.
+
+Returns:
+
+    nrows  :  integer
+
+        The number of rows converted.
+
+Bad parameters raise a ValueError or KeyError.
+        """
+        if isinstance(parameters, str):
+            parameters = await asyncio.get_running_loop().run_in_executor(None, ConfigObj, parameters)
+        inputs = parameters['Input_Magnitude_Parameters']
+        outputs = parameters['Output_Filter_Values']
+        for key in unsupported_parameters:
+            if key in inputs or (key in outputs and str(outputs[key]).lower() not in ['no', 'false', 'text']):
+                raise ValueError('The %s parameter is not supported by convert_catalog.' % (key))
+        filter1 = inputs['filter1'].replace('_', ' ')
+        filter2 = inputs['filter2'].replace('_', ' ')
+        column_types = (inputs['column1type'], inputs['column2type'])
+        if column_types[0] != 'magnitude' and column_types[1] != 'magnitude':
+            raise ValueError('Two colours cannot be converted; one column must be a magnitude.')
+        if 'jwstfilters' in outputs:
+            target_filters = outputs['jwstfilters']
+            if not isinstance(target_filters, list):
+                target_filters = [target_filters]
+        else:
+            target_filters = [outputs['jwst1'], outputs['jwst2']]
+        target_filters = [x.replace('_', ' ') for x in target_filters]
+        yvalue = int(inputs['yvalue'])
+        norder = int(outputs['fitorder'])
+        indexes = [int(inputs[key])-1 for key in ['column1', 'column2', 'racolumn', 'deccolumn']]
+        if indexes[0] == indexes[1] or indexes[0] < 0 or indexes[1] < 0:
+            raise ValueError('Bad input columns %s and %s.' % (inputs['column1'], inputs['column2']))
+        row_range = None
+        if 'firstrow' in inputs or 'lastrow' in inputs:
+            lastrow = inputs.get('lastrow', None)
+            row_range = (int(inputs.get('firstrow', 1))-1, None if lastrow is None else int(lastrow))
+        chunk_size = int(inputs.get('chunksize', 0))
+        if chunk_size <= 0:
+            chunk_size = DEFAULT_CHUNK_SIZE
+        dtype = None
+        if 'computetype' in inputs:
+            compute_type = inputs['computetype'].lower()
+            if compute_type not in ['float32', 'float64']:
+                raise ValueError('Unknown compute type %s; the types are float32 and float64.' % (compute_type))
+            dtype = numpy.dtype(compute_type).type
+        engine = outputs.get('engine', 'legendre').lower()
+        lut_step = float(outputs.get('lutstep', fit_engine.DEFAULT_TABLE_STEP))
+        if engine not in ['legendre', 'lut']:
+            raise ValueError('Unknown engine %s; the engines are legendre and lut.' % (engine))
+        systematics = str(outputs.get('systematics', 'no')).lower() in ['yes', 'true']
+
+        fits = await self.fits((filter1, filter2), target_filters, yvalue, norder, outputs['modelset'],
+                               lut_step if engine == 'lut' else None, outputs.get('selection', None))
+        xlabel, ylabel = colour_magnitude_labels(filter1, filter2, column_types)
+        loop = asyncio.get_running_loop()
+        chunks = catalog_io.read_chunks(inputs['datafile'], indexes[0], indexes[1], indexes[2], indexes[3],
+                                        chunk_size, row_range, dtype)
+        outfile = await loop.run_in_executor(None, open, outputs['outfilename'], 'w')
+        nrows = 0
+        reading = None
+        writing = None
+        try:
+            reading = loop.run_in_executor(None, next, chunks, None)
+            while True:
+                chunk = await reading
+                if chunk is None:
+                    break
+                reading = loop.run_in_executor(None, next, chunks, None)
+                mag1, mag2, ravalues, decvalues = chunk
+                xdata, ydata = magnitude_converter.colour_magnitude(mag1, mag2, column_types)
+                magnitudes, values = await self.evaluate(xdata, ydata, fits, yvalue, numpy.float32, systematics)
+                columns = [xdata, ydata, magnitudes]
+                if values is not None:
+                    columns.append(values)
+                if writing is None:
+                    await loop.run_in_executor(None, outfile.write,
+                                               output_header(xlabel, ylabel, fits[3], systematics,
+                                                             ravalues is not None))
+                else:
+                    await writing
+                writing = loop.run_in_executor(None, catalog_io.write_rows, outfile, columns, ravalues,
+                                               decvalues)
+                nrows = nrows+len(xdata)
+            if writing is not None:
+                await writing
+        finally:
+            # after an error the chunk being read and the one being written
+            # are waited for before the catalogue and the output are closed
+            for future in [reading, writing]:
+                if future is not None:
+                    await asyncio.wait([future])
+                    if not future.cancelled():
+                        future.exception()
+            await loop.run_in_executor(None, chunks.close)
+            await loop.run_in_executor(None, outfile.close)
+        return nrows
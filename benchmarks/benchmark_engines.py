@@ -0,0 +1,89 @@
+#! /usr/bin/env python
+#
+"""
+This script compares the two evaluation engines of the magnitude
+transformations for catalogues of different sizes:
+
+    legendre -- the fitted Legendre polynomials evaluated for each source
+                (fit_engine.evaluate_transformations)
+
+    lut      -- linear interpolation in a table of the polynomials on a fixed
+                colour step (fit_engine.evaluate_lookup_table)
+
+The fits are those of the Kurucz model set from HST ACS F814W and HST WFC3
+F160W to 2 NIRISS filters, to all the NIRISS filters, and to all the JWST
+filters.  The input colours are drawn uniformly over (and a little beyond) the
+model colour range.  For each case the script prints the evaluation times, the
+speed-up of the table, its largest interpolation error, and the largest
+difference between the two engines.
+
+Use
+
+    python benchmarks/benchmark_engines.py [--sizes N1 N2 ...] [--repeat N] [--step STEP]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import fit_engine
+import magnitude_converter
+
+input_filters = ['HST ACS F814W', 'HST WFC3 F160W']
+
+target_sets = [('2 filters', ['NIRISS F115W', 'NIRISS F200W']),
+               ('all NIRISS', ['all NIRISS']),
+               ('all JWST', ['all'])]
+
+
+def best_time(function, repeat):
+    """
+This routine returns the shortest run time, in seconds, of repeated calls of
+a function, and the value it returned.
+    """
+    times = []
+    for n in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter()-start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the Legendre and lookup table engines.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='the catalogue sizes to time')
+    parser.add_argument('--repeat', type=int, default=5, help='the number of runs of each measurement')
+    parser.add_argument('--step', type=float, default=fit_engine.DEFAULT_TABLE_STEP,
+                        help='the colour step of the lookup table')
+    args = parser.parse_args()
+
+    converter = magnitude_converter.MagnitudeConverter('Kurucz', fit_cache_file='none')
+    rng = numpy.random.default_rng(1)
+    print('%-12s %4s %10s %12s %12s %8s %11s %11s' % ('targets', 'K', 'N', 'legendre s', 'lut s',
+                                                     'speed-up', 'lut error', 'difference'))
+    for name, targets in target_sets:
+        coefficients, fit_range, statistics, labels = converter.fit(input_filters, targets)
+        table, errors = converter.lookup_table(input_filters, targets, lut_step=args.step)
+        xmin = fit_range[0]-0.5
+        xmax = fit_range[1]+0.5
+        for size in args.sizes:
+            xdata = rng.uniform(xmin-0.5, xmax+0.5, size)
+            ydata = rng.uniform(15., 25., size)
+            out = numpy.empty((size, len(labels)), dtype=numpy.float32)
+            legendre_time, legendre_values = best_time(
+                lambda: fit_engine.evaluate_transformations(xdata, ydata, coefficients, xmin, xmax, 0,
+                                                            out=out).copy(), args.repeat)
+            lut_time, lut_values = best_time(
+                lambda: fit_engine.evaluate_lookup_table(xdata, ydata, table, 0, out=out).copy(),
+                args.repeat)
+            print('%-12s %4d %10d %12.4f %12.4f %8.2f %11.2e %11.2e' % (
+                name, len(labels), size, legendre_time, lut_time, legendre_time/lut_time,
+                numpy.max(errors), numpy.max(numpy.abs(lut_values-legendre_values))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#! /usr/bin/env python
+#
+"""
+This script measures the start-up cost of jwst_magnitude_converter.py for
+batch (non-interactive) use.  Each measurement is made in a fresh python
+process, as for the individual tasks of a cluster array job:
+
+    import   -- the time to import jwst_magnitude_converter, and which of the
+                heavy optional modules (tkinter, matplotlib, astropy) were
+                imported with it
+
+    batch    -- the wall clock time of a complete non-interactive conversion
+                of the sample catalogue m31_f814_f160_subset.data to two
+                NIRISS filters
+
+Use
+
+    python benchmarks/benchmark_startup.py [--repeat N] [--code-dir DIR]
+
+where DIR is the directory holding the version of jwst_magnitude_converter.py
+to time (by default the one in the parent directory of this script).  To see
+the improvement from one version to another, run the script once with each
+version, for example with an older version checked out by "git worktree add".
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+default_code_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+import_script = """
+import sys
+sys.path.insert(0, %r)
+import jwst_magnitude_converter
+print(' '.join(m for m in ['tkinter', 'matplotlib', 'astropy'] if m in sys.modules))
+"""
+
+batch_config = """[Input_Magnitude_Parameters]
+	filter1=HST_ACS_F814W
+	filter2=HST_WFC3_F160W
+	column1=3
+	column2=4
+	column1type=magnitude
+	column2type=magnitude
+	yvalue=1
+	datafile=%s
+	racolumn=1
+	deccolumn=2
+[Output_Filter_Values]
+	jwst1=NIRISS F115W
+	jwst2=NIRISS F200W
+	modelset=Kurucz
+	fitorder=4
+	outfilename=%s
+"""
+
+
+def time_command(command, work_dir, repeat):
+    """
+This routine runs a command several times without a display (as on a compute
+node) and returns the run times, in seconds, and the standard output of the
+last run.
+    """
+    environment = dict(os.environ)
+    environment.pop('DISPLAY', None)
+    times = []
+    output = ''
+    for n in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run(command, cwd=work_dir, check=True, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, env=environment,
+                                universal_newlines=True).stdout
+        times.append(time.perf_counter()-start)
+    return times, output
+
+
+def summary(times):
+    times = sorted(times)
+    return 'median %.3f s   min %.3f s   max %.3f s' % (times[len(times)//2], times[0], times[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the start-up of batch magnitude conversions.')
+    parser.add_argument('--repeat', type=int, default=10, help='the number of runs of each measurement')
+    parser.add_argument('--code-dir', default=default_code_dir,
+                        help='the directory holding the jwst_magnitude_converter.py to time')
+    args = parser.parse_args()
+    code_dir = os.path.abspath(args.code_dir)
+    work_dir = tempfile.mkdtemp()
+
+    times, output = time_command([sys.executable, '-c', import_script % code_dir], work_dir, args.repeat)
+    print('import:  %s' % summary(times))
+    print('         heavy modules imported: %s' % (output.strip() or 'none'))
+
+    config_file = os.path.join(work_dir, 'benchmark.cfg')
+    with open(config_file, 'w') as outfile:
+        outfile.write(batch_config % (os.path.join(code_dir, 'm31_f814_f160_subset.data'),
+                                      os.path.join(work_dir, 'benchmark_out.txt')))
+    times, output = time_command([sys.executable, os.path.join(code_dir, 'jwst_magnitude_converter.py'),
+                                  config_file], work_dir, args.repeat)
+    print('batch:   %s' % summary(times))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+#! /usr/bin/env python
+#
+"""
+This script times each stage of a non-interactive conversion separately, for
+the sample catalogue m31_f814_f160_subset.data and for synthetic catalogues
+of any size, and writes the results to a JSON file:
+
+    grid      -- magConGUI.readMagslist for the Kurucz grid: parsing the text
+                 grid (and writing the binary cache), reading the binary
+                 cache, and taking the grid already read in the process
+
+    fit       -- magConGUI.fit1 (and so doFit) for 1, 2, and 59 (all JWST)
+                 target filters, without the fit cache
+
+    read      -- reading the magnitude and RA/Dec columns of the catalogue
+                 (catalog_io.read_chunks, as for autoTransform)
+
+    evaluate  -- magConGUI.applyFits for the target filters, with both the
+                 legendre and the lut engines
+
+    write     -- writing the output file with magConGUI.writeMags, as text
+                 and as a FITS table
+
+The synthetic catalogues are made from random rows of the Kurucz grid, with
+the HST ACS F814W and HST WFC3 F160W magnitudes shifted to 16 to 26 and a
+little noise added, in the same four column layout (RA, Dec, F814W, F160W)
+as the sample catalogue.  They are written once to the work directory and
+reused by later runs.  Catalogues are read, evaluated, and written in chunks
+of --chunk rows, the stage times being summed over the chunks, so sizes up
+to 1e8 rows can be run (given the disk space: about 40 bytes a row for the
+catalogue and 11 bytes per row and column for the text output).
+
+Use
+
+    python benchmarks/benchmark_suite.py [--sizes N1 N2 ...] [--targets 1 2 59]
+                                         [--repeat N] [--output results.json]
+
+and compare two result files with benchmarks/compare_benchmarks.py.
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy
+
+code_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, code_dir)
+import catalog_io
+import jwst_magnitude_converter
+
+sample_catalog = os.path.join(code_dir, 'm31_f814_f160_subset.data')
+grid_name = 'magslist_old_kurucz.new'
+input_filters = ['HST ACS F814W', 'HST WFC3 F160W']
+
+# The target filters of each fit size.
+target_sets = {1: ['NIRISS F200W'],
+               2: ['NIRISS F115W', 'NIRISS F200W'],
+               59: ['all']}
+
+
+def best_time(function, repeat):
+    """
+This routine calls a function repeat times, with anything it prints thrown
+away, and returns the list of run times in seconds.
+    """
+    times = []
+    for n in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter()-start)
+    return times
+
+
+def result(times, rows=None):
+    """
+Return the JSON record of a set of timings: the best (shortest), median, and
+all times, and the rows per second for the best time if rows is given.
+    """
+    record = {'seconds': min(times), 'median': sorted(times)[len(times)//2], 'times': times}
+    if rows is not None:
+        record['rows'] = int(rows)
+        record['rows_per_second'] = rows/max(min(times), 1.e-9)
+    return record
+
+
+def make_catalog(file_name, nrows, values, labels, block_size=1000000):
+    """
+This routine writes a synthetic catalogue of nrows rows made from random rows
+of the model grid values, in blocks of block_size rows.
+    """
+    column1 = labels.index(input_filters[0])
+    column2 = labels.index(input_filters[1])
+    rng = numpy.random.default_rng(nrows)
+    with open(file_name+'.part', 'w') as outfile:
+        outfile.write('# ra dec F814W F160W\n')
+        for start in range(0, nrows, block_size):
+            n = min(block_size, nrows-start)
+            rows = rng.integers(0, len(values), n)
+            shift = rng.uniform(16., 26., n)-values[rows, column1]
+            mag1 = values[rows, column1]+shift+rng.normal(0., 0.02, n)
+            mag2 = values[rows, column2]+shift+rng.normal(0., 0.02, n)
+            catalog_io.write_rows(outfile, [rng.uniform(10., 11., n), rng.uniform(41., 42., n), mag1, mag2])
+    os.rename(file_name+'.part', file_name)
+
+
+def time_grid(repeat, work_dir):
+    """
+Time magConGUI.readMagslist for the text grid, the binary cache, and the
+grid already in memory.
+    """
+    converter = jwst_magnitude_converter.magConGUI()
+    file_name = os.path.join(jwst_magnitude_converter.path, grid_name)
+    results = {}
+    old_cache_path = os.environ.get('MAGNITUDE_GRID_CACHE_PATH')
+    cache_dirs = []
+
+    def parse():
+        cache_dirs.append(tempfile.mkdtemp(dir=work_dir))
+        os.environ['MAGNITUDE_GRID_CACHE_PATH'] = cache_dirs[-1]
+        jwst_magnitude_converter.gridStore.clear()
+        converter.readMagslist(file_name, 142, 0)
+
+    def cached():
+        jwst_magnitude_converter.gridStore.clear()
+        converter.readMagslist(file_name, 142, 0)
+
+    try:
+        results['grid/parse'] = result(best_time(parse, repeat))
+        results['grid/cache'] = result(best_time(cached, repeat))
+        results['grid/memory'] = result(best_time(lambda: converter.readMagslist(file_name, 142, 0), repeat))
+    finally:
+        if old_cache_path is None:
+            os.environ.pop('MAGNITUDE_GRID_CACHE_PATH', None)
+        else:
+            os.environ['MAGNITUDE_GRID_CACHE_PATH'] = old_cache_path
+        for cache_dir in cache_dirs:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        jwst_magnitude_converter.gridStore.clear()
+    return results
+
+
+def fitted_converter(nfilters):
+    """
+Return a magConGUI object with the Kurucz grid read in and the
+transformations to the target filters of nfilters fitted, and the arguments
+of fit1 used.
+    """
+    converter = jwst_magnitude_converter.magConGUI()
+    converter.fitCacheFile = 'none'
+    converter.kuruczMagValues, converter.kuruczModelMagLabels, converter.kuruczFilterPars = \
+        converter.readMagslist(os.path.join(jwst_magnitude_converter.path, grid_name), 142, 0)
+    mopt1, mopt2, mopt3, mopt4 = converter.matchFilter(0, input_filters[0], input_filters[1],
+                                                       input_filters[0], input_filters[1])
+    targets = converter.matchTargets(0, target_sets[nfilters])
+    arguments = (2, 0, 0, 4, mopt1, mopt2, targets[0], targets[-1], False, targets, False)
+    with contextlib.redirect_stdout(io.StringIO()):
+        converter.fit1(*arguments)
+    return converter, arguments
+
+
+def time_fits(repeat):
+    """
+Time magConGUI.fit1 for 1, 2, and 59 target filters.
+    """
+    results = {}
+    for nfilters in sorted(target_sets):
+        converter, arguments = fitted_converter(nfilters)
+        results['fit/%d' % (nfilters)] = result(best_time(lambda: converter.fit1(*arguments), repeat))
+    return results
+
+
+def time_catalog(name, file_name, nfilters_list, chunk_size, repeat, work_dir):
+    """
+Time the reading of a catalogue and the evaluation and writing of the
+transformations of it to each of the target filter sets, chunk_size rows at a
+time.
+    """
+    results = {}
+    nrows = [0]
+
+    def read():
+        nrows[0] = 0
+        for chunk in catalog_io.read_chunks(file_name, 2, 3, 0, 1, chunk_size):
+            nrows[0] = nrows[0]+len(chunk[0])
+
+    times = best_time(read, repeat)
+    results['read/text/%s' % (name)] = result(times, nrows[0])
+    for nfilters in nfilters_list:
+        converter, arguments = fitted_converter(nfilters)
+        times = {}
+        for key in ['legendre', 'lut', 'text', 'fits']:
+            times[key] = [0.]*repeat
+        for chunk in catalog_io.read_chunks(file_name, 2, 3, 0, 1, chunk_size):
+            converter.xdata[0], converter.ydata[0], converter.xlabel[0], converter.ylabel[0] = \
+                converter.makexy(0, 0, 0, input_filters[0], input_filters[1], chunk[0], chunk[1])
+            converter.ravalues = chunk[2]
+            converter.decvalues = chunk[3]
+            for engine in ['lut', 'legendre']:
+                converter.engine = engine
+                chunk_times = best_time(lambda: converter.applyFits(converter.jwstColumns, 0), repeat)
+                times[engine] = [times[engine][n]+chunk_times[n] for n in range(repeat)]
+            for output_format in ['text', 'fits']:
+                converter.outputFormat = output_format
+                output_name = os.path.join(work_dir, 'benchmark_output.'+output_format)
+                chunk_times = best_time(lambda: converter.writeMags(output_name), repeat)
+                times[output_format] = [times[output_format][n]+chunk_times[n] for n in range(repeat)]
+                os.remove(output_name)
+        for engine in ['legendre', 'lut']:
+            results['evaluate/%s/%d/%s' % (engine, nfilters, name)] = result(times[engine], nrows[0])
+        for output_format in ['text', 'fits']:
+            results['write/%s/%d/%s' % (output_format, nfilters, name)] = result(times[output_format], nrows[0])
+    return results
+
+
+def metadata(args):
+    """
+Return a description of the machine, the software, and the benchmark
+options, for the result file.
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=code_dir, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'numpy': numpy.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'sizes': args.sizes,
+            'targets': args.targets,
+            'chunk': args.chunk,
+            'repeat': args.repeat}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the stages of the magnitude conversion.')
+    parser.add_argument('--sizes', type=int, nargs='*', default=[1000, 10000, 100000, 1000000],
+                        help='the numbers of rows of the synthetic catalogues')
+    parser.add_argument('--targets', type=int, nargs='+', default=[2], choices=sorted(target_sets),
+                        help='the numbers of target filters for the evaluation and writing times')
+    parser.add_argument('--chunk', type=int, default=1000000, help='the number of rows converted at a time')
+    parser.add_argument('--repeat', type=int, default=3, help='the number of runs of each measurement')
+    parser.add_argument('--work-dir', default=None,
+                        help='the directory for the synthetic catalogues (by default a temporary one)')
+    parser.add_argument('--output', default='benchmark_results.json', help='the JSON result file')
+    args = parser.parse_args()
+    # a temporary directory is removed at the end, one given with --work-dir
+    # is kept (with its catalogues for the next run)
+    work_dir = args.work_dir
+    if work_dir is None:
+        work_dir = tempfile.mkdtemp()
+    elif not os.path.isdir(work_dir):
+        os.makedirs(work_dir)
+
+    try:
+        results = {}
+        results.update(time_grid(args.repeat, work_dir))
+        results.update(time_fits(args.repeat))
+        catalogs = [('m31', sample_catalog)]
+        converter, arguments = fitted_converter(1)
+        for size in args.sizes:
+            file_name = os.path.join(work_dir, 'benchmark_catalog_%d.txt' % (size))
+            if not os.path.exists(file_name):
+                make_catalog(file_name, size, converter.kuruczMagValues,
+                             [x.strip() for x in converter.kuruczModelMagLabels])
+            catalogs.append(('%d' % (size), file_name))
+        for name, file_name in catalogs:
+            results.update(time_catalog(name, file_name, args.targets, args.chunk, args.repeat, work_dir))
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    for key in results:
+        line = '%-32s %10.4f s' % (key, results[key]['seconds'])
+        if 'rows_per_second' in results[key]:
+            line = line+'   %12.0f rows/s' % (results[key]['rows_per_second'])
+        print(line)
+    with open(args.output, 'w') as outfile:
+        json.dump({'metadata': metadata(args), 'results': results}, outfile, indent=1)
+    print('Results written to %s.' % (args.output))
+
+
+if __name__ == "__main__":
+    main()
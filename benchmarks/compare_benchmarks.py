@@ -0,0 +1,113 @@
+#! /usr/bin/env python
+#
+"""
+This script compares two result files of benchmarks/benchmark_suite.py, such
+as one from the current version of the code and one from a change to it, and
+reports the measurements that have become slower.
+
+Use
+
+    python benchmarks/compare_benchmarks.py old.json new.json [--threshold 0.1]
+                                            [--min-seconds 0.001]
+
+For each measurement in both files the best times are compared.  A
+measurement is a regression if the new time is more than threshold (as a
+fraction) slower than the old one; measurements whose times are both below
+min-seconds are too short to compare and are only listed.  The exit status is
+1 if there are any regressions, so the script can be used in automatic tests.
+"""
+import argparse
+import json
+import sys
+
+
+def read_results(file_name):
+    """
+This routine reads a result file, returning the metadata and the results
+dictionaries.
+    """
+    with open(file_name) as infile:
+        values = json.load(infile)
+    return values['metadata'], values['results']
+
+
+def compare(old_results, new_results, threshold, min_seconds):
+    """
+This routine compares two sets of results.
+
+Parameters:
+
+    old_results, new_results  :  dictionaries
+
+        The results from the two files, by measurement name.
+
+    threshold  :  float
+
+        The fractional slow-down counted as a regression.
+
+    min_seconds  :  float
+
+        Measurements with both times below this are not judged.
+
+Returns:
+
+    rows  :  list of tuples
+
+        For each measurement in both sets, the name, the old and new times,
+        the ratio of the new to the old time, and the status, one of
+        'slower', 'faster', 'same', or 'short'.
+
+    """
+    rows = []
+    for name in old_results:
+        if name not in new_results:
+            continue
+        old_time = old_results[name]['seconds']
+        new_time = new_results[name]['seconds']
+        ratio = new_time/max(old_time, 1.e-12)
+        if old_time < min_seconds and new_time < min_seconds:
+            status = 'short'
+        elif ratio > 1.+threshold:
+            status = 'slower'
+        elif ratio < 1./(1.+threshold):
+            status = 'faster'
+        else:
+            status = 'same'
+        rows.append((name, old_time, new_time, ratio, status))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files.')
+    parser.add_argument('old', help='the reference result file')
+    parser.add_argument('new', help='the result file to check')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='the fractional slow-down counted as a regression')
+    parser.add_argument('--min-seconds', type=float, default=0.001,
+                        help='the time below which measurements are not compared')
+    args = parser.parse_args()
+
+    old_metadata, old_results = read_results(args.old)
+    new_metadata, new_results = read_results(args.new)
+    for key in ['commit', 'date', 'platform', 'cpu_count', 'numpy']:
+        print('%-10s %-40s %s' % (key, old_metadata.get(key, ''), new_metadata.get(key, '')))
+    if old_metadata.get('platform') != new_metadata.get('platform') or \
+       old_metadata.get('cpu_count') != new_metadata.get('cpu_count'):
+        print('Warning: the results are from different machines.')
+    print('')
+    rows = compare(old_results, new_results, args.threshold, args.min_seconds)
+    print('%-32s %12s %12s %8s' % ('measurement', 'old s', 'new s', 'new/old'))
+    for name, old_time, new_time, ratio, status in rows:
+        print('%-32s %12.4f %12.4f %8.2f  %s' % (name, old_time, new_time, ratio, status))
+    for name in sorted(set(old_results) ^ set(new_results)):
+        print('%-32s only in %s' % (name, args.old if name in old_results else args.new))
+    regressions = [row for row in rows if row[4] == 'slower']
+    print('')
+    print('%d measurements compared: %d slower, %d faster.' %
+          (len(rows), len(regressions), len([row for row in rows if row[4] == 'faster'])))
+    if len(regressions) > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,645 @@
+#! /usr/bin/env python
+#
+"""
+This module holds the catalogue input and output routines used by
+jwst_magnitude_converter.py when converting catalogues non-interactively.
+
+Ascii tables are read in a single pass that splits each line once and
+extracts all the needed columns (the two magnitudes and the optional RA and
+Dec) together, with the comment style detected from the table header.
+
+Catalogues can also be read in fixed-size chunks of rows, so that a conversion of a
+catalogue that is larger than the available memory can convert and write out
+each chunk before the next one is read.  Both ascii tables (with #, \\, or |
+comment lines, as for IPAC tables) and FITS binary tables are supported.
+FITS tables are memory-mapped, and only the needed columns of the rows being
+converted are copied out of them.  They can also be read over a range of rows.
+The uncertainties of the two magnitudes can optionally be read as well.
+
+The converted magnitudes are written out in blocks of rows.  The fixed point
+numbers are formatted with numpy array operations directly into a character
+buffer instead of one Python string format operation per value, giving the
+same text as the %10.5f format would.  Alternatively the results can be
+written as a FITS binary table, again a block of rows at a time, with the
+converted magnitudes as single precision columns.
+"""
+import itertools
+import numpy
+
+# The characters that mark comment lines in the input ascii tables.
+comment_characters = ['#','\\','|']
+
+
+def detect_comment_characters(input_file_name,max_lines=10000):
+    """
+This routine looks at the header of an ascii table to decide which comment
+characters it uses.  If any of the lines before the first data line start
+with \\ or | (as in IPAC tables) all of #, \\, and | are used, otherwise just #.
+
+Parameters:
+
+    input_file_name  :  string
+
+        The name of the ascii table file.
+
+    max_lines  :  integer
+
+        The maximum number of header lines looked at.
+
+Returns:
+
+    comments  :  list of strings
+
+        The comment characters to use.
+
+    first_line  :  string or None
+
+        The first data line of the file, or None if none was found.
+
+    """
+    comments = ['#']
+    with open(input_file_name,'r') as infile:
+        for line in itertools.islice(infile,max_lines):
+            if line[0:1] in comment_characters:
+                if line[0:1] != '#':
+                    comments = comment_characters
+            elif len(line.split()) > 0:
+                return comments,line
+    return comments,None
+
+
+def _string_width(first_line,indexes):
+    """
+Estimate a width for the RA/Dec string fields from the first data line, with
+room to spare for longer values further down the file.
+    """
+    width = 16
+    if first_line is not None:
+        words = first_line.split()
+        for n in indexes:
+            if n < len(words):
+                width = max(width,2*len(words[n]))
+    return width
+
+
+def read_text_columns(source,xindex,yindex,raindex,decindex,comments,string_width=32,dtype=None,
+                      error_indexes=None):
+    """
+This routine reads the two magnitude columns and the optional RA and Dec
+columns of an ascii table in a single pass, each line being split only once.
+
+Parameters:
+
+    source  :  string or list of strings
+
+        The name of the ascii table file, or a list of its lines.
+
+    xindex, yindex  :  integers
+
+        The 0-based column numbers of the two magnitude (or colour) values.
+
+    raindex, decindex  :  integers
+
+        The 0-based column numbers of the RA and Dec values, or negative values
+        if these are not to be read.
+
+    comments  :  list of strings
+
+        The comment characters, as from detect_comment_characters.
+
+    string_width  :  integer
+
+        The maximum length of the RA and Dec strings.  If any value fills the
+        whole width the table is read again with a larger width.
+
+    dtype  :  numpy dtype or None
+
+        The type of the magnitude values, float64 if None.  With float32 the
+        values are converted as they are read, taking half the memory.
+
+    error_indexes  :  tuple of two integers or None
+
+        The 0-based column numbers of the uncertainties of the two magnitude
+        values (a negative number for a value without one), or None if there
+        are no uncertainties to read.
+
+Returns:
+
+    indata1, indata2  :  numpy float arrays
+
+        The values of the two magnitude columns.
+
+    ravalues, decvalues  :  numpy string arrays or None
+
+        The RA and Dec values as they are written in the table, or None if
+        they were not asked for.
+
+    errors1, errors2  :  numpy float arrays or None
+
+        Only returned if error_indexes is given: the uncertainties of the two
+        magnitude columns, or None for one without an error column.
+
+Errors in reading the table raise a ValueError.
+
+    """
+    if dtype is None:
+        dtype = numpy.float64
+    columns = [xindex,yindex]
+    fields = [('mag1',dtype),('mag2',dtype)]
+    if raindex >= 0 and decindex >= 0:
+        columns = columns+[raindex,decindex]
+        fields = fields+[('ra','U%d' % string_width),('dec','U%d' % string_width)]
+    if error_indexes is not None:
+        for n in range(2):
+            if error_indexes[n] >= 0:
+                columns.append(error_indexes[n])
+                fields.append(('error%d' % (n+1),dtype))
+    values = numpy.loadtxt(source,usecols=columns,dtype=fields,comments=comments,ndmin=1)
+    if raindex >= 0 and decindex >= 0:
+        if len(values) > 0 and max(numpy.max(numpy.char.str_len(values['ra'])),
+                                   numpy.max(numpy.char.str_len(values['dec']))) >= string_width:
+            return read_text_columns(source,xindex,yindex,raindex,decindex,comments,4*string_width,dtype,
+                                     error_indexes)
+        result = (values['mag1'],values['mag2'],values['ra'],values['dec'])
+    else:
+        result = (values['mag1'],values['mag2'],None,None)
+    if error_indexes is None:
+        return result
+    names = values.dtype.names
+    return result+tuple(values[x] if x in names else None for x in ['error1','error2'])
+
+
+def read_text_catalog(input_file_name,xindex,yindex,raindex,decindex,dtype=None,error_indexes=None):
+    """
+This routine reads the columns needed for a conversion from an ascii table.
+The comment characters are detected from the header of the table; if the
+table cannot be read with them it is read again with all of #, \\, and | as
+comment characters.  See read_text_columns for the parameters and the
+returned values.
+    """
+    comments,first_line = detect_comment_characters(input_file_name)
+    width = _string_width(first_line,[raindex,decindex])
+    try:
+        return read_text_columns(input_file_name,xindex,yindex,raindex,decindex,comments,width,dtype,
+                                 error_indexes)
+    except ValueError:
+        if comments == comment_characters:
+            raise
+        return read_text_columns(input_file_name,xindex,yindex,raindex,decindex,comment_characters,width,dtype,
+                                 error_indexes)
+
+
+def read_text_chunks(input_file_name,xindex,yindex,raindex,decindex,chunk_size,dtype=None,error_indexes=None):
+    """
+This is a generator that reads an ascii table in chunks of lines.
+
+Parameters:
+
+    input_file_name  :  string
+
+        The name of the ascii table file.
+
+    xindex, yindex  :  integers
+
+        The 0-based column numbers of the two magnitude (or colour) values.
+
+    raindex, decindex  :  integers
+
+        The 0-based column numbers of the RA and Dec values, or negative values
+        if these are not to be read.
+
+    chunk_size  :  integer
+
+        The number of lines of the file read at a time.
+
+    dtype  :  numpy dtype
+
+        The type of the magnitude values, as for read_text_columns.
+
+    error_indexes  :  tuple of two integers or None
+
+        The columns of the uncertainties, as for read_text_columns.
+
+Yields:
+
+    (indata1, indata2, ravalues, decvalues)  :  tuple
+
+        The two columns as numpy float arrays, and the RA and Dec values as
+        numpy string arrays (or None) for the data lines of the chunk, as from
+        read_text_columns (followed by the two uncertainty columns if
+        error_indexes is given).  Chunks holding only comment lines are
+        skipped.
+
+    """
+    comments,first_line = detect_comment_characters(input_file_name)
+    width = _string_width(first_line,[raindex,decindex])
+    with open(input_file_name,'r') as infile:
+        while True:
+            lines = list(itertools.islice(infile,chunk_size))
+            if len(lines) == 0:
+                break
+            if all(line[0:1] in comment_characters or len(line.split()) == 0 for line in lines):
+                continue
+            try:
+                yield read_text_columns(lines,xindex,yindex,raindex,decindex,comments,width,dtype,error_indexes)
+            except ValueError:
+                if comments == comment_characters:
+                    raise
+                yield read_text_columns(lines,xindex,yindex,raindex,decindex,comment_characters,width,dtype,
+                                        error_indexes)
+
+
+def _native_column(column,dtype=None):
+    """
+Return a copy of a FITS table column in the native byte order, keeping its
+data type (or in the type dtype if given), so that it no longer refers to the
+memory-mapped file.
+    """
+    column = numpy.asarray(column)
+    if dtype is None:
+        return column.astype(column.dtype.newbyteorder('='))
+    return column.astype(dtype)
+
+
+def read_fits_columns(data,xindex,yindex,raindex,decindex,start,end,dtype=None,error_indexes=None):
+    """
+This routine copies rows start to end-1 of the magnitude columns and the
+optional RA and Dec columns out of a (memory-mapped) FITS table.  Only these
+columns are converted; the other columns of the table are not touched.
+
+The values returned are the same as for read_text_columns, except that RA and
+Dec are given in the type of the table columns.  If dtype is given the
+magnitudes (and their uncertainties) are converted to it in the same step as
+the copy.
+    """
+    indata1 = _native_column(data.field(xindex)[start:end],dtype)
+    indata2 = _native_column(data.field(yindex)[start:end],dtype)
+    if raindex >= 0 and decindex >= 0:
+        ravalues = _native_column(data.field(raindex)[start:end])
+        decvalues = _native_column(data.field(decindex)[start:end])
+    else:
+        ravalues = None
+        decvalues = None
+    if error_indexes is None:
+        return indata1,indata2,ravalues,decvalues
+    errors = [_native_column(data.field(x)[start:end],dtype) if x >= 0 else None for x in error_indexes]
+    return indata1,indata2,ravalues,decvalues,errors[0],errors[1]
+
+
+def _row_limits(nrows,row_range):
+    """
+Return the first row and the end row of a row range (first, end), where None
+stands for the start or end of the table.
+    """
+    if row_range is None:
+        return 0,nrows
+    first,end = row_range
+    if first is None:
+        first = 0
+    if end is None or end > nrows:
+        end = nrows
+    return max(first,0),end
+
+
+def read_fits_catalog(input_file_name,xindex,yindex,raindex,decindex,row_range=None,dtype=None,
+                      error_indexes=None):
+    """
+This routine reads the magnitude and the optional RA and Dec columns of the
+first table extension of a FITS file.  The file is memory-mapped and only the
+needed columns of the rows asked for are copied, and the file is closed
+before returning.
+
+Parameters:
+
+    input_file_name  :  string
+
+        The FITS file name.
+
+    xindex, yindex, raindex, decindex  :  integers
+
+        The (zero-based) numbers of the two magnitude columns and of the RA
+        and Dec columns; RA and Dec are only read if both are >= 0.
+
+    row_range  :  tuple of two integers or None
+
+        The (zero-based) first row to read and the row after the last one
+        to read, or None to read the whole table.
+
+    dtype  :  numpy dtype or None
+
+        The type of the magnitude values, or None to keep the type of the
+        table columns.
+
+    error_indexes  :  tuple of two integers or None
+
+        The columns of the uncertainties of the two magnitudes, as for
+        read_text_columns.
+
+Returns:
+
+    The same values as read_text_catalog, except that RA and Dec are given in
+    the type of the table columns.
+
+    """
+    import astropy.io.fits as fits
+    with fits.open(input_file_name,memmap=True) as hdulist:
+        data1 = hdulist[1].data
+        first,end = _row_limits(len(data1),row_range)
+        return read_fits_columns(data1,xindex,yindex,raindex,decindex,first,end,dtype,error_indexes)
+
+
+def read_fits_chunks(input_file_name,xindex,yindex,raindex,decindex,chunk_size,row_range=None,dtype=None,
+                     error_indexes=None):
+    """
+This is a generator that reads the first table extension of a FITS file in
+chunks of rows.  The file is memory-mapped, so only the rows of the current
+chunk are read from the disk, and only the needed columns of them are copied.
+
+The parameters and the values yielded are the same as for read_text_chunks,
+except that RA and Dec are given in the type of the table columns.  The
+optional row_range limits the rows read as for read_fits_catalog.
+    """
+    import astropy.io.fits as fits
+    with fits.open(input_file_name,memmap=True) as hdulist:
+        data1 = hdulist[1].data
+        first,last = _row_limits(len(data1),row_range)
+        for start in range(first,last,chunk_size):
+            end = min(start+chunk_size,last)
+            yield read_fits_columns(data1,xindex,yindex,raindex,decindex,start,end,dtype,error_indexes)
+
+
+def read_chunks(input_file_name,xindex,yindex,raindex,decindex,chunk_size,row_range=None,dtype=None,
+                error_indexes=None):
+    """
+This is a generator that reads a catalogue in chunks, using read_fits_chunks
+for file names ending in .fits and read_text_chunks otherwise.  See
+read_text_chunks for the parameters; row_range is only used for FITS files.
+    """
+    if '.fits' in input_file_name[-5:]:
+        return read_fits_chunks(input_file_name,xindex,yindex,raindex,decindex,chunk_size,row_range,dtype,
+                                error_indexes)
+    return read_text_chunks(input_file_name,xindex,yindex,raindex,decindex,chunk_size,dtype,error_indexes)
+
+
+# The number of output rows formatted and written at a time.
+OUTPUT_BLOCK_SIZE = 65536
+
+
+_digit_tables = {}
+
+
+def _fixed_tables(width,precision):
+    """
+Return (and keep for later calls) the tables of the characters of the
+fraction part and of the signed integer part of a fixed point number.
+    """
+    key = (width,precision)
+    if key not in _digit_tables:
+        integer_width = width-precision-1
+        fraction = numpy.arange(10**precision)
+        fraction_table = numpy.empty((10**precision,precision),dtype=numpy.uint8)
+        for k in range(precision):
+            fraction_table[:,precision-1-k] = ord('0')+(fraction // 10**k) % 10
+        integer_table = numpy.array([[ord(c) for c in ('%*s' % (integer_width,sign+str(n)))[-integer_width:]]
+                                     for sign in ['','-'] for n in range(10**integer_width)],dtype=numpy.uint8)
+        _digit_tables[key] = (fraction_table,integer_table)
+    return _digit_tables[key]
+
+
+def format_fixed(values,width=10,precision=5):
+    """
+This routine formats an array of numbers as fixed point text, giving the same
+characters as the C/Python format %<width>.<precision>f for each value.  The
+digits are looked up in tables with numpy array operations.  Values that do
+not fit in the field width, that are not finite, or that lie so close to a
+rounding boundary that the array calculation might round them differently
+from the C library are flagged so that they can be formatted individually.
+
+Parameters:
+
+    values  :  numpy float array
+
+        An N x M array of values.
+
+    width  :  integer
+
+        The field width.
+
+    precision  :  integer
+
+        The number of digits after the decimal point.
+
+Returns:
+
+    characters  :  numpy uint8 array
+
+        An N x M x width array of the ASCII codes of the formatted values.
+
+    bad  :  numpy boolean array
+
+        An N x M array that is True for the values that were not formatted.
+
+    """
+    fraction_table,integer_table = _fixed_tables(width,precision)
+    integer_limit = 10**(width-precision-1)
+    values = numpy.asarray(values,dtype=numpy.float64)
+    with numpy.errstate(invalid='ignore',over='ignore'):
+        scaled = numpy.abs(values)*(10.**precision)
+        bad = ~(scaled < integer_limit*10.**precision)
+        bad |= numpy.abs(scaled-numpy.floor(scaled)-0.5) < 1.e-7+scaled*1.e-14
+        rounded = numpy.rint(scaled)
+        rounded[bad] = 0.
+    integer_part,fraction_part = numpy.divmod(rounded.astype(numpy.int64),10**precision)
+    negative = numpy.signbit(values)
+    # values may round up past the field width, and a negative value needs a
+    # position for the sign
+    bad |= (integer_part >= integer_limit) | (negative & (integer_part >= integer_limit // 10))
+    integer_part[bad] = 0
+    integer_part += negative*integer_limit
+    characters = numpy.empty(values.shape+(width,),dtype=numpy.uint8)
+    characters[...,0:width-precision-1] = integer_table[integer_part]
+    characters[...,width-precision-1] = ord('.')
+    characters[...,width-precision:] = fraction_table[fraction_part]
+    return characters,bad
+
+
+def write_rows(outfile,columns,ravalues=None,decvalues=None,block_size=OUTPUT_BLOCK_SIZE):
+    """
+This routine writes the converted catalogue rows to an open text file in
+blocks.  Each line has every value of the columns in the format %10.5f
+followed by a space, then the RA and Dec values (as strings) if they are
+given.
+
+Parameters:
+
+    outfile  :  file object
+
+        The open output text file.
+
+    columns  :  list of numpy float arrays
+
+        The values to write, each either a one-dimensional array of length N
+        or an N x K array of K columns.
+
+    ravalues, decvalues  :  numpy arrays or lists, or None
+
+        The RA and Dec values of the N rows.
+
+    block_size  :  integer
+
+        The number of lines formatted and written at a time.
+
+    """
+    columns = [numpy.asarray(column) for column in columns]
+    npoints = len(columns[0])
+    ncolumns = sum(1 if column.ndim == 1 else column.shape[1] for column in columns)
+    line_format = '%10.5f '*ncolumns
+    for start in range(0,npoints,block_size):
+        end = min(start+block_size,npoints)
+        values = numpy.empty((end-start,ncolumns),dtype=numpy.float64)
+        n = 0
+        for column in columns:
+            if column.ndim == 1:
+                values[:,n] = column[start:end]
+                n = n+1
+            else:
+                values[:,n:n+column.shape[1]] = column[start:end]
+                n = n+column.shape[1]
+        characters,bad = format_fixed(values)
+        buffer = numpy.empty((end-start,ncolumns*11+1),dtype=numpy.uint8)
+        buffer[:,0:ncolumns*11].reshape(end-start,ncolumns,11)[:,:,0:10] = characters
+        buffer[:,10:ncolumns*11:11] = ord(' ')
+        buffer[:,-1] = ord('\n')
+        text = buffer.tobytes().decode('ascii')
+        bad_rows = numpy.nonzero(numpy.any(bad,axis=1))[0]
+        if len(bad_rows) == 0 and ravalues is None:
+            outfile.write(text)
+            continue
+        lines = text.split('\n')[0:-1]
+        for m in bad_rows:
+            lines[m] = line_format % tuple(values[m,:])
+        if ravalues is None:
+            outfile.write('\n'.join(lines)+'\n')
+        else:
+            rows = numpy.empty((end-start,3),dtype=object)
+            rows[:,0] = lines
+            rows[:,1] = numpy.asarray(ravalues[start:end]).astype(str)
+            rows[:,2] = numpy.asarray(decvalues[start:end]).astype(str)
+            outfile.write(('%s%s %s\n'*(end-start)) % tuple(rows.ravel().tolist()))
+
+
+def fits_column_name(label):
+    """
+Return a FITS column name for an output column label, such as
+HST_ACS_F814W_minus_HST_WFC3_F160W for "HST ACS F814W - HST WFC3 F160W".
+    """
+    name = label.strip().replace(' - ','_minus_')
+    name = ''.join([c if c.isalnum() else '_' for c in name])
+    while '__' in name:
+        name = name.replace('__','_')
+    return name.strip('_')
+
+
+def _fits_format(dtype):
+    """
+Return the FITS binary table format and the big-endian numpy type used to
+write values of a numpy type.
+    """
+    dtype = numpy.dtype(dtype)
+    if dtype.kind in 'US':
+        width = max(dtype.itemsize // (4 if dtype.kind == 'U' else 1),32)
+        return '%dA' % (width),numpy.dtype('S%d' % (width))
+    if dtype.kind in 'iu':
+        return 'K',numpy.dtype('>i8')
+    if dtype == numpy.float32:
+        return 'E',numpy.dtype('>f4')
+    return 'D',numpy.dtype('>f8')
+
+
+class FitsTableWriter():
+    """
+This class writes a FITS binary table one block of rows at a time, so that a
+catalogue converted in chunks can be written out without holding all of it.
+The table header is written first and the number of rows in it is filled in
+when the writer is closed.
+    """
+    def __init__(self,output_file_name,labels,dtypes,units=None,keywords=None):
+        """
+Open the output file and write the headers.
+
+Parameters:
+
+    output_file_name  :  string
+
+        The name of the FITS file to write.
+
+    labels  :  list of strings
+
+        The labels of the columns, which are made into FITS column names by
+        fits_column_name and are also kept in the TCOMMn keywords.
+
+    dtypes  :  list of numpy types
+
+        The type of each column.  Float32 values are written as E columns,
+        other floats as D columns, and strings as A columns of at least 32
+        characters.
+
+    units  :  list of strings or None
+
+        The unit of each column (None for no unit), or None for no units.
+
+    keywords  :  dictionary or None
+
+        Keyword values to add to the table header.
+        """
+        import astropy.io.fits as fits
+        formats = [_fits_format(dtype) for dtype in dtypes]
+        if units is None:
+            units = [None]*len(labels)
+        fits_columns = [fits.Column(name=fits_column_name(labels[n]),format=formats[n][0],unit=units[n])
+                        for n in range(len(labels))]
+        hdu = fits.BinTableHDU.from_columns(fits_columns,nrows=0)
+        for n in range(len(labels)):
+            hdu.header['TCOMM%d' % (n+1)] = labels[n].strip()
+        if keywords is not None:
+            for key in keywords:
+                hdu.header[key] = keywords[key]
+        self.header = hdu.header
+        self.row_dtype = numpy.dtype([(fits_columns[n].name,formats[n][1]) for n in range(len(labels))])
+        self.nrows = 0
+        self.outfile = open(output_file_name,'wb')
+        self.outfile.write(fits.PrimaryHDU().header.tostring().encode('ascii'))
+        self.header_position = self.outfile.tell()
+        self.outfile.write(self.header.tostring().encode('ascii'))
+
+    def write(self,columns):
+        """
+Write a block of rows given as a list of column arrays, in the order of the
+labels.
+        """
+        nrows = len(columns[0])
+        rows = numpy.empty(nrows,dtype=self.row_dtype)
+        for n in range(len(columns)):
+            field = self.row_dtype.names[n]
+            if self.row_dtype[n].kind == 'S':
+                values = numpy.asarray(columns[n]).astype(str)
+                if len(values) > 0 and numpy.max(numpy.char.str_len(values)) > self.row_dtype[n].itemsize:
+                    raise ValueError('The %s values are too long for the FITS column.' % (field))
+                rows[field] = numpy.char.encode(values,'ascii')
+            else:
+                rows[field] = columns[n]
+        self.outfile.write(rows.tobytes())
+        self.nrows = self.nrows+nrows
+
+    def close(self):
+        """
+Pad the table data to a whole number of FITS blocks, fill in the number of
+rows, and close the file.
+        """
+        data_size = self.nrows*self.row_dtype.itemsize
+        if data_size % 2880 != 0:
+            self.outfile.write(b'\0'*(2880-data_size % 2880))
+        self.header['NAXIS2'] = self.nrows
+        self.outfile.seek(self.header_position)
+        self.outfile.write(self.header.tostring().encode('ascii'))
+        self.outfile.close()
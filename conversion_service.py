@@ -0,0 +1,727 @@
+#! /usr/bin/env python
+#
+"""
+This module runs the magnitude conversions of jwst_magnitude_converter.py as a
+long-running local service, for pipelines that ask for many conversions and
+should not pay each time for starting python, reading the model grids, and
+doing the fits.  It is started with
+
+    python jwst_magnitude_converter.py --serve 8765
+    python jwst_magnitude_converter.py --serve 127.0.0.1:8765
+    python jwst_magnitude_converter.py --serve unix:/tmp/magnitudes.sock
+
+and takes HTTP requests on the localhost port or the Unix socket.  There is
+no authentication, so the service only listens on the loopback interface,
+and the files of the catalogue conversions (the cfg, catalogue, output, fit
+cache, and plot files) must be in the working directory of the service: the
+directory given with --workdir, or otherwise the current directory when the
+service starts.  Relative file names are taken from that directory.
+All the model grids found are read when the service starts and are kept in
+memory, as are the fits once done (and in the fit cache, see fit_cache.py).
+
+The requests are
+
+    POST /convert   convert arrays of magnitudes.  The body is a JSON object
+                    with the two input columns mag1 and mag2 (lists of
+                    numbers), filter1, filter2, jwstfilters (a name or a list,
+                    as in the cfg files), and optionally column1type and
+                    column2type ("magnitude" or "colour"), yvalue (1 or 2),
+                    modelset ("Kurucz"), fitorder (4), engine ("legendre" or
+                    "lut"), systematics (false), selection (the grid rows
+                    to fit, as in the cfg files), and format ("text" or
+                    "json").  With the text format the rows are sent back as
+                    they are formatted, in the layout of the output files
+                    (colour, magnitude, the JWST magnitudes, and the
+                    systematic uncertainties if asked for); with the json
+                    format an object with filters, magnitudes, and
+                    systematics is sent.
+
+    POST /catalog   convert a catalogue file, as a non-interactive run of
+                    jwst_magnitude_converter.py.  The body is a JSON object
+                    with the cfg file parameters: cfgfile (the name of a cfg
+                    file to start from) and/or the sections
+                    Input_Magnitude_Parameters and Output_Filter_Values,
+                    whose values are put over those of the cfg file.  If
+                    outfilename is given the output is written to it and a
+                    JSON object with the status, the run time, and the text
+                    printed by the conversion is sent back; otherwise the
+                    output file is sent back as it is read.  The output is
+                    written to a temporary file that replaces outfilename
+                    only if the conversion is done, so a failed conversion
+                    leaves an existing file as it was.  A file name outside
+                    the working directory is refused.
+
+    GET /stats      a JSON object with the number of requests, the request
+                    latencies (count, failures, mean, largest, and the median
+                    and 95th percentile of the last LATENCY_HISTORY requests)
+                    for each request type, the fits taken from memory, taken
+                    from the fit cache, or made, the fit cache hits and
+                    misses, and the model grids in memory.
+
+    GET /health     "ok" while the service is running.
+
+A request that cannot be done is answered with an HTTP error status and a
+JSON object with the error message.  The requests are handled in separate
+threads, but the conversions themselves are done one at a time, as the fit
+caches are shared; the sending of the results is not held up by this.  The
+text printed by each catalogue conversion is kept apart from that of the
+others and of the service.  The request routine here is a small
+client for the service, for either kind of address.
+"""
+import collections
+import http.client
+import http.server
+import json
+import os
+import shutil
+import signal
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+
+import numpy
+from configobj import ConfigObj
+
+import catalog_io
+import jwst_magnitude_converter
+import magnitude_converter
+
+# The number of recent requests of each type kept for the latency percentiles.
+LATENCY_HISTORY = 1000
+
+# The number of bytes of output collected before they are sent as one chunk.
+SEND_BUFFER_SIZE = 65536
+
+# The host names accepted for the service address.
+local_hosts = ['localhost', '127.0.0.1', '::1']
+
+
+def parse_address(address):
+    """
+This routine takes the service address apart.
+
+Parameters:
+
+    address  :  string
+
+        Either "unix:" followed by the name of the socket file, or a port
+        number, or host:port where the host is a loopback address.
+
+Returns:
+
+    family  :  string
+
+        'unix' or 'tcp'.
+
+    location  :  string or tuple
+
+        The socket file name, or the host and port.
+
+    """
+    address = str(address)
+    if address.startswith('unix:'):
+        return 'unix', address[5:]
+    host = '127.0.0.1'
+    port = address
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        host = host.strip('[]')
+    if host not in local_hosts and not host.startswith('127.'):
+        raise ValueError('The service can only listen on the local host, not %s.' % (host))
+    return 'tcp', (host, int(port))
+
+
+class ServiceStatistics():
+    """
+This class keeps the request counts and latencies of the service.
+    """
+    def __init__(self):
+        self.start_time = time.time()
+        self.requests = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, succeeded):
+        """
+Add a request of type name that took seconds to answer.
+        """
+        with self._lock:
+            if name not in self.requests:
+                self.requests[name] = {'count': 0, 'failed': 0, 'total': 0., 'max': 0.,
+                                       'recent': collections.deque(maxlen=LATENCY_HISTORY)}
+            record = self.requests[name]
+            record['count'] = record['count']+1
+            if not succeeded:
+                record['failed'] = record['failed']+1
+            record['total'] = record['total']+seconds
+            record['max'] = max(record['max'], seconds)
+            record['recent'].append(seconds)
+
+    def report(self):
+        """
+Return the request counts and latencies (in seconds) as a dictionary.
+        """
+        values = {}
+        with self._lock:
+            for name in sorted(self.requests):
+                record = self.requests[name]
+                recent = numpy.array(record['recent'])
+                values[name] = {'count': record['count'], 'failed': record['failed'],
+                                'mean': record['total']/record['count'], 'max': record['max'],
+                                'p50': float(numpy.percentile(recent, 50)),
+                                'p95': float(numpy.percentile(recent, 95))}
+        return {'uptime': time.time()-self.start_time, 'requests': values}
+
+
+class ChunkedWriter():
+    """
+This class is a text file object for catalog_io.write_rows and the like that
+sends what is written to it as the chunks of an HTTP response with chunked
+transfer encoding, SEND_BUFFER_SIZE bytes at a time.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self._parts = []
+        self._size = 0
+
+    def write(self, text):
+        if isinstance(text, str):
+            text = text.encode('ascii')
+        self._parts.append(text)
+        self._size = self._size+len(text)
+        if self._size >= SEND_BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self._size > 0:
+            data = b''.join(self._parts)
+            self.stream.write(('%x\r\n' % (len(data))).encode('ascii')+data+b'\r\n')
+            self._parts = []
+            self._size = 0
+
+    def close(self):
+        """
+Send what is left and the end of the response.
+        """
+        self.flush()
+        self.stream.write(b'0\r\n\r\n')
+        self.stream.flush()
+
+
+class RequestError(Exception):
+    """
+This exception is raised for a request that cannot be done, with the HTTP
+status to answer with.
+    """
+    def __init__(self, message, status=400):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class ConversionService():
+    """
+This class holds the model grids and fits of the service and does the
+conversions.
+    """
+    def __init__(self, options=None, fit_cache_file=None, work_directory=None):
+        """
+Read all the model grids that are found.
+
+Parameters:
+
+    options  :  dictionary or None
+
+        The command line options of jwst_magnitude_converter.py (see
+        parseOptions) to apply to the catalogue conversions.
+
+    fit_cache_file  :  string or None
+
+        The fit cache database of the array conversions, as for
+        MagnitudeConverter.
+
+    work_directory  :  string or None
+
+        The directory that the files of the catalogue conversions must be
+        in, or None for the current directory.
+        """
+        self.options = {}
+        if options is not None:
+            self.options = dict((key, options[key]) for key in options if key not in ['serve', 'workdir'])
+        self.fit_cache_file = fit_cache_file
+        if work_directory is None:
+            work_directory = os.getcwd()
+        self.work_directory = os.path.realpath(work_directory)
+        if not os.path.isdir(self.work_directory):
+            raise ValueError('The working directory %s was not found.' % (work_directory))
+        self.statistics = ServiceStatistics()
+        self.converters = {}
+        self.grid_errors = {}
+        self.lock = threading.Lock()
+        reader = jwst_magnitude_converter.magConGUI()
+        for model_set in sorted(magnitude_converter.model_sets):
+            file_name, nfilters = magnitude_converter.model_sets[model_set]
+            try:
+                self.converters[model_set] = magnitude_converter.MagnitudeConverter(model_set, fit_cache_file)
+            except Exception as error:
+                self.grid_errors[model_set] = str(error)
+                continue
+            # The grids are also put in gridStore for the catalogue conversions.
+            reader.readMagslist(os.path.join(jwst_magnitude_converter.path, file_name), nfilters)
+
+    def converter(self, model_set):
+        """
+Return the MagnitudeConverter of a model set, reading its grid if that was
+not possible when the service started.  Must be called with self.lock held.
+        """
+        if model_set not in self.converters:
+            if model_set not in magnitude_converter.model_sets:
+                raise RequestError('Unknown model set %s; the model sets are %s.' %
+                                   (model_set, ', '.join(sorted(magnitude_converter.model_sets))))
+            try:
+                self.converters[model_set] = magnitude_converter.MagnitudeConverter(model_set, self.fit_cache_file)
+            except Exception as error:
+                raise RequestError('The %s model set is not available: %s' % (model_set, error), 404)
+            self.grid_errors.pop(model_set, None)
+        return self.converters[model_set]
+
+    def convert_arrays(self, payload):
+        """
+This routine does the conversion of a /convert request.
+
+Parameters:
+
+    payload  :  dictionary
+
+        The request values (see the description of the module).
+
+Returns:
+
+    columns  :  list of numpy arrays
+
+        The colour, the magnitude, the N x K transformed magnitudes, and the
+        N x K systematic uncertainties if they were asked for.
+
+    labels  :  list of strings
+
+        The names of the K target filters.
+
+        """
+        try:
+            mag1 = numpy.asarray(payload['mag1'], dtype=numpy.float64)
+            mag2 = numpy.asarray(payload['mag2'], dtype=numpy.float64)
+            input_filters = (payload['filter1'].replace('_', ' '), payload['filter2'].replace('_', ' '))
+            target_filters = payload['jwstfilters']
+            column_types = (payload.get('column1type', 'magnitude'), payload.get('column2type', 'magnitude'))
+            yvalue = int(payload.get('yvalue', 1))
+            norder = int(payload.get('fitorder', 4))
+        except KeyError as error:
+            raise RequestError('The request has no value for %s.' % (error))
+        except (TypeError, ValueError, AttributeError) as error:
+            raise RequestError('Bad request value: %s' % (error))
+        if mag1.ndim != 1 or mag1.shape != mag2.shape:
+            raise RequestError('mag1 and mag2 must be lists of numbers of the same length.')
+        engine = payload.get('engine', 'legendre')
+        selection = payload.get('selection', None)
+        with self.lock:
+            converter = self.converter(payload.get('modelset', 'Kurucz'))
+            try:
+                labels = [converter.labels[n].strip() for n in converter.target_columns(target_filters)]
+                magnitudes = converter.convert(mag1, mag2, input_filters, target_filters, column_types,
+                                               yvalue, norder, engine=engine, selection=selection)
+                columns = list(magnitude_converter.colour_magnitude(mag1, mag2, column_types))+[magnitudes]
+                if payload.get('systematics', False):
+                    columns.append(converter.systematics(mag1, mag2, input_filters, target_filters,
+                                                         column_types, yvalue, norder, selection=selection))
+            except ValueError as error:
+                raise RequestError(str(error))
+        return columns, labels
+
+    def local_path(self, name):
+        """
+Return the full name of a file of a catalogue conversion, taking a relative
+name from the working directory.  A name outside the working directory (after
+following any links) raises a RequestError.
+        """
+        if not isinstance(name, str) or len(name) == 0:
+            raise RequestError('Bad file name %r.' % (name))
+        path = os.path.realpath(os.path.join(self.work_directory, name))
+        if os.path.commonpath([path, self.work_directory]) != self.work_directory:
+            raise RequestError('The file %s is not in the working directory of the service.' % (name), 403)
+        return path
+
+    def catalog_parameters(self, payload):
+        """
+Return the cfg file parameters (a ConfigObj) of a /catalog request: those of
+the cfg file cfgfile if it is given, with the values of the sections of the
+request put over them.  The file names are made full names in the working
+directory (see local_path).
+        """
+        if 'cfgfile' in payload:
+            cfgfile = self.local_path(payload['cfgfile'])
+            if not os.path.isfile(cfgfile):
+                raise RequestError('The cfg file %s was not found.' % (payload['cfgfile']), 404)
+            parameters = ConfigObj(cfgfile)
+        else:
+            parameters = ConfigObj()
+        for section in ['Input_Magnitude_Parameters', 'Output_Filter_Values']:
+            if section not in parameters:
+                parameters[section] = {}
+            values = payload.get(section, {})
+            if not isinstance(values, dict):
+                raise RequestError('%s must be a JSON object.' % (section))
+            for key in values:
+                parameters[section][key] = values[key]
+        inputs = parameters['Input_Magnitude_Parameters']
+        output = parameters['Output_Filter_Values']
+        if 'datafile' in inputs:
+            inputs['datafile'] = self.local_path(inputs['datafile'])
+        if 'outfilename' in output:
+            output['outfilename'] = self.local_path(output['outfilename'])
+        if 'fitcache' in output and str(output['fitcache']).lower() != 'none':
+            output['fitcache'] = self.local_path(output['fitcache'])
+        output['plotdirectory'] = self.local_path(output.get('plotdirectory', '.'))
+        plotname = str(output.get('plotname', ''))
+        if os.path.dirname(plotname) != '' or plotname in [os.curdir, os.pardir]:
+            raise RequestError('The plot name %s must not contain a directory.' % (plotname))
+        return parameters
+
+    def convert_catalog(self, parameters):
+        """
+This routine does the conversion of a /catalog request with runJob, and
+returns True or False for success, the run time, and the text printed by the
+conversion.
+        """
+        with self.lock:
+            cfgfile, status, runtime, log = jwst_magnitude_converter.runJob(parameters, self.options)
+        return status, runtime, log
+
+    def fit_statistics(self):
+        """
+Return the counts of the fits taken from memory, taken from the fit cache,
+and made by the array conversions, and the hits and misses of the fit caches
+of both kinds of conversion.
+        """
+        counts = {'memory': 0, 'cache': 0, 'fitted': 0}
+        caches = []
+        for model_set in self.converters:
+            converter = self.converters[model_set]
+            for key in counts:
+                counts[key] = counts[key]+converter.fit_counts[key]
+            caches.append(converter.fit_cache)
+        caches.extend(jwst_magnitude_converter.fitCacheStore.values())
+        hits = 0
+        misses = 0
+        seen = []
+        for cache in caches:
+            if cache is None or id(cache) in seen:
+                continue
+            seen.append(id(cache))
+            hits = hits+cache.hits
+            misses = misses+cache.misses
+        return {'fits': counts, 'fit_cache': {'hits': hits, 'misses': misses}}
+
+    def report(self):
+        """
+Return the statistics of the service for a /stats request.
+        """
+        values = self.statistics.report()
+        with self.lock:
+            values.update(self.fit_statistics())
+        values['model_sets'] = sorted(self.converters)
+        values['unavailable_model_sets'] = dict(self.grid_errors)
+        values['grids_in_memory'] = len(jwst_magnitude_converter.gridStore)
+        return values
+
+
+class ServiceHandler(http.server.BaseHTTPRequestHandler):
+    """
+This class answers the HTTP requests of the service.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def address_string(self):
+        if isinstance(self.client_address, tuple) and len(self.client_address) > 0:
+            return str(self.client_address[0])
+        return 'local'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            http.server.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def do_GET(self):
+        self.answer(self.path.split('?')[0], False)
+
+    def do_POST(self):
+        self.answer(self.path.split('?')[0], True)
+
+    def answer(self, name, post):
+        """
+Answer a request, recording its latency.
+        """
+        service = self.server.service
+        start = time.perf_counter()
+        succeeded = False
+        self.response_started = False
+        try:
+            if not post and name == '/health':
+                self.send_text(200, 'ok\n')
+            elif not post and name == '/stats':
+                self.send_json(200, service.report())
+            elif post and name == '/convert':
+                self.answer_convert(self.read_payload())
+            elif post and name == '/catalog':
+                self.answer_catalog(self.read_payload())
+            else:
+                name = 'unknown'
+                raise RequestError('Unknown request %s %s.' % (self.command, self.path), 404)
+            succeeded = True
+        except RequestError as error:
+            self.close_connection = True
+            if not self.response_started:
+                self.send_json(error.status, {'error': str(error)})
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        except Exception as error:
+            # once the headers have been sent an error answer would be read as
+            # part of the body, so the connection is only closed, which leaves
+            # a chunked body without its end
+            self.close_connection = True
+            if not self.response_started:
+                self.send_json(500, {'error': repr(error)})
+        service.statistics.record(name, time.perf_counter()-start, succeeded)
+
+    def read_payload(self):
+        """
+Read the JSON body of a POST request.
+        """
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length).decode('utf-8'))
+        except ValueError as error:
+            raise RequestError('The request is not valid JSON: %s' % (error))
+        if not isinstance(payload, dict):
+            raise RequestError('The request must be a JSON object.')
+        return payload
+
+    def send_text(self, status, text, content_type='text/plain'):
+        data = text.encode('utf-8')
+        self.response_started = True
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_json(self, status, values):
+        self.send_text(status, json.dumps(values)+'\n', 'application/json')
+
+    def start_chunked(self, content_type):
+        """
+Send the headers of a response whose body follows in chunks, and return the
+ChunkedWriter for the body.
+        """
+        self.response_started = True
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        return ChunkedWriter(self.wfile)
+
+    def answer_convert(self, payload):
+        columns, labels = self.server.service.convert_arrays(payload)
+        output_format = payload.get('format', 'text')
+        if output_format == 'json':
+            values = {'filters': labels, 'magnitudes': columns[2].tolist()}
+            if len(columns) > 3:
+                values['systematics'] = columns[3].tolist()
+            self.send_json(200, values)
+            return
+        if output_format != 'text':
+            raise RequestError('Unknown format %s; the formats are text and json.' % (output_format))
+        names = ['colour', 'magnitude']+[x.replace(' ', '_') for x in labels]
+        if len(columns) > 3:
+            names = names+[x.replace(' ', '_')+'_systematic' for x in labels]
+        writer = self.start_chunked('text/plain')
+        writer.write('# '+' '.join(names)+'\n')
+        catalog_io.write_rows(writer, columns)
+        writer.close()
+
+    def answer_catalog(self, payload):
+        service = self.server.service
+        parameters = service.catalog_parameters(payload)
+        output = parameters['Output_Filter_Values']
+        work_dir = None
+        if 'outfilename' not in output:
+            work_dir = tempfile.mkdtemp()
+            output['outfilename'] = os.path.join(work_dir, 'output.'+str(output.get('outputformat', 'txt')))
+        try:
+            status, runtime, log = service.convert_catalog(parameters)
+            if not status:
+                # the conversion stops with the reason as its last message
+                lines = log.strip().split('\n')
+                self.send_json(422, {'status': 'failed', 'seconds': runtime, 'log': log,
+                                     'error': lines[-1]})
+                return
+            if work_dir is None:
+                self.send_json(200, {'status': 'done', 'seconds': runtime, 'log': log,
+                                     'outfilename': output['outfilename']})
+                return
+            if output['outfilename'].endswith('.fits'):
+                writer = self.start_chunked('application/fits')
+            else:
+                writer = self.start_chunked('text/plain')
+            with open(output['outfilename'], 'rb') as infile:
+                while True:
+                    data = infile.read(SEND_BUFFER_SIZE)
+                    if len(data) == 0:
+                        break
+                    writer.write(data)
+            writer.close()
+        finally:
+            if work_dir is not None:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+
+class ServiceServer(http.server.ThreadingHTTPServer):
+    """
+This class is the HTTP server of the service on a localhost port.
+    """
+    daemon_threads = True
+
+    def __init__(self, location, service, verbose=True):
+        if ':' in location[0]:
+            self.address_family = socket.AF_INET6
+        http.server.ThreadingHTTPServer.__init__(self, location, ServiceHandler)
+        self.service = service
+        self.verbose = verbose
+
+
+class UnixServiceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+This class is the HTTP server of the service on a Unix socket.
+    """
+    daemon_threads = True
+
+    def __init__(self, location, service, verbose=True):
+        if os.path.exists(location):
+            os.remove(location)
+        socketserver.UnixStreamServer.__init__(self, location, ServiceHandler)
+        self.service = service
+        self.verbose = verbose
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def make_server(address, options=None, verbose=True, fit_cache_file=None, work_directory=None):
+    """
+This routine reads the model grids and makes the server of the service,
+ready for serve_forever.  The address is as for parse_address (a port number
+of 0 takes any free port, see server.server_address), and the options,
+fit_cache_file, and work_directory are as for ConversionService.
+    """
+    family, location = parse_address(address)
+    service = ConversionService(options, fit_cache_file, work_directory)
+    if family == 'unix':
+        return UnixServiceServer(location, service, verbose)
+    return ServiceServer(location, service, verbose)
+
+
+def stop_service(number, frame):
+    raise KeyboardInterrupt()
+
+
+def serve(address, options=None):
+    """
+This routine runs the service until it is interrupted.
+    """
+    work_directory = None
+    if options is not None:
+        work_directory = options.get('workdir', None)
+    server = make_server(address, options, work_directory=work_directory)
+    if isinstance(server.server_address, tuple):
+        where = 'http://%s:%d' % (server.server_address[0], server.server_address[1])
+    else:
+        where = 'unix:%s' % (server.server_address)
+    print('Model sets in memory: %s' % (', '.join(sorted(server.service.converters))))
+    for model_set in sorted(server.service.grid_errors):
+        print('Model set %s not available: %s' % (model_set, server.service.grid_errors[model_set]))
+    print('Conversion service listening on %s, for files in %s' % (where, server.service.work_directory))
+    # The service is stopped by an interrupt or a terminate signal, which
+    # removes the socket file of a Unix socket.
+    signal.signal(signal.SIGTERM, stop_service)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """
+This class is an HTTP connection over a Unix socket, for clients of the
+service.
+    """
+    def __init__(self, socket_file, timeout=None):
+        http.client.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.socket_file = socket_file
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_file)
+
+
+def request(address, path, payload=None, timeout=None):
+    """
+This routine sends one request to the service and waits for the answer.
+
+Parameters:
+
+    address  :  string
+
+        The service address, as given to --serve.
+
+    path  :  string
+
+        The request, such as '/convert' or '/stats'.
+
+    payload  :  dictionary or None
+
+        The values of a POST request; without them a GET request is sent.
+
+    timeout  :  float or None
+
+        The connection timeout in seconds.
+
+Returns:
+
+    status  :  integer
+
+        The HTTP status of the answer.
+
+    body  :  bytes
+
+        The answer.
+
+    """
+    family, location = parse_address(address)
+    if family == 'unix':
+        connection = UnixHTTPConnection(location, timeout)
+    else:
+        connection = http.client.HTTPConnection(location[0], location[1], timeout=timeout)
+    try:
+        if payload is None:
+            connection.request('GET', path)
+        else:
+            connection.request('POST', path, json.dumps(payload).encode('utf-8'),
+                               {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
@@ -0,0 +1,206 @@
+#! /usr/bin/env python
+#
+"""
+This module provides the lookup of filter names in the simulated magnitude
+grids (magslist_*.new), as used by jwst_magnitude_converter.py and
+magnitude_converter.py.
+
+A FilterIndex is made once for a grid from its filter labels.  It maps a
+normalized form of each name to the grid column, so a lookup is a dictionary
+access rather than a scan of the labels.  Names are normalized by taking
+underscores as spaces, removing extra spaces, and ignoring case, so that
+"HST_ACS_F814W", "HST ACS F814W", and "hst acs f814w" are the same filter.
+
+Some shorter or alternative names are accepted as well:
+
+    -- the filter without "HST", such as "ACS F814W" or "WFC3 F160W"
+
+    -- names without the square brackets, such as "IRAC 3.6" or "MIPS 24"
+
+    -- the filter name alone, such as "F1000W" or "W3", where only one
+       filter in the grid has that name
+
+    -- the other names of instruments and systems in instrument_aliases,
+       such as "Bessel U" for "Bessell U" or "FGS 1" for "Guider 1"
+
+A name must match one of these names exactly, not just be part of a filter
+name, so "NIRCam F150W" can not be mistaken for "NIRCam F150W2".
+Unknown names, and short names that fit more than one filter (such as
+"F200W"), raise a ValueError that lists the closest filter names.
+"""
+import difflib
+
+# The instrument names of the JWST filters, as at the start of the filter names.
+jwst_instruments = ['NIRISS', 'Guider', 'NIRCam', 'MIRI', 'NIRSpec']
+
+# Other names accepted for the first word (the instrument or photometric
+# system) of a filter name, in normalized (lower case) form.
+instrument_aliases = {'bessel': 'bessell',
+                      'bessel/cousins': 'bessell/cousins',
+                      'cousins': 'bessell/cousins',
+                      'fgs': 'guider',
+                      'ps1': 'pan-starrs1',
+                      'panstarrs': 'pan-starrs1',
+                      'panstarrs1': 'pan-starrs1',
+                      'pan-starrs': 'pan-starrs1',
+                      'sdss': 'sloan'}
+
+
+def normalize_name(name):
+    """
+This routine returns the normalized form of a filter name used in the index:
+underscores are taken as spaces, runs of spaces are reduced to one, and the
+name is put in lower case.  An alias of the first word (see
+instrument_aliases) is replaced by the name used in the grids.
+
+Parameters:
+
+    name  :  string
+
+        The filter name, such as 'HST_ACS_F814W'.
+
+Returns:
+
+    key  :  string
+
+        The normalized name, such as 'hst acs f814w'.
+
+    """
+    words = name.replace('_', ' ').lower().split()
+    if len(words) > 0 and words[0] in instrument_aliases:
+        words[0] = instrument_aliases[words[0]]
+    return ' '.join(words)
+
+
+def short_names(key):
+    """
+This routine returns the shorter names under which a filter is also indexed,
+given its normalized name.
+    """
+    words = key.split()
+    names = []
+    if len(words) > 2 and words[0] == 'hst':
+        names.append(' '.join(words[1:]))
+    unbracketed = key.replace('[', '').replace(']', '')
+    if unbracketed != key:
+        names.append(unbracketed)
+    if len(words) > 1:
+        names.append(words[-1])
+        if unbracketed != key:
+            names.append(unbracketed.split()[-1])
+    return names
+
+
+class FilterIndex():
+    """
+This class maps filter names to the columns of a magnitude grid.
+    """
+    def __init__(self, labels, grid_name=None):
+        """
+Make the index for a grid.
+
+Parameters:
+
+    labels  :  list of strings
+
+        The filter labels of the grid, one per column.
+
+    grid_name  :  string or None
+
+        A name for the grid (such as the model set) used in error messages.
+        """
+        self.labels = list(labels)
+        self.names = [label.strip() for label in self.labels]
+        self.grid_name = grid_name
+        self._index = {}
+        self._ambiguous = {}
+        short = {}
+        for n in range(len(self.names)):
+            key = normalize_name(self.names[n])
+            if key in self._index:
+                self._ambiguous[key] = [self._index.pop(key), n]
+            elif key in self._ambiguous:
+                self._ambiguous[key].append(n)
+            else:
+                self._index[key] = n
+            for name in short_names(key):
+                short.setdefault(name, [])
+                if n not in short[name]:
+                    short[name].append(n)
+        # A full filter name always takes precedence over a short name.
+        for name in short:
+            if name in self._index or name in self._ambiguous:
+                continue
+            if len(short[name]) == 1:
+                self._index[name] = short[name][0]
+            else:
+                self._ambiguous[name] = short[name]
+
+    def column(self, name):
+        """
+Return the grid column of a filter name.  A name that is not in the grid, or
+fits more than one filter, raises a ValueError listing the closest filters.
+        """
+        key = normalize_name(name)
+        try:
+            return self._index[key]
+        except KeyError:
+            pass
+        grid = self.grid_description()
+        if key in self._ambiguous:
+            raise ValueError('Filter name %s is ambiguous in %s; it could be %s.' %
+                             (name.strip(), grid, ', '.join([self.names[n] for n in self._ambiguous[key]])))
+        matches = self.close_matches(name)
+        if len(matches) > 0:
+            raise ValueError('Filter %s is not in %s; the closest filters are %s.' %
+                             (name.strip(), grid, ', '.join(matches)))
+        raise ValueError('Filter %s is not in %s.' % (name.strip(), grid))
+
+    def grid_description(self):
+        """
+Return the description of the grid used in error messages.
+        """
+        if self.grid_name is None:
+            return 'the grid'
+        return 'the %s model set' % (self.grid_name)
+
+    def close_matches(self, name, number=5):
+        """
+Return up to number filter names of the grid that are closest to a name.
+        """
+        keys = [normalize_name(x) for x in self.names]
+        matches = difflib.get_close_matches(normalize_name(name), keys, number, 0.6)
+        return [self.names[keys.index(x)] for x in matches]
+
+    def instrument_columns(self, instruments):
+        """
+Return the grid columns of all the filters of the given instruments, in grid
+order.
+        """
+        instruments = [normalize_name(x) for x in instruments]
+        return [n for n in range(len(self.names))
+                if len(self.names[n]) > 0 and normalize_name(self.names[n]).split()[0] in instruments]
+
+    def target_columns(self, target_names):
+        """
+Return the grid columns of a list of target filter names, in order.  An entry
+"all" stands for all the JWST filters and "all NIRISS", "all NIRCam", and so
+on for all the filters of one instrument.  A name that does not match raises
+a ValueError.
+        """
+        if isinstance(target_names, str):
+            target_names = [target_names]
+        columns = []
+        for name in target_names:
+            words = name.replace('_', ' ').split()
+            if len(words) > 0 and words[0].lower() == 'all':
+                if len(words) == 1:
+                    found = self.instrument_columns(jwst_instruments)
+                else:
+                    found = self.instrument_columns(words[1:])
+                if len(found) == 0:
+                    raise ValueError('No filters for %s in %s.' % (name, self.grid_description()))
+                columns.extend(found)
+            else:
+                columns.append(self.column(name))
+        return columns
@@ -0,0 +1,275 @@
+#! /usr/bin/env python
+#
+"""
+This module provides a persistent store for the Legendre polynomial
+transformation coefficients calculated by jwst_magnitude_converter.py.
+
+A transformation fit depends only on the model grid, the two input filters,
+the target filter, the y axis option, the fit order, and the selection of the
+grid rows fitted (see grid_parameters.py).  The coefficients are therefore
+saved in a small SQLite database keyed on those values together with the SHA-1
+hash of the grid file, so repeated conversions for the same filter combination
+do not have to repeat the fit.  The deviations of the model values from the
+fit, binned in colour, are saved with the coefficients.  Entries made from an
+older version of a grid are removed when the grid changes, and the least
+recently used entries are removed when the store holds more than a set number
+of fits.
+
+Any problem with the database (for example a read-only directory or a locked
+file) is treated as a cache miss, so the cache can never stop a conversion.
+"""
+import os
+import sqlite3
+import time
+import numpy
+import grid_cache
+
+# The default maximum number of fits held in the store.  A fit is a handful of
+# coefficients, so even the maximum is only a few megabytes.
+DEFAULT_MAX_ENTRIES = 20000
+
+_schema = """create table if not exists fits (
+    model_set text, grid_hash text, filter1 text, filter2 text, target text,
+    yopt integer, norder integer, selection text, coefficients blob, xmin real,
+    xmax real, rms real, mindev real, maxdev real, scatter blob, last_used real,
+    primary key (model_set, grid_hash, filter1, filter2, target, yopt, norder, selection))"""
+
+
+def _full_key(key):
+    """
+Return a fit key with the selection, which is empty (all the grid rows) for
+a key without one.
+    """
+    key = tuple(key)
+    if len(key) == 7:
+        return key+('',)
+    return key
+
+
+def default_cache_file(grid_file_name):
+    """
+This routine returns the default name of the fit cache database, which is
+kept in the same directory as the binary grid caches.
+
+Parameters:
+
+    grid_file_name  :  string
+
+        The name of any of the text magnitude grid files.
+
+Returns:
+
+    cache_file_name  :  string
+
+        The name of the SQLite database file.
+
+    """
+    return os.path.join(grid_cache.cache_directory(grid_file_name), 'magslist_fits.cache.sqlite')
+
+
+class FitCache():
+    """
+This class wraps the SQLite store of transformation fits.  Each fit is
+identified by the key
+
+    (model_set, grid_hash, filter1, filter2, target, yopt, norder, selection)
+
+where model_set is the name of the grid file, grid_hash is its SHA-1 hash, the
+three filters are the names of the columns used from the grid, yopt and
+norder are the y axis option and the order of the fit as used in doFit, and
+selection is the grid_parameters.selection_key of the grid rows fitted (empty
+for all of them, as for a key given without it).
+    """
+    def __init__(self,file_name,max_entries=DEFAULT_MAX_ENTRIES):
+        """
+Open (and if needed create) the fit store.
+
+Parameters:
+
+    file_name  :  string
+
+        The name of the SQLite database file.
+
+    max_entries  :  integer
+
+        The maximum number of fits kept.  When this is exceeded the least
+        recently used fits are deleted.
+
+If the database cannot be opened an sqlite3.Error or OSError is raised.
+        """
+        self.file_name = file_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(file_name, timeout=30., check_same_thread=False)
+        self.connection.execute(_schema)
+        # a store made by an older version without the binned scatter or the
+        # grid row selection is remade
+        columns = [row[1] for row in self.connection.execute('pragma table_info(fits)')]
+        if 'scatter' not in columns or 'selection' not in columns:
+            self.connection.execute('drop table fits')
+            self.connection.execute(_schema)
+        self.connection.commit()
+        self._checked_grids = set()
+
+    def invalidate(self,model_set,grid_hash):
+        """
+Remove all the fits for a model set that were made from a grid with a
+different hash.  This is done once per model set and hash for each FitCache
+object, the first time the model set is used.
+
+Parameters:
+
+    model_set  :  string
+
+        The grid file name used as the model set identifier.
+
+    grid_hash  :  string
+
+        The SHA-1 hash of the current grid file.
+
+        """
+        if (model_set,grid_hash) in self._checked_grids:
+            return
+        try:
+            with self.connection:
+                self.connection.execute('delete from fits where model_set = ? and grid_hash != ?',
+                                        (model_set,grid_hash))
+            self._checked_grids.add((model_set,grid_hash))
+        except sqlite3.Error:
+            pass
+
+    def get(self,key):
+        """
+Look up a fit.
+
+Parameters:
+
+    key  :  tuple
+
+        The (model_set, grid_hash, filter1, filter2, target, yopt, norder,
+        selection) key of the fit.
+
+Returns:
+
+    fit  :  dictionary or None
+
+        A dictionary with the `coefficients' numpy array, the fit colour range
+        `xmin' and `xmax', the `rms', `mindev', and `maxdev' fit residual
+        statistics, and the `scatter' array of binned RMS deviations (None if
+        it was not stored), or None if the fit is not in the store.
+
+        """
+        key = _full_key(key)
+        self.invalidate(key[0],key[1])
+        try:
+            row = self.connection.execute(
+                'select coefficients, xmin, xmax, rms, mindev, maxdev, scatter from fits where '
+                'model_set = ? and grid_hash = ? and filter1 = ? and filter2 = ? and '
+                'target = ? and yopt = ? and norder = ? and selection = ?', key).fetchone()
+        except sqlite3.Error:
+            row = None
+        # the use time is only for the removal of the least recently used
+        # fits, so a store that cannot be written (read-only or locked) still
+        # gives the fit
+        if row is not None:
+            try:
+                with self.connection:
+                    self.connection.execute(
+                        'update fits set last_used = ? where model_set = ? and grid_hash = ? and '
+                        'filter1 = ? and filter2 = ? and target = ? and yopt = ? and norder = ? and '
+                        'selection = ?', (time.time(),)+key)
+            except sqlite3.Error:
+                pass
+        if row is None:
+            self.misses = self.misses+1
+            return None
+        self.hits = self.hits+1
+        scatter = None
+        if row[6] is not None:
+            scatter = numpy.frombuffer(row[6], dtype=numpy.float64).copy()
+        return {'coefficients': numpy.frombuffer(row[0], dtype=numpy.float64).copy(),
+                'xmin': row[1], 'xmax': row[2],
+                'rms': row[3], 'mindev': row[4], 'maxdev': row[5], 'scatter': scatter}
+
+    def put(self,key,coefficients,xmin,xmax,rms,mindev,maxdev,scatter=None):
+        """
+Store a fit, then remove the least recently used fits if the store has grown
+past its maximum size.
+
+Parameters:
+
+    key  :  tuple
+
+        The (model_set, grid_hash, filter1, filter2, target, yopt, norder,
+        selection) key of the fit.
+
+    coefficients  :  numpy float array
+
+        The Legendre polynomial coefficients from legendre.legfit.
+
+    xmin, xmax  :  floats
+
+        The range of the model colour used in the fit.
+
+    rms, mindev, maxdev  :  floats
+
+        The RMS, minimum, and maximum absolute deviation of the fit.
+
+    scatter  :  numpy float array or None
+
+        The RMS deviations of the fit in bins of colour over xmin to xmax
+        (see fit_engine.binned_scatter).
+
+        """
+        key = _full_key(key)
+        self.invalidate(key[0],key[1])
+        coefficients = numpy.ascontiguousarray(coefficients, dtype=numpy.float64)
+        if scatter is not None:
+            scatter = numpy.ascontiguousarray(scatter, dtype=numpy.float64).tobytes()
+        try:
+            with self.connection:
+                self.connection.execute(
+                    'insert or replace into fits values (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)',
+                    key+(coefficients.tobytes(),float(xmin),float(xmax),
+                                float(rms),float(mindev),float(maxdev),scatter,time.time()))
+                self.connection.execute(
+                    'delete from fits where rowid in (select rowid from fits order by '
+                    'last_used desc limit -1 offset ?)', (self.max_entries,))
+        except sqlite3.Error:
+            pass
+
+    def __len__(self):
+        try:
+            return self.connection.execute('select count(*) from fits').fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+    def close(self):
+        self.connection.close()
+
+
+def open_fit_cache(file_name,max_entries=DEFAULT_MAX_ENTRIES):
+    """
+Open a FitCache, returning None rather than raising an error if the store
+cannot be opened (for example because the directory is not writable).
+
+Parameters:
+
+    file_name  :  string
+
+        The name of the SQLite database file.
+
+    max_entries  :  integer
+
+        The maximum number of fits kept.
+
+Returns:
+
+    fit_cache  :  FitCache or None
+
+    """
+    try:
+        return FitCache(file_name,max_entries)
+    except (sqlite3.Error, OSError):
+        return None
@@ -0,0 +1,598 @@
+#! /usr/bin/env python
+#
+"""
+This module holds the numerical core of the colour transformations in
+jwst_magnitude_converter.py: batched Legendre polynomial fitting of the
+simulated model colours, and vectorized evaluation of the fitted
+transformations for the input catalogue.
+
+All the transformations for a given pair of input filters share the same
+input colour (the x values), so the Legendre Vandermonde matrix of that colour
+is built once and every target filter is solved for in a single multiple
+right hand side least squares problem.  The scaling and the singular value
+cut-off are the same as in numpy.polynomial.legendre.legfit, so the
+coefficients agree with fitting each filter separately with legfit.
+
+The evaluation likewise builds the Legendre basis of the catalogue colour once
+and multiplies it by the stacked coefficients of all the target filters,
+with the clamping of the colour to the fit range done in the same pass.
+
+As an alternative the transformations can be tabulated over the clamped
+colour range (build_lookup_table) and evaluated by linear interpolation in the
+table (evaluate_lookup_table), which is faster for large catalogues.  The
+largest interpolation error of a table is given by lookup_table_error.
+
+The uncertainties of the transformed magnitudes are found from those of the
+input catalogue values by propagate_errors, using the derivatives of the
+fitted polynomials.  The scatter of the model colours about each fit is
+summarized in colour bins by binned_scatter, and evaluate_scatter gives every
+catalogue row the model scatter at its colour as a systematic uncertainty.
+"""
+import numpy
+import numpy.polynomial.legendre as legendre
+
+
+def legendre_fit(xvalues,yvalues,norder,vander=None):
+    """
+This routine fits Legendre polynomials of a given order to one or more sets
+of y values that share the same x values.
+
+Parameters:
+
+    xvalues  :  numpy float array
+
+        The x values (the model input colour), of length M.
+
+    yvalues  :  numpy float array
+
+        Either a one-dimensional array of length M, or an M x K array holding
+        K sets of y values (one per target filter) as columns.
+
+    norder  :  integer
+
+        The order of the fit.
+
+    vander  :  numpy float array, optional
+
+        The Legendre Vandermonde matrix of xvalues, of size M x (n+1) for any
+        n >= norder.  If given it is used instead of recalculating it, which
+        is useful when fitting several orders in turn.
+
+Returns:
+
+    coefficients  :  numpy float array
+
+        The fit coefficients, of size (norder+1) for one-dimensional y values
+        or (norder+1) x K otherwise, in the same layout as legendre.legfit.
+
+    """
+    xvalues = numpy.asarray(xvalues,dtype=numpy.float64)
+    yvalues = numpy.asarray(yvalues,dtype=numpy.float64)
+    if vander is None:
+        vander = legendre.legvander(xvalues,norder)
+    else:
+        vander = vander[:,0:norder+1]
+    scale = numpy.sqrt(numpy.sum(vander*vander,axis=0))
+    scale[scale == 0] = 1
+    rcond = len(xvalues)*numpy.finfo(xvalues.dtype).eps
+    coefficients,residuals,rank,singular_values = numpy.linalg.lstsq(vander/scale,yvalues,rcond=rcond)
+    return (coefficients.T/scale).T
+
+
+def fit_residuals(xvalues,yvalues,coefficients,vander=None):
+    """
+This routine calculates the statistics of the deviations between the fit and
+the values that were fitted, for one or more target filters at once.
+
+Parameters:
+
+    xvalues  :  numpy float array
+
+        The x values of length M.
+
+    yvalues  :  numpy float array
+
+        The fitted y values, of length M or of size M x K.
+
+    coefficients  :  numpy float array
+
+        The fit coefficients as returned by legendre_fit.
+
+    vander  :  numpy float array, optional
+
+        The Legendre Vandermonde matrix of xvalues (at least as many columns
+        as there are coefficients).
+
+Returns:
+
+    statistics  :  numpy float array
+
+        An array of size K x 3 (or 3 for one-dimensional y values) holding the
+        RMS deviation and the minimum and maximum absolute deviation for each
+        target filter.
+
+    """
+    norder = coefficients.shape[0]-1
+    if vander is None:
+        vander = legendre.legvander(numpy.asarray(xvalues,dtype=numpy.float64),norder)
+    deviations = numpy.dot(vander[:,0:norder+1],coefficients)-yvalues
+    statistics = numpy.stack([numpy.sqrt(numpy.sum(deviations*deviations,axis=0)/deviations.shape[0]),
+                              numpy.min(numpy.abs(deviations),axis=0),
+                              numpy.max(numpy.abs(deviations),axis=0)],axis=-1)
+    return statistics
+
+
+def batch_fit(xvalues,yvalues,norders):
+    """
+This routine fits all the target filters for one or more fit orders, building
+the Legendre Vandermonde matrix only once for the highest order.
+
+Parameters:
+
+    xvalues  :  numpy float array
+
+        The x values (the model input colour), of length M.
+
+    yvalues  :  numpy float array
+
+        An M x K array holding the model colours of the K target filters.
+
+    norders  :  integer or list of integers
+
+        The fit order, or a list of fit orders for a fit order sweep.
+
+Returns:
+
+    results  :  tuple or list of tuples
+
+        For each fit order a tuple (coefficients, statistics), where
+        coefficients is the (norder+1) x K array of fit coefficients and
+        statistics the K x 3 array of RMS, minimum, and maximum deviations
+        from fit_residuals.  A single tuple is returned if norders is a
+        single integer.
+
+    """
+    single = numpy.ndim(norders) == 0
+    if single:
+        norders = [norders]
+    xvalues = numpy.asarray(xvalues,dtype=numpy.float64)
+    vander = legendre.legvander(xvalues,max(norders))
+    results = []
+    for norder in norders:
+        coefficients = legendre_fit(xvalues,yvalues,norder,vander)
+        results.append((coefficients,fit_residuals(xvalues,yvalues,coefficients,vander)))
+    if single:
+        return results[0]
+    return results
+
+
+# The number of catalogue rows evaluated at a time; this bounds the size of
+# the Legendre basis array to about 8*(norder+1)*EVALUATION_BLOCK_SIZE bytes.
+EVALUATION_BLOCK_SIZE = 262144
+
+
+def evaluate_transformations(xvalues,yvalues,coefficients,xmin,xmax,yopt,dtype=numpy.float32,out=None):
+    """
+This routine applies the transformations for all the target filters to the
+input data in one pass.  The Legendre basis of the (clamped) data colour is
+built once per block of rows and multiplied by the stacked coefficient matrix,
+and only the requested target filters are calculated.
+
+Parameters:
+
+    xvalues  :  numpy float array
+
+        The input colour values of length N.
+
+    yvalues  :  numpy float array
+
+        The input magnitude values of length N.
+
+    coefficients  :  numpy float array
+
+        The (norder+1) x K stack of fit coefficients, one column per target
+        filter.
+
+    xmin, xmax  :  floats
+
+        The colour range over which the fits are used.  Colours outside the
+        range are given the transformation value at the nearest end of the
+        range.
+
+    yopt  :  integer
+
+        The y axis option as in doFit: for 0 the transformation is of the form
+        mag - JWST mag and for 1 of the form mag2 - JWST mag, where mag2 is
+        the input magnitude plus the input colour.  The transformed magnitude
+        is then the y value (plus the x value for yopt 1) minus the fitted
+        value.
+
+    dtype  :  numpy dtype
+
+        The type of the output array (float32 by default, as written out).
+
+    out  :  numpy array, optional
+
+        An N x K array to put the values in, instead of allocating one.
+
+Returns:
+
+    magnitudes  :  numpy array
+
+        The N x K array of transformed magnitudes, in the order of the
+        coefficient columns.
+
+    """
+    coefficients = numpy.asarray(coefficients,dtype=numpy.float64)
+    if coefficients.ndim == 1:
+        coefficients = coefficients[:,numpy.newaxis]
+    norder = coefficients.shape[0]-1
+    npoints = len(xvalues)
+    if out is None:
+        out = numpy.empty((npoints,coefficients.shape[1]),dtype=dtype)
+    for start in range(0,npoints,EVALUATION_BLOCK_SIZE):
+        end = min(start+EVALUATION_BLOCK_SIZE,npoints)
+        x = numpy.asarray(xvalues[start:end],dtype=numpy.float64)
+        y = numpy.asarray(yvalues[start:end],dtype=numpy.float64)
+        basis = legendre.legvander(numpy.clip(x,xmin,xmax),norder)
+        colours = numpy.dot(basis,coefficients)
+        if yopt == 0:
+            out[start:end,:] = y[:,numpy.newaxis]-colours
+        else:
+            out[start:end,:] = (y+x)[:,numpy.newaxis]-colours
+    return out
+
+
+# The default colour step of the lookup tables.  With the usual fit orders the
+# interpolation error is then well below the 1e-5 magnitude output precision.
+DEFAULT_TABLE_STEP = 0.001
+
+# The number of catalogue rows interpolated at a time in evaluate_lookup_table.
+TABLE_BLOCK_SIZE = 16384
+
+
+def build_lookup_table(coefficients,xmin,xmax,step=DEFAULT_TABLE_STEP):
+    """
+This routine tabulates the fitted transformations over the colour range they
+are used in, for evaluation by linear interpolation in evaluate_lookup_table
+instead of evaluating the polynomials.
+
+Parameters:
+
+    coefficients  :  numpy float array
+
+        The (norder+1) x K stack of fit coefficients, one column per target
+        filter.
+
+    xmin, xmax  :  floats
+
+        The colour range over which the fits are used (colours outside it are
+        clamped to it, as in evaluate_transformations).
+
+    step  :  float
+
+        The colour step of the table.
+
+Returns:
+
+    lookup_table  :  tuple
+
+        The tuple (table, xmin, xmax, step), where table is an M x 2K float32
+        array holding, for each of the M colour intervals, the K transformation
+        values at the start of the interval followed by the K changes of the
+        values over the interval.
+
+    """
+    coefficients = numpy.asarray(coefficients,dtype=numpy.float64)
+    if coefficients.ndim == 1:
+        coefficients = coefficients[:,numpy.newaxis]
+    nsteps = max(int(numpy.ceil((xmax-xmin)/step-1.e-9)),1)
+    xvalues = xmin+step*numpy.arange(nsteps+1)
+    values = numpy.dot(legendre.legvander(xvalues,coefficients.shape[0]-1),coefficients)
+    table = numpy.concatenate([values[0:-1,:],numpy.diff(values,axis=0)],axis=1).astype(numpy.float32)
+    return table,xmin,xmax,step
+
+
+def evaluate_lookup_table(xvalues,yvalues,lookup_table,yopt,dtype=numpy.float32,out=None):
+    """
+This routine applies the transformations to the input data by linear
+interpolation in a table from build_lookup_table.  The colour interval of each
+row is found by index arithmetic and the values of all the target filters are
+taken from the table at once.  The arithmetic is done in single precision.
+
+The parameters and the returned array are the same as for
+evaluate_transformations, except that the fits are given by lookup_table.
+    """
+    table,xmin,xmax,step = lookup_table
+    nfilters = table.shape[1]//2
+    npoints = len(xvalues)
+    if out is None:
+        out = numpy.empty((npoints,nfilters),dtype=dtype)
+    # small blocks keep the gathered table rows in the processor cache
+    for start in range(0,npoints,TABLE_BLOCK_SIZE):
+        end = min(start+TABLE_BLOCK_SIZE,npoints)
+        x = numpy.asarray(xvalues[start:end],dtype=numpy.float64)
+        position = numpy.clip(x,xmin,xmax)
+        position -= xmin
+        position *= 1./step
+        index = position.astype(numpy.intp)
+        numpy.minimum(index,table.shape[0]-1,out=index)
+        fraction = (position-index).astype(numpy.float32)
+        rows = numpy.take(table,index,axis=0)
+        colours = numpy.multiply(rows[:,nfilters:],fraction[:,numpy.newaxis])
+        colours += rows[:,0:nfilters]
+        if yopt == 0:
+            y = numpy.asarray(yvalues[start:end],dtype=numpy.float32)
+        else:
+            y = (numpy.asarray(yvalues[start:end],dtype=numpy.float64)+x).astype(numpy.float32)
+        numpy.subtract(y[:,numpy.newaxis],colours,out=out[start:end,:],casting='unsafe')
+    return out
+
+
+def lookup_table_error(coefficients,lookup_table,subdivisions=10):
+    """
+This routine returns the largest difference between the linear interpolation
+in a lookup table and the polynomial transformations it was made from, for
+each target filter.  The two are compared at subdivisions points in each
+interval of the table.
+
+Parameters:
+
+    coefficients  :  numpy float array
+
+        The (norder+1) x K stack of fit coefficients used for the table.
+
+    lookup_table  :  tuple
+
+        The table from build_lookup_table.
+
+    subdivisions  :  integer
+
+        The number of points compared in each interval.
+
+Returns:
+
+    errors  :  numpy float array
+
+        The maximum absolute interpolation error, in magnitudes, for each of
+        the K target filters.
+
+    """
+    table,xmin,xmax,step = lookup_table
+    coefficients = numpy.asarray(coefficients,dtype=numpy.float64)
+    if coefficients.ndim == 1:
+        coefficients = coefficients[:,numpy.newaxis]
+    xvalues = numpy.linspace(xmin,xmax,table.shape[0]*subdivisions+1)
+    exact = numpy.dot(legendre.legvander(xvalues,coefficients.shape[0]-1),coefficients)
+    interpolated = evaluate_lookup_table(xvalues,numpy.zeros(len(xvalues)),lookup_table,0,numpy.float64)
+    return numpy.max(numpy.abs(exact+interpolated),axis=0)
+
+
+def propagate_errors(xvalues,errors1,errors2,coefficients,xmin,xmax,yopt,weights,dtype=numpy.float32,out=None):
+    """
+This routine propagates the uncertainties of the two input catalogue columns
+through the transformations for all the target filters at once, to first
+order, in the same blocks of rows as evaluate_transformations.
+
+A transformed magnitude is J = y + yopt*x - f(x), with f the fitted
+polynomial of the (clamped) colour x and y the input magnitude.  x and y are
+each a sum of the two input columns a and b with weights of 0 or 1 (see
+magConGUI.makexy), so that
+
+    dJ/da = ya + (yopt - f'(x))*xa      dJ/db = yb + (yopt - f'(x))*xb
+
+where f' is the derivative of the fit (from legendre.legder), zero outside
+the range xmin to xmax where the colour is clamped.  The two columns are taken
+to be independent, so the error of J is the square root of the sum of the
+squares of the two terms.
+
+Parameters:
+
+    xvalues  :  numpy float array
+
+        The input colour values of length N.
+
+    errors1, errors2  :  numpy float arrays or None
+
+        The uncertainties of the two input columns, of length N, or None for
+        a column without uncertainties.
+
+    coefficients  :  numpy float array
+
+        The (norder+1) x K stack of fit coefficients, one column per target
+        filter.
+
+    xmin, xmax  :  floats
+
+        The colour range over which the fits are used.
+
+    yopt  :  integer
+
+        The y axis option, as for evaluate_transformations.
+
+    weights  :  tuple
+
+        The weights (xa, xb, ya, yb) of the two input columns in the colour
+        and the magnitude.
+
+    dtype  :  numpy dtype
+
+        The type of the output array.
+
+    out  :  numpy array, optional
+
+        An N x K array to put the values in, instead of allocating one.
+
+Returns:
+
+    errors  :  numpy array
+
+        The N x K array of uncertainties of the transformed magnitudes.
+
+    """
+    coefficients = numpy.asarray(coefficients,dtype=numpy.float64)
+    if coefficients.ndim == 1:
+        coefficients = coefficients[:,numpy.newaxis]
+    derivatives = legendre.legder(coefficients,axis=0)
+    xa,xb,ya,yb = weights
+    npoints = len(xvalues)
+    if out is None:
+        out = numpy.empty((npoints,coefficients.shape[1]),dtype=dtype)
+    for start in range(0,npoints,EVALUATION_BLOCK_SIZE):
+        end = min(start+EVALUATION_BLOCK_SIZE,npoints)
+        x = numpy.asarray(xvalues[start:end],dtype=numpy.float64)
+        basis = legendre.legvander(numpy.clip(x,xmin,xmax),derivatives.shape[0]-1)
+        slopes = numpy.dot(basis,derivatives)
+        slopes[(x < xmin) | (x > xmax),:] = 0.
+        # slopes becomes the derivative of J with respect to the colour
+        numpy.subtract(yopt,slopes,out=slopes)
+        variance = numpy.zeros(slopes.shape,dtype=numpy.float64)
+        for weight,offset,errors in [(xa,ya,errors1),(xb,yb,errors2)]:
+            if errors is None or (weight == 0 and offset == 0):
+                continue
+            term = slopes*weight
+            term += offset
+            term *= numpy.asarray(errors[start:end],dtype=numpy.float64)[:,numpy.newaxis]
+            term *= term
+            variance += term
+        numpy.sqrt(variance,out=variance)
+        out[start:end,:] = variance
+    return out
+
+
+# The number of equal colour bins over the fit range in which the deviations of
+# the model colours from each fit are summarized by binned_scatter.
+DEFAULT_SCATTER_BINS = 20
+
+
+def binned_scatter(xvalues,yvalues,coefficients,nbins=DEFAULT_SCATTER_BINS,vander=None):
+    """
+This routine calculates the RMS deviation of the model values from the fits
+in bins of the input colour, as a measure of the model scatter about each
+transformation as a function of colour.
+
+Parameters:
+
+    xvalues  :  numpy float array
+
+        The x values (the model input colour) of length M.
+
+    yvalues  :  numpy float array
+
+        The fitted y values, of length M or of size M x K.
+
+    coefficients  :  numpy float array
+
+        The fit coefficients as returned by legendre_fit.
+
+    nbins  :  integer
+
+        The number of bins, of equal width from the smallest to the largest x
+        value.
+
+    vander  :  numpy float array, optional
+
+        The Legendre Vandermonde matrix of xvalues, as for fit_residuals.
+
+Returns:
+
+    scatter  :  numpy float array
+
+        An array of size nbins x K (or nbins for one-dimensional y values)
+        holding the RMS deviation in each bin.  Bins without any model values
+        are given values interpolated from the neighbouring bins.
+
+    """
+    xvalues = numpy.asarray(xvalues,dtype=numpy.float64)
+    norder = coefficients.shape[0]-1
+    if vander is None:
+        vander = legendre.legvander(xvalues,norder)
+    deviations = numpy.dot(vander[:,0:norder+1],coefficients)-yvalues
+    single = deviations.ndim == 1
+    if single:
+        deviations = deviations[:,numpy.newaxis]
+    xmin = numpy.min(xvalues)
+    width = (numpy.max(xvalues)-xmin)/nbins
+    if width > 0.:
+        index = numpy.minimum(((xvalues-xmin)/width).astype(numpy.intp),nbins-1)
+    else:
+        index = numpy.zeros(len(xvalues),dtype=numpy.intp)
+    counts = numpy.bincount(index,minlength=nbins)
+    sums = numpy.zeros((nbins,deviations.shape[1]),dtype=numpy.float64)
+    numpy.add.at(sums,index,deviations*deviations)
+    filled = counts > 0
+    scatter = numpy.zeros(sums.shape,dtype=numpy.float64)
+    scatter[filled,:] = numpy.sqrt(sums[filled,:]/counts[filled,numpy.newaxis])
+    if not numpy.all(filled):
+        bins = numpy.arange(nbins)
+        for k in range(scatter.shape[1]):
+            scatter[~filled,k] = numpy.interp(bins[~filled],bins[filled],scatter[filled,k])
+    if single:
+        return scatter[:,0]
+    return scatter
+
+
+def evaluate_scatter(xvalues,scatter,xmin,xmax,dtype=numpy.float32,out=None):
+    """
+This routine gives each catalogue row the model scatter of each target
+filter at its colour, by linear interpolation between the centres of the bins
+from binned_scatter.  Colours beyond the centres of the first and last bins
+are given the values of those bins.  As in evaluate_lookup_table the bin of
+each row is found by index arithmetic and the values of all the filters are
+taken at once.
+
+Parameters:
+
+    xvalues  :  numpy float array
+
+        The input colour values of length N.
+
+    scatter  :  numpy float array
+
+        The nbins x K array of binned RMS deviations, one column per target
+        filter.
+
+    xmin, xmax  :  floats
+
+        The colour range of the bins (the range of the model colours).
+
+    dtype  :  numpy dtype
+
+        The type of the output array.
+
+    out  :  numpy array, optional
+
+        An N x K array to put the values in, instead of allocating one.
+
+Returns:
+
+    systematics  :  numpy array
+
+        The N x K array of the model scatter for each row and target filter.
+
+    """
+    scatter = numpy.asarray(scatter,dtype=numpy.float64)
+    if scatter.ndim == 1:
+        scatter = scatter[:,numpy.newaxis]
+    nbins,nfilters = scatter.shape
+    npoints = len(xvalues)
+    if out is None:
+        out = numpy.empty((npoints,nfilters),dtype=dtype)
+    if nbins == 1 or xmax <= xmin:
+        out[:,:] = numpy.mean(scatter,axis=0)
+        return out
+    table = numpy.concatenate([scatter[0:-1,:],numpy.diff(scatter,axis=0)],axis=1).astype(numpy.float32)
+    width = (xmax-xmin)/nbins
+    for start in range(0,npoints,TABLE_BLOCK_SIZE):
+        end = min(start+TABLE_BLOCK_SIZE,npoints)
+        position = numpy.asarray(xvalues[start:end],dtype=numpy.float64)-xmin
+        position *= 1./width
+        position -= 0.5
+        numpy.clip(position,0.,nbins-1,out=position)
+        index = numpy.minimum(position.astype(numpy.intp),nbins-2)
+        fraction = (position-index).astype(numpy.float32)
+        rows = numpy.take(table,index,axis=0)
+        values = numpy.multiply(rows[:,nfilters:],fraction[:,numpy.newaxis])
+        values += rows[:,0:nfilters]
+        out[start:end,:] = values
+    return out
@@ -0,0 +1,477 @@
+#! /usr/bin/env python
+#
+"""
+This module provides a compiled binary cache for the simulated magnitude
+files (magslist_*.new) that are read by jwst_magnitude_converter.py and
+magnitude_transform.py.
+
+Parsing the text grids with numpy.loadtxt dominates the run time of short
+batch conversions.  The first time a grid is read the magnitude values are
+written out as a column-major (Fortran order) .npy file together with a small
+JSON metadata file holding the filter labels, the filter parameters, the
+model parameters of each row (see grid_parameters.py), and the size,
+modification time, and SHA-1 hash of the text file.  Each build of the cache
+writes its values to a new .npy file named after a build id that is kept in
+the metadata, so the metadata always describes the values of its own build.
+Later reads open that .npy file with numpy memory mapping, so a run only
+touches the pages of the few filter columns that it actually uses.
+
+The cache files are written next to the text grid, which is either in the
+directory of the python code or in $SIMULATED_MAGNITUDES_PATH.  If that
+directory is not writable the variable $MAGNITUDE_GRID_CACHE_PATH can be set
+to some other directory.  When the text grid changes the cache is rebuilt
+automatically.  If the cache cannot be written at all the text grid is simply
+parsed as before.
+
+For a pool of worker processes the parent can read each grid once with
+share_grid and the workers use it through attach_grid, as read-only arrays in
+memory shared by all the processes.
+"""
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import uuid
+import numpy
+import grid_parameters
+
+# Increment this if the layout of the cache files changes, so that old cache
+# files are rebuilt rather than misread.
+CACHE_VERSION = 4
+
+
+def cache_directory(input_file_name):
+    """
+This routine returns the directory where cache files derived from a given
+text magnitude grid are kept: $MAGNITUDE_GRID_CACHE_PATH if it is set,
+otherwise the directory holding the grid itself.
+
+Parameters:
+
+    input_file_name  :  string
+
+        The name of the text grid file.
+
+Returns:
+
+    cache_path  :  string
+
+        The cache directory name.
+
+    """
+    try:
+        return os.environ['MAGNITUDE_GRID_CACHE_PATH']
+    except KeyError:
+        return os.path.dirname(os.path.abspath(input_file_name))
+
+
+def cache_file_names(input_file_name, metadata=None):
+    """
+This routine returns the names of the two cache files used for a given text
+magnitude grid file.
+
+Parameters:
+
+    input_file_name  :  string
+
+        The name of the text grid file, such as magslist_old_kurucz.new
+
+    metadata  :  dictionary or None
+
+        The cache metadata, whose build id names the .npy file.
+
+Returns:
+
+    data_file_name  :  string or None
+
+        The name of the .npy file holding the magnitude values of the build
+        of the metadata, or None if no metadata are given.
+
+    metadata_file_name  :  string
+
+        The name of the .json file holding the labels and the source file
+        properties.
+
+    """
+    root_name = os.path.join(cache_directory(input_file_name), os.path.basename(input_file_name))
+    data_file_name = None
+    if metadata is not None:
+        data_file_name = '%s.cache.%s.npy' % (root_name, metadata['build'])
+    return data_file_name, root_name+'.cache.json'
+
+
+def file_hash(input_file_name):
+    """
+This routine returns the SHA-1 hash of a file as a hexadecimal string.  It is
+used to decide whether a grid file has changed when the modification time
+alone is not conclusive, and as the content key for anything derived from a
+given grid.
+
+Parameters:
+
+    input_file_name  :  string
+
+        The name of the file to hash.
+
+Returns:
+
+    hash_value  :  string
+
+        The hexadecimal SHA-1 digest of the file contents.
+
+    """
+    hasher = hashlib.sha1()
+    with open(input_file_name, 'rb') as infile:
+        for block in iter(lambda: infile.read(1 << 20), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def parse_magnitude_list(input_file_name, number_of_filters):
+    """
+The code here reads in a "standard" magslist.out file from magnitudes.py.  The
+file is assumed to have a header listing the run parameters on lines 1 to 5,
+then a list of the filter properties line by line, followed by the grid of
+output magnitudes.  This is the plain text parser; normally one calls
+read_magnitude_list which uses the binary cache when it is up to date.
+
+Parameters:
+
+   input_file_name  :  string
+
+        The input ascii file name.
+
+   number_of_filters  :  integer
+
+        The number of filter magnitudes listed in the file.
+
+Returns:
+
+   model_magnitude_values  :  numpy float64 array
+
+      A two-dimensional array of model magnitude values, one row per model
+      and one column per filter.
+
+   model_magnitude_labels  :  list of strings
+
+       The list of names of the filters.
+
+   filter_parameters  :  numpy float32 array
+
+       An array of size `number_of_filters' x 3 with the filter effective
+       wavelength and zero magnitude flux density values.
+
+Any error in reading the file raises an exception.
+
+    """
+    model_magnitude_labels = []
+    filter_parameters = numpy.zeros((number_of_filters,3),dtype=numpy.float32)
+    with open(input_file_name,'r') as infile:
+        for i in range(5):
+            infile.readline()
+        for i in range(number_of_filters):
+            values = infile.readline().split()
+            label = ''.join(value+' ' for value in values[2:-3])
+            label = label.replace('filter','')
+            label = label.replace('Filter','')
+            model_magnitude_labels.append(label)
+            filter_parameters[i,0] = float(values[-3])
+            filter_parameters[i,1] = float(values[-2])
+            filter_parameters[i,2] = float(values[-1])
+    model_magnitude_values = numpy.loadtxt(input_file_name)
+    return model_magnitude_values,model_magnitude_labels,filter_parameters
+
+
+def _write_atomic(file_name, write_function):
+    """
+Write a file through a temporary file in the same directory followed by a
+rename, so that concurrent jobs never see a partially written cache file.
+    """
+    directory = os.path.dirname(file_name)
+    handle, temporary_name = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as outfile:
+            write_function(outfile)
+        os.replace(temporary_name, file_name)
+    except:
+        if os.path.exists(temporary_name):
+            os.remove(temporary_name)
+        raise
+
+
+def _read_metadata(metadata_file_name):
+    try:
+        with open(metadata_file_name, 'r') as infile:
+            return json.load(infile)
+    except (OSError, ValueError):
+        return None
+
+
+def build_grid_cache(input_file_name, number_of_filters):
+    """
+This routine parses a text magnitude grid and writes the binary cache files
+for it.
+
+Parameters:
+
+   input_file_name  :  string
+
+        The input ascii grid file name.
+
+   number_of_filters  :  integer
+
+        The number of filter magnitudes listed in the file.
+
+Returns:
+
+   metadata  :  dictionary
+
+        The metadata that was written to the .json cache file.
+
+Errors in writing the cache (for example a read-only directory) raise an
+OSError.
+
+    """
+    metadata_file_name = cache_file_names(input_file_name)[1]
+    if not os.access(os.path.dirname(metadata_file_name), os.W_OK):
+        raise OSError('Cannot write the grid cache for %s' % (input_file_name))
+    values, labels, filter_parameters = parse_magnitude_list(input_file_name, number_of_filters)
+    status = os.stat(input_file_name)
+    metadata = {'version': CACHE_VERSION,
+                'source': os.path.abspath(input_file_name),
+                'source_size': status.st_size,
+                'source_mtime': status.st_mtime_ns,
+                'source_sha1': file_hash(input_file_name),
+                'number_of_filters': number_of_filters,
+                'shape': list(values.shape),
+                'build': uuid.uuid4().hex,
+                'labels': labels,
+                'filter_parameters': filter_parameters.tolist(),
+                'model_parameters': grid_parameters.parse_grid_parameters(input_file_name).tolist()}
+    # the values are written before the metadata that names them, and the
+    # values of the earlier builds are then removed (a run that has them
+    # memory-mapped keeps them until it is done)
+    data_file_name = cache_file_names(input_file_name, metadata)[0]
+    _write_atomic(data_file_name, lambda outfile: numpy.save(outfile, numpy.asfortranarray(values)))
+    _write_atomic(metadata_file_name, lambda outfile: outfile.write(json.dumps(metadata).encode('utf-8')))
+    for file_name in glob.glob(glob.escape(metadata_file_name[:-5])+'*.npy'):
+        if file_name != data_file_name:
+            try:
+                os.remove(file_name)
+            except OSError:
+                pass
+    return metadata
+
+
+def grid_metadata(input_file_name, number_of_filters):
+    """
+This routine returns the cache metadata for a text grid, rebuilding the cache
+first if it is missing or stale.  The cache is stale if the version, the
+number of filters, or the source file differ from what was recorded.  A source
+file with a new modification time but the same hash is not re-parsed; only the
+recorded modification time is updated.
+
+Parameters:
+
+   input_file_name  :  string
+
+        The input ascii grid file name.
+
+   number_of_filters  :  integer
+
+        The number of filter magnitudes listed in the file.
+
+Returns:
+
+   metadata  :  dictionary
+
+        The cache metadata, including the `source_sha1' hash of the grid.
+
+    """
+    metadata_file_name = cache_file_names(input_file_name)[1]
+    metadata = _read_metadata(metadata_file_name)
+    if metadata is None or metadata.get('version') != CACHE_VERSION \
+       or not os.path.isfile(cache_file_names(input_file_name, metadata)[0]) \
+       or metadata.get('number_of_filters') != number_of_filters:
+        return build_grid_cache(input_file_name, number_of_filters)
+    status = os.stat(input_file_name)
+    if metadata['source_size'] != status.st_size:
+        return build_grid_cache(input_file_name, number_of_filters)
+    if metadata['source_mtime'] != status.st_mtime_ns:
+        if file_hash(input_file_name) != metadata['source_sha1']:
+            return build_grid_cache(input_file_name, number_of_filters)
+        metadata['source_mtime'] = status.st_mtime_ns
+        try:
+            _write_atomic(metadata_file_name, lambda outfile: outfile.write(json.dumps(metadata).encode('utf-8')))
+        except OSError:
+            pass
+    return metadata
+
+
+def read_magnitude_list(input_file_name, number_of_filters, use_cache=True):
+    """
+This routine returns the magnitude values, filter labels, and filter
+parameters for a text magnitude grid, using the binary cache where possible.
+
+Parameters:
+
+   input_file_name  :  string
+
+        The input ascii grid file name.
+
+   number_of_filters  :  integer
+
+        The number of filter magnitudes listed in the file.
+
+   use_cache  :  boolean
+
+        If False the text file is parsed directly and no cache is used.
+
+Returns:
+
+   model_magnitude_values  :  numpy float64 array (possibly a read-only memmap)
+
+      A two-dimensional array of model magnitude values, one row per model
+      and one column per filter, stored in column-major order.
+
+   model_magnitude_labels  :  list of strings
+
+       The list of names of the filters.
+
+   filter_parameters  :  numpy float32 array
+
+       An array of size `number_of_filters' x 3 with the filter effective
+       wavelength and zero magnitude flux density values.
+
+   metadata  :  dictionary or None
+
+       The cache metadata, or None if the cache could not be used.
+
+Errors in reading the text grid raise an exception.
+
+    """
+    if use_cache:
+        try:
+            metadata = grid_metadata(input_file_name, number_of_filters)
+            values = numpy.load(cache_file_names(input_file_name, metadata)[0], mmap_mode='r')
+            if list(values.shape) == metadata['shape']:
+                filter_parameters = numpy.asarray(metadata['filter_parameters'], dtype=numpy.float32)
+                return values, list(metadata['labels']), filter_parameters, metadata
+        except (OSError, ValueError):
+            pass
+    values, labels, filter_parameters = parse_magnitude_list(input_file_name, number_of_filters)
+    return values, labels, filter_parameters, None
+
+
+def read_model_parameters(input_file_name, metadata=None):
+    """
+This routine returns the model parameters (teff, logg, and [M/H]) of the
+rows of a text magnitude grid as an N x 3 array (see
+grid_parameters.parse_grid_parameters), from the cache metadata returned by
+read_magnitude_list if it is given, otherwise from the text file.
+    """
+    if metadata is not None and 'model_parameters' in metadata:
+        return numpy.array(metadata['model_parameters'], dtype=numpy.float64).reshape(
+            -1, len(grid_parameters.parameter_names))
+    return grid_parameters.parse_grid_parameters(input_file_name)
+
+
+def share_grid(input_file_name, number_of_filters, use_cache=True):
+    """
+This routine reads a grid once in a parent process so that worker processes
+can use it without reading it again.  If the binary cache is up to date the
+workers simply memory-map the cache file, which the operating system shares
+between all the processes.  Otherwise the values are copied into a block of
+shared memory (multiprocessing.shared_memory) that the workers attach to.
+
+Parameters:
+
+   input_file_name  :  string
+
+        The input ascii grid file name.
+
+   number_of_filters  :  integer
+
+        The number of filter magnitudes listed in the file.
+
+   use_cache  :  boolean
+
+        If False the shared memory is used even if the cache is up to date.
+
+Returns:
+
+   descriptor  :  dictionary
+
+        A small (picklable) description of the shared grid to pass to
+        attach_grid in the worker processes.
+
+   shared_memory  :  multiprocessing.shared_memory.SharedMemory or None
+
+        The shared memory block, if one was used.  The parent process has to
+        close and unlink it once the workers are done.
+
+    """
+    values, labels, filter_parameters, metadata = read_magnitude_list(
+        input_file_name, number_of_filters, use_cache)
+    status = os.stat(input_file_name)
+    descriptor = {'source': os.path.abspath(input_file_name),
+                  'number_of_filters': number_of_filters,
+                  'source_status': (status.st_size, status.st_mtime_ns),
+                  'shape': list(values.shape),
+                  'labels': labels,
+                  'filter_parameters': filter_parameters.tolist(),
+                  'model_parameters': read_model_parameters(input_file_name, metadata).tolist()}
+    if metadata is not None:
+        descriptor['source_sha1'] = metadata['source_sha1']
+        descriptor['cache_file'] = cache_file_names(input_file_name, metadata)[0]
+        return descriptor, None
+    from multiprocessing import shared_memory
+    descriptor['source_sha1'] = file_hash(input_file_name)
+    memory = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    shared_values = numpy.ndarray(values.shape, dtype=numpy.float64, buffer=memory.buf, order='F')
+    shared_values[...] = values
+    descriptor['shared_memory'] = memory.name
+    return descriptor, memory
+
+
+def attach_grid(descriptor):
+    """
+This routine gives a worker process a read-only view of a grid shared by
+share_grid, without copying the values.
+
+Parameters:
+
+   descriptor  :  dictionary
+
+        The grid description from share_grid.
+
+Returns:
+
+   model_magnitude_values  :  numpy float64 array
+
+      The read-only (column-major) array of the model magnitude values.
+
+   model_magnitude_labels  :  list of strings
+
+       The list of names of the filters.
+
+   filter_parameters  :  numpy float32 array
+
+       The filter wavelength and zero magnitude values.
+
+   shared_memory  :  multiprocessing.shared_memory.SharedMemory or None
+
+       The attached shared memory block (or None for a memory-mapped cache
+       file), which must be kept as long as the values are used.
+
+    """
+    filter_parameters = numpy.asarray(descriptor['filter_parameters'], dtype=numpy.float32)
+    if 'cache_file' in descriptor:
+        values = numpy.load(descriptor['cache_file'], mmap_mode='r')
+        return values, list(descriptor['labels']), filter_parameters, None
+    from multiprocessing import shared_memory
+    memory = shared_memory.SharedMemory(name=descriptor['shared_memory'])
+    values = numpy.ndarray(tuple(descriptor['shape']), dtype=numpy.float64, buffer=memory.buf, order='F')
+    values.flags.writeable = False
+    return values, list(descriptor['labels']), filter_parameters, memory
@@ -0,0 +1,258 @@
+#! /usr/bin/env python
+#
+"""
+This module provides the selection of the rows of the simulated magnitude
+grids (magslist_*.new) by the parameters of the model atmospheres, so that
+the transformations can be fitted to the models of one kind of star only,
+such as metal-poor giants, rather than to the whole grid.
+
+Each row of a grid ends with a comment naming the model and its parameters,
+such as
+
+    # Old Kurucz model T = 10000.0 log(g) = 2.00000 z = 0.00
+    # Phoenix grid T=02300 K log(g)=0.00
+    # Blackbody T = 1000.000
+
+from which the effective temperature (teff), the surface gravity (logg), and
+the metallicity ([M/H]) of the row are taken by parse_grid_parameters; a
+parameter that a grid does not give (such as logg for the blackbodies) is
+NaN.  The values are saved in the binary grid cache (see grid_cache.py).  A
+ParameterIndex holds the rows sorted by each parameter, so a condition on a
+parameter is a binary search rather than a pass over the grid.
+
+A selection is written as a list of conditions separated by commas, all of
+which a row must meet, as in "teff=3500..6000, logg<3, [M/H]<-1":
+
+    name=a..b     a <= value <= b
+    name=a        value == a
+    name<a, name<=a, name>a, name>=a
+
+The parameter names are teff (or T), logg (or log(g)), and [M/H] (or M/H,
+[Fe/H], or z), in any case.
+"""
+import re
+import numpy
+
+# The parameters of the grid models, in the column order of the parameter
+# arrays.
+parameter_names = ['teff', 'logg', '[M/H]']
+
+# The names accepted for each parameter, in lower case, both in the grid row
+# comments and in selections.
+parameter_aliases = {'teff': 'teff', 't': 'teff',
+                     'logg': 'logg', 'log(g)': 'logg', 'log g': 'logg',
+                     '[m/h]': '[M/H]', 'm/h': '[M/H]', '[fe/h]': '[M/H]', 'fe/h': '[M/H]', 'z': '[M/H]'}
+
+_number = r'[-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?'
+
+_comment_pattern = re.compile(r'(?<![\w\[/])(teff|t|log\s*\(g\)|logg|z|\[m/h\]|\[fe/h\])\s*=\s*(%s)' % (_number),
+                              re.IGNORECASE)
+
+_condition_pattern = re.compile(r'^\s*(\[?[a-z/]+\]?|log\s*\(g\)|log g)\s*(<=|>=|<|>|=)\s*(%s)'
+                                r'(?:\s*\.\.\s*(%s))?\s*$' % (_number, _number), re.IGNORECASE)
+
+
+def parameter_name(name):
+    """
+Return the name of a parameter (one of parameter_names) for any of the names
+in parameter_aliases, or raise a ValueError.
+    """
+    key = ' '.join(name.lower().split())
+    if key.replace(' ', '') in parameter_aliases:
+        key = key.replace(' ', '')
+    if key not in parameter_aliases:
+        raise ValueError('Unknown model parameter %s; the parameters are %s.' %
+                         (name, ', '.join(parameter_names)))
+    return parameter_aliases[key]
+
+
+def parse_row_parameters(comment):
+    """
+This routine returns the teff, logg, and [M/H] values given in the comment
+at the end of a grid row, NaN for those it does not give.
+    """
+    values = [numpy.nan]*len(parameter_names)
+    for name, value in _comment_pattern.findall(comment):
+        values[parameter_names.index(parameter_name(name))] = float(value)
+    return values
+
+
+def parse_grid_parameters(input_file_name):
+    """
+This routine reads the model parameters of the rows of a text magnitude grid.
+
+Parameters:
+
+    input_file_name  :  string
+
+        The grid file name.
+
+Returns:
+
+    parameters  :  numpy float64 array
+
+        The N x 3 array of the teff, logg, and [M/H] values of the N grid
+        rows, in the order of the rows of the magnitude values (NaN where a
+        row does not give a value).
+
+    """
+    parameters = []
+    with open(input_file_name, 'r') as infile:
+        for line in infile:
+            values, mark, comment = line.partition('#')
+            # rows are those that numpy.loadtxt reads: lines with values
+            if len(values.split()) == 0:
+                continue
+            parameters.append(parse_row_parameters(comment))
+    return numpy.array(parameters, dtype=numpy.float64).reshape(-1, len(parameter_names))
+
+
+def parse_selection(selection):
+    """
+This routine reads a selection of grid rows.
+
+Parameters:
+
+    selection  :  string, list of strings, or None
+
+        The conditions, separated by commas or as a list (as a configobj
+        file gives them), such as "teff=3500..6000, logg<3, [M/H]<-1".  None,
+        an empty string, "all", or "none" select all the rows.
+
+Returns:
+
+    conditions  :  list of tuples
+
+        For each condition the parameter name, the lower and upper limits
+        (None if there is none), and whether each limit is included.
+
+A condition that cannot be read raises a ValueError.
+
+    """
+    if selection is None:
+        return []
+    if not isinstance(selection, str):
+        selection = ','.join(selection)
+    if selection.strip().lower() in ['', 'all', 'none']:
+        return []
+    conditions = []
+    for term in selection.split(','):
+        if len(term.strip()) == 0:
+            continue
+        match = _condition_pattern.match(term)
+        if match is None:
+            raise ValueError('Cannot read the grid selection condition "%s".' % (term.strip()))
+        name, operator, value, upper = match.groups()
+        name = parameter_name(name)
+        value = float(value)
+        if upper is not None:
+            if operator != '=':
+                raise ValueError('Cannot read the grid selection condition "%s".' % (term.strip()))
+            conditions.append((name, value, float(upper), True, True))
+        elif operator == '=':
+            conditions.append((name, value, value, True, True))
+        elif operator[0] == '<':
+            conditions.append((name, None, value, False, operator == '<='))
+        else:
+            conditions.append((name, value, None, operator == '>=', False))
+    return conditions
+
+
+def selection_key(conditions):
+    """
+Return a string that identifies a selection (a list of conditions from
+parse_selection) for the fit caches: the same for selections that differ
+only in the order or spelling of the conditions, and empty for all the rows.
+    """
+    terms = []
+    for name, low, high, include_low, include_high in conditions:
+        terms.append('%s:%s%s,%s%s' % (name, '[' if include_low else '(', '' if low is None else repr(low),
+                                       '' if high is None else repr(high), ']' if include_high else ')'))
+    return ' '.join(sorted(set(terms)))
+
+
+class ParameterIndex():
+    """
+This class holds the rows of a grid sorted by each model parameter, to find
+the rows that meet a selection.
+    """
+    def __init__(self, parameters, grid_name=None):
+        """
+Make the index for a grid.
+
+Parameters:
+
+    parameters  :  numpy float array
+
+        The N x 3 teff, logg, and [M/H] values of the grid rows, from
+        parse_grid_parameters.
+
+    grid_name  :  string or None
+
+        A name for the grid (such as the model set) used in error messages.
+        """
+        self.parameters = numpy.asarray(parameters, dtype=numpy.float64).reshape(-1, len(parameter_names))
+        self.grid_name = grid_name
+        # NaN values are sorted to the end, after the counts of known values.
+        self.order = numpy.argsort(self.parameters, axis=0, kind='stable')
+        self.sorted_values = numpy.take_along_axis(self.parameters, self.order, axis=0)
+        self.counts = numpy.sum(~numpy.isnan(self.parameters), axis=0)
+
+    def __len__(self):
+        return len(self.parameters)
+
+    def grid_description(self):
+        if self.grid_name is None:
+            return 'the grid'
+        return 'the %s model set' % (self.grid_name)
+
+    def condition_rows(self, condition):
+        """
+Return the rows that meet one condition (from parse_selection), in order of
+the parameter value.
+        """
+        name, low, high, include_low, include_high = condition
+        column = parameter_names.index(name)
+        count = self.counts[column]
+        if count == 0:
+            raise ValueError('The models of %s have no %s values.' % (self.grid_description(), name))
+        values = self.sorted_values[0:count, column]
+        start = 0
+        end = count
+        if low is not None:
+            start = numpy.searchsorted(values, low, 'left' if include_low else 'right')
+        if high is not None:
+            end = numpy.searchsorted(values, high, 'right' if include_high else 'left')
+        return self.order[start:max(start, end), column]
+
+    def select(self, conditions):
+        """
+Return the rows of the grid that meet all of a list of conditions (from
+parse_selection) in grid order, or None for all the rows if there are no
+conditions.  A selection that no row meets raises a ValueError.
+        """
+        if len(conditions) == 0:
+            return None
+        # the row ranges of the conditions are intersected from the shortest
+        found = sorted([self.condition_rows(x) for x in conditions], key=len)
+        rows = numpy.sort(found[0])
+        for values in found[1:]:
+            rows = numpy.intersect1d(rows, values, assume_unique=True)
+        if len(rows) == 0:
+            raise ValueError('None of the models of %s meet the selection.' % (self.grid_description()))
+        return rows
+
+    def ranges(self):
+        """
+Return the smallest and largest value of each parameter in the grid, as a
+dictionary of (min, max) tuples, (NaN, NaN) for a parameter not given.
+        """
+        values = {}
+        for n in range(len(parameter_names)):
+            count = self.counts[n]
+            if count == 0:
+                values[parameter_names[n]] = (numpy.nan, numpy.nan)
+            else:
+                values[parameter_names[n]] = (float(self.sorted_values[0, n]),
+                                              float(self.sorted_values[count-1, n]))
+        return values
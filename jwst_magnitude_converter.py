@@ -10,41 +10,170 @@ To use the code non-interactively one has to specify parameters in a configobj
 file.  See the example file hst_to_nis.cfg for an example.  The magnitude 
 names and other parameters are specified in parameter=value pairs in the file 
 whereupon the code can produce an output file without bringing up the interface. 
-Note that if the non-interactive calculation fails there is no indication of 
-why it fails.
+Note that if the non-interactive calculation fails there is often no 
+indication of why it fails.
+
+The output JWST filters are given either as jwst1 and jwst2 in the 
+Output_Filter_Values section, or as a list in the parameter jwstfilters, such
+as "jwstfilters = NIRISS F200W, NIRISS F277W".  A list entry "all NIRISS" (or
+"all NIRCam", "all MIRI", ...) stands for all the filters of that instrument
+and "all" for all the JWST filters.  The input data are read once and all the 
+filters are written to the one output file.
+
+Filter names must match a filter of the model set exactly, apart from case,
+spacing, and underscores for spaces (as in HST_ACS_F814W); some short forms
+such as "ACS F814W" are also accepted (see filter_index.py).  If a name cannot
+be matched the closest filter names are printed.
+
+The transformation fits are saved in a cache (see fit_cache.py) so repeated
+runs with the same filters do not redo them.  The optional parameter fitcache
+in the Output_Filter_Values section gives the cache file to use, or "none" to
+turn the cache off.
+
+The transformations are normally fitted to all the models of the model set.
+The optional parameter selection in the Output_Filter_Values section limits
+the fits to the models whose parameters meet a list of conditions, as in
+"selection = teff=3500..6000, logg<3" (see grid_parameters.py for the form of
+the conditions); the model parameters are read from the grid rows, and the
+fits for each selection are cached separately.
+
+The transformations are normally evaluated as the fitted Legendre polynomials.
+With the optional parameter "engine = lut" in the Output_Filter_Values 
+section they are instead interpolated in a table of the fits, which is faster
+for large catalogues; the colour step of the table is set by the parameter 
+lutstep (0.001 by default) and the largest interpolation error is printed.
+
+For catalogues too large to hold in memory, the optional parameter chunksize
+in the Input_Magnitude_Parameters section (or the --chunksize option on the 
+command line) makes the code read, convert, and write the catalogue that many 
+rows at a time.  The output file is the same as without it.  The chunks are 
+read, converted, and written by separate threads at the same time, with at 
+most queuedepth chunks (in Input_Magnitude_Parameters or --queuedepth, 2 by 
+default) waiting between the stages; the time each stage was busy and idle 
+is printed at the end.
+
+The optional parameters error1column and error2column in the 
+Input_Magnitude_Parameters section give the columns of the uncertainties of 
+the two input values.  These are propagated through the transformations 
+using the derivatives of the fits, and the uncertainties of the transformed 
+magnitudes are written out after the magnitudes, one column per filter.
+With "systematics = yes" in the Output_Filter_Values section a systematic 
+uncertainty is written for each filter as well: the RMS deviation of the 
+model values from the fit, found in 20 colour bins when the fit is made (and 
+saved in the fit cache with it), interpolated to the colour of each star.
+
+The catalogue values are converted without making copies of them, so the 
+memory used is about that of the catalogue columns and the output values.  
+With "computetype = float32" in the Input_Magnitude_Parameters section the 
+magnitudes are read and converted in single precision, which halves the 
+memory used for them; the input colour and magnitude written out may then 
+differ from the double precision values in the last decimal place.
+
+With "profile = yes" in the Output_Filter_Values section (or the --profile 
+option) the wall clock time, processor time, and peak memory of each stage of
+the run (grid load, catalogue read, makexy, fitting, evaluation, output write,
+and plotting), the number of rows, and the number of rows with colours outside
+the fit range are written to a JSON file named after the output file, such as
+output_profile.json for output.txt (see profiler.py).  This is also done when
+the run fails, with the stage that failed.
+
+FITS table input files are memory-mapped and only the magnitude and RA/Dec 
+columns are read.  The optional parameters firstrow and lastrow (counting from
+1) in the Input_Magnitude_Parameters section limit the conversion to those 
+rows of a FITS table.  With "outputformat = fits" in the Output_Filter_Values
+section, or an output file name ending in .fits, the output is written as a 
+FITS binary table with the same columns as the text output, the transformed 
+magnitudes as single precision values.
+
+Plots of the transformations are only made if the optional parameter plots in
+the Output_Filter_Values section (or the --plots option) is "yes", or
+"background" to make them in a separate process so that the run is not held
+up by them.  They are written to the directory plotdirectory (--plotdir, by 
+default the current directory) with names from the template plotname, by
+default "transformation_{xlabel}_to_{ylabel}_minus_{filter}_{modelset}.png"
+where the fields are the input colour and magnitude, the JWST filter, the model
+set, and also {output} for the output file name without the extension.
+
+Many cfg files can be run at once as a batch, as in
+
+  python jwst_magnitude_converter.py --workers 8 field1/*.cfg
+
+which runs the conversions on a pool of 8 processes (--workers 0 uses one
+process per processor).  A failed conversion does not stop the others, and 
+the result of each job is printed.  The exit status is 1 if any of the jobs 
+failed.  The model grids are read once before the workers start and are
+shared by all of them, through the memory-mapped grid cache or otherwise 
+through shared memory.
+
+For pipelines that ask for conversions throughout the day the program can 
+instead be left running as a local service,
+
+  python jwst_magnitude_converter.py --serve 8765
+  python jwst_magnitude_converter.py --serve unix:/tmp/magnitudes.sock
+
+which keeps the model grids and the fits in memory and takes conversion 
+requests over HTTP on a localhost port or a Unix socket, for arrays of 
+magnitudes or for catalogue files with the cfg file parameters.  The files 
+of the catalogue conversions must be in the directory given with --workdir 
+(by default the current directory).  The other options given (such as 
+--chunksize) apply to the catalogue conversions.  See conversion_service.py 
+for the requests.
 
 """
 
-from __future__ import print_function
-from __future__ import division
-import matplotlib 
-matplotlib.use('TkAgg')
-import matplotlib.pyplot as pyplot
 import math
 import numpy 
 import numpy.polynomial.legendre as legendre
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.figure import Figure
-import astropy.io.fits as fits
 from configobj import ConfigObj
 import sys, os
+import grid_cache
+import fit_cache
+import fit_engine
+import catalog_io
+import filter_index
+import grid_parameters
+import pipeline
+import profiler
+
+# The Tk interface and matplotlib modules take a good fraction of a second to
+# import, and the TkAgg backend needs a display, so they are only imported
+# when they are needed: importGUI is called before the interface is made, and
+# batchPlotter when the non-interactive transformation plots are made.  
+# astropy.io.fits is likewise only imported (in catalog_io) to read or write FITS
+# files.
+Tk=None
 
-if sys.version_info[0] == 2:
-    import Tkinter as Tk
-    import ttk 
-    from ScrolledText import ScrolledText
-    import tkFileDialog
-    import tkMessageBox
-    import tkColorChooser
-elif sys.version_info[0] == 3:
-    import tkinter as Tk
-    import tkinter.ttk as ttk
-    from tkinter.scrolledtext import ScrolledText
-    import tkinter.filedialog as tkFileDialog
-    from tkinter.messagebox import Message as tkMessageBox
-    from tkinter.colorchooser import Chooser as tkColorChooser
-
-path = os.path.dirname(__file__)
+def importGUI():
+  global matplotlib,pyplot,FigureCanvasTkAgg,Figure
+  global Tk,ttk,ScrolledText,tkFileDialog,tkMessageBox,tkColorChooser
+  import matplotlib 
+  matplotlib.use('TkAgg')
+  import matplotlib.pyplot as pyplot
+  from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+  from matplotlib.figure import Figure
+  import tkinter as Tk
+  import tkinter.ttk as ttk
+  from tkinter.scrolledtext import ScrolledText
+  import tkinter.filedialog as tkFileDialog
+  from tkinter.messagebox import Message as tkMessageBox
+  from tkinter.colorchooser import Chooser as tkColorChooser
+
+def batchPlotter():
+# Returns matplotlib.pyplot for writing plots to files, using the Agg backend
+# (which needs no display) unless the interface has already set up TkAgg.
+  import matplotlib
+  if Tk is None:
+    matplotlib.use('Agg')
+  import matplotlib.pyplot as pyplot
+  return pyplot
+
+# The simulated magnitude grids are read from $SIMULATED_MAGNITUDES_PATH if it
+# is set, otherwise from the directory of this code.  The binary grid caches
+# (see grid_cache.py) are written next to them.
+try:
+  path=os.environ['SIMULATED_MAGNITUDES_PATH']
+except KeyError:
+  path=os.path.dirname(os.path.abspath(__file__))
 kuruczfilternames=["Sloan u  ","Sloan g  ","Sloan r  ","Sloan i  ",
 "Sloan z  ","Bessel U  ","Bessel B  ","Bessel V  ",
 "Bessel/Cousins R  ","Bessel/Cousins I  ","Johnson U  ",
@@ -94,7 +223,7 @@ phoenixfilternames=['Sloan u ','Sloan g ','Sloan r ','Sloan i ','Sloan z ',
 'HST WFC3 F390W ','HST WFC3 F438W ','HST WFC3 F475W ','HST WFC3 F555W ',
 'HST WFC3 F606W ','HST WFC3 F625W ','HST WFC3 F775W ','HST WFC3 F814W ',
 'HST WFC3 F105W ','HST WFC3 F110W ','HST WFC3 F125W ','HST WFC3 F140W ',
-'HST WFC3 F160W '
+'HST WFC3 F160W ',
 "NIRCam F070W ","NIRCam F090W ","NIRCam F115W ","NIRCam F140M ",
 "NIRCam F150W ","NIRCam F150W2 ","NIRCam F162M ","NIRCam F164N ",
 "NIRCam F182M ","NIRCam F187M ","NIRCam F200W ","NIRCam F210M ",
@@ -125,6 +254,37 @@ jwstnames=["NIRISS F090W ","NIRISS F115W ","NIRISS F140M ","NIRISS F150W ",
 'NIRSpec F110W', 'NIRSpec F140X', 'NIRSpec Clear',
 'NIRSpec F070LP','NIRSpec F100LP','NIRSpec F170LP', 'NIRSpec F290LP']
 
+# The instrument names of the JWST filters, as at the start of the filter names
+jwstinstruments=filter_index.jwst_instruments
+
+# The names of the model sets, indexed by the set option value
+modelSetNames=['Kurucz','Phoenix','blackbody','BOSZ']
+
+# The model grids and fit caches that have been opened by this process, see 
+# magConGUI.readMagslist and magConGUI.getFitCache.
+gridStore={}
+fitCacheStore={}
+sharedGrids=[]
+
+# The default file name template of the transformation plots from
+# autoTransform (see magConGUI.transformationPlots).
+defaultPlotName='transformation_{xlabel}_to_{ylabel}_minus_{filter}_{modelset}.png'
+
+def renderPlots(plotlist):
+# Writes out the transformation plots from magConGUI.transformationPlots.  This
+# is a separate function so that it can be run in a background process.
+  pyplot=batchPlotter()
+  for xdata,ydata,xmodel,ymodel,xlabel,ylabel,figname in plotlist:
+    directory=os.path.dirname(figname)
+    if directory != '' and not os.path.isdir(directory):
+      os.makedirs(directory)
+    pyplot.plot(xdata,ydata,'o',markersize=1.,color='red')
+    pyplot.plot(xmodel,ymodel,color='cyan')
+    pyplot.xlabel(xlabel)
+    pyplot.ylabel(ylabel)
+    pyplot.savefig(figname)
+    pyplot.close()
+
 class magConGUI():
   def __init__(self,parent=None,**args):
     self.haveData=False
@@ -146,17 +306,85 @@ class magConGUI():
     self.plotLimits=numpy.zeros((4,3),dtype=numpy.float32)
 # for each plot, xmin, xmax, ymin, ymax data values saved here...
     self.dataLimits=numpy.zeros((4,3),dtype=numpy.float32)
-# self.fitResults will hold the fit parameters for from 1 to 59 JWST filters for the
-# different instruments (12 NIRISS, 2 Guider, 29 NIRCam, 9 MIRI, 7 NIRSpec)
-    self.fitResults=[None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None]
+# self.fitResults will hold the fit parameters for the target filters, by 
+# model grid column (the 59 JWST filters for the different instruments, 12 
+# NIRISS, 2 Guider, 29 NIRCam, 9 MIRI, 7 NIRSpec, or any other grid filter); 
+# doFit sizes it from the number of grid columns
+    self.fitResults=[]
+# self.fitScatter holds, for the same filters, the RMS deviations of the model
+# values from the fits in colour bins (see fit_engine.binned_scatter)
+    self.fitScatter=[]
 # self.fitRange holds the colour range of validity of the fitting
     self.fitRange=numpy.zeros((2),dtype=numpy.float32)
+# self.gridSignatures holds the (grid file name, SHA-1 hash) of each model set
+# as it is read in, indexed by the set option value; these identify the grid in
+# the fit cache.  self.fitCacheFile is the fit cache database to use (None for
+# the default one next to the grids, 'none' to not cache the fits).
+    self.gridSignatures=[None,None,None,None]
+# self.filterIndexes holds the filter name index of each model set (see 
+# filter_index.py), and self.filterErrors the reasons that names given to 
+# matchFilter or matchTargets could not be matched.
+    self.filterIndexes=[None,None,None,None]
+    self.filterErrors=[]
+    self.fitCache=None
+    self.fitCacheFile=None
+# self.engine is 'legendre' to evaluate the fit polynomials for the data or 
+# 'lut' to interpolate in a table of the fits with colour step self.lutStep;
+# self.lookupTable holds the current table and the fits it was made from.
+    self.engine='legendre'
+    self.lutStep=fit_engine.DEFAULT_TABLE_STEP
+    self.lookupTable=None
+# self.outputFormat is 'text' or 'fits' for a FITS binary table output file; 
+# self.rowRange is the (first, end) rows of a FITS input table to convert, or
+# None for all of them.
+    self.outputFormat='text'
+    self.rowRange=None
+# self.queueDepth is the number of chunks held between the read, convert, and
+# write stages of a chunked conversion (0 to run them one after the other), 
+# and self.pipelineStages the timing of the stages of the last one.
+    self.queueDepth=pipeline.DEFAULT_QUEUE_DEPTH
+    self.pipelineStages=None
+# self.computeType is the type of the catalogue values in a non-interactive 
+# conversion: numpy.float64, numpy.float32 to use half the memory, or None for
+# the type of the input (float64 for ascii tables, the column type for FITS).
+    self.computeType=None
+# self.errorIndexes is the pair of (0-based) columns of the uncertainties of 
+# the two input values of a non-interactive conversion (-1 for a value without
+# one), or None.  self.magErrors then holds the uncertainties of the current 
+# data, self.errorWeights the weights from makexyWeights, and self.jwstErrors 
+# the propagated uncertainties with one column per target filter.
+    self.errorIndexes=None
+    self.errorWeights=None
+    self.magErrors=None
+    self.jwstErrors=None
+# If self.systematics is True the model scatter about the fits at the colour 
+# of each data point is put in self.jwstSystematics, one column per target 
+# filter, and written out as a systematic uncertainty.
+    self.systematics=False
+    self.jwstSystematics=None
+# self.profile is a profiler.RunProfile recording the stages of a 
+# non-interactive run when it is profiled, otherwise None.
+    self.profile=None
+# self.parameterIndexes holds the index of the model parameters (teff, logg, 
+# and [M/H]) of the rows of each model set (see grid_parameters.py), and 
+# self.gridSelection the conditions on them that the grid rows used in the 
+# fits must meet (from grid_parameters.parse_selection; empty for all rows).
+    self.parameterIndexes=[None,None,None,None]
+    self.gridSelection=[]
+# self.log is the stream the messages of a non-interactive run are printed to
+# (None for sys.stdout), and self.outputPath the file the output is written 
+# to if not the outfilename of the cfg file (runJob writes a temporary file 
+# that replaces outfilename once the conversion is done).
+    self.log=None
+    self.outputPath=None
 
   def runGUI(self,root):
     if root is None:
       pass
     else:
 #      root.__init__(self,parent,args)
+      if Tk is None:
+        importGUI()
       self.makeWidgets(root)
 #      self.pack(expand=Tk.YES,fill=Tk.BOTH)
     
@@ -341,7 +569,7 @@ class magConGUI():
     if not self.haveData:
       return
     outfilename=tkFileDialog.asksaveasfilename(filetypes=[('data files','*.data'),('data files','*.dat'),('data files','*.txt'),('data files','*.tbl'),('All files','*')])
-    if isinstance(outfilename,basestring):
+    if isinstance(outfilename,str):
       self.writeMags(outfilename)
 
   def writeMags(self,outfilename):
@@ -350,86 +578,113 @@ class magConGUI():
     except:
       self.putMessage('Error: no transformed values to write out',self.messageText)
       return
+    if self.outputFormat == 'fits':
+      outfile=self.openFitsOutput(outfilename)
+      outfile.write(self.outputColumns())
+      outfile.close()
+      return
     outfile=open(outfilename,'w')
+    self.writeMagsHeader(outfile)
+    self.writeMagsRows(outfile)
+    outfile.close()
+
+  def outputColumns(self,chunk=None):
+# Returns the list of output columns: the input colour and magnitude, the 
+# transformed magnitudes, their uncertainties and systematic uncertainties and
+# the RA and Dec values if there are any.  These are for the current data, or 
+# for chunk, a tuple of the colours, magnitudes, transformed magnitudes, RA, 
+# Dec, uncertainty, and systematic uncertainty values of a part of the 
+# catalogue.
+    if chunk is None:
+      chunk=(self.xdata[0],self.ydata[0],self.jwstMags,self.ravalues,self.decvalues,self.jwstErrors,
+             self.jwstSystematics)
+    xdata,ydata,jwstMags,ravalues,decvalues,jwstErrors,jwstSystematics=chunk
+    columns=[xdata,ydata]+[jwstMags[:,k] for k in range(jwstMags.shape[1])]
+    for values in [jwstErrors,jwstSystematics]:
+      if not values is None:
+        columns=columns+[values[:,k] for k in range(values.shape[1])]
+    if not ravalues is None:
+      columns=columns+[ravalues,decvalues]
+    return columns
+
+  def openFitsOutput(self,outfilename,chunk=None):
+# Opens a FITS binary table output file (see catalog_io.FitsTableWriter) with 
+# the same columns as the text output, the transformed magnitudes being 
+# written as single precision values.
+    labels=[self.xlabel[0],self.ylabel[0]]+[x.strip() for x in self.jwstColumnLabels]
+    if not self.jwstErrors is None:
+      labels=labels+[x.strip()+' error' for x in self.jwstColumnLabels]
+    if not self.jwstSystematics is None:
+      labels=labels+[x.strip()+' systematic' for x in self.jwstColumnLabels]
+    units=['mag']*len(labels)
+    if not self.ravalues is None:
+      labels=labels+['RA','Dec']
+      units=units+[None,None]
+    dtypes=[numpy.asarray(x).dtype for x in self.outputColumns(chunk)]
+    return catalog_io.FitsTableWriter(outfilename,labels,dtypes,units)
+
+  def writeMagsHeader(self,outfile):
     s1='# %s | %s ' % (self.xlabel[0],self.ylabel[0])
-    nout=[]
-    for n in range(59):
-      values=self.jwstMags[:,n]
-      amin=numpy.min(values)
-      amax=numpy.max(values)
-      dela=amax-amin
-      if dela > 0.:
-        s1=s1+' | '+jwstnames[n]
-        nout.append(n)
+    nout=self.jwstColumns
+    for n in range(len(nout)):
+      s1=s1+' | '+self.jwstColumnLabels[n]
+    if not self.jwstErrors is None:
+      for n in range(len(nout)):
+        s1=s1+' | '+self.jwstColumnLabels[n].strip()+' error'
+    if not self.jwstSystematics is None:
+      for n in range(len(nout)):
+        s1=s1+' | '+self.jwstColumnLabels[n].strip()+' systematic'
     s1=s1.rstrip(' ,')
     if not self.ravalues is None:
       s1=s1+' | RA | Dec '
     print(s1,file=outfile)
-    npoints=len(self.xdata[0])
-    for n in range(npoints):
-      s1='%10.5f %10.5f ' % (self.xdata[0][n],self.ydata[0][n])
-      for m in range(len(nout)):
-        s1=s1+'%10.5f ' % (self.jwstMags[n,nout[m]])
-      if not self.ravalues is None:
-        s1=s1+'%s %s' % (self.ravalues[n],self.decvalues[n])
-      print(s1,file=outfile)
-    outfile.close()
-      
+
+  def writeMagsRows(self,outfile):
+# The rows are formatted and written in blocks; the layout is the same as
+# '%10.5f ' for each value followed by the RA and Dec strings.
+    columns=[self.xdata[0],self.ydata[0],self.jwstMags]
+    for values in [self.jwstErrors,self.jwstSystematics]:
+      if not values is None:
+        columns.append(values)
+    catalog_io.write_rows(outfile,columns,self.ravalues,self.decvalues)
+
   def readModelValues(self,filename1,filename2,filename3,filename4):
     try:
-      self.kuruczMagValues,self.kuruczModelMagLabels,self.kuruczFilterPars=self.readMagslist(os.path.join(path,filename1),142)
-      self.phoenixMagValues,self.phoenixModelMagLabels,self.phoenixFilterPars=self.readMagslist(os.path.join(path,filename2),121)
-      self.blackbodyMagValues,self.blackbodyModelMagLabels,self.blackbodyFilterPars=self.readMagslist(os.path.join(path,filename3),142)
-      self.boszMagValues,self.boszModelMagLabels,self.boszFilterPars=self.readMagslist(os.path.join(path,filename4),142)
+      self.kuruczMagValues,self.kuruczModelMagLabels,self.kuruczFilterPars=self.readMagslist(os.path.join(path,filename1),142,0)
+      self.phoenixMagValues,self.phoenixModelMagLabels,self.phoenixFilterPars=self.readMagslist(os.path.join(path,filename2),121,1)
+      self.blackbodyMagValues,self.blackbodyModelMagLabels,self.blackbodyFilterPars=self.readMagslist(os.path.join(path,filename3),142,2)
+      self.boszMagValues,self.boszModelMagLabels,self.boszFilterPars=self.readMagslist(os.path.join(path,filename4),142,3)
       if self.boszMagValues is None or self.kuruczMagValues is None or self.phoenixMagValues is None or self.blackbodyMagValues is None:
         return False
       return True
     except:
       return False
 
-  def gettext(self,filename,n):
-    if n < 0:
-      return None
+  def readMagslist(self,filename,nfilters,setopt=None):
+# The values come from the memory-mapped binary cache of the grid when it is
+# up to date; the text file is only parsed when the cache is rebuilt.
+# The grids read are kept in gridStore for the life of the process, so that a
+# process doing many conversions (see runBatch) reads each grid only once.  
+# The filter name index and the model parameter index of the grid are made 
+# when it is read.
     try:
-      infile=open(filename,'r')
-      lines=infile.readlines()
-      infile.close()
-      outvalues=[]
-      for line in lines:
-        if '#' in line[0:1] or '\\' in line[0:1] or '|' in line[0:1]:
-          pass
+      key=(os.path.abspath(filename),nfilters)
+      status=os.stat(filename)
+      if key in gridStore and gridStore[key][0] == (status.st_size,status.st_mtime_ns):
+        modelMagValues,modelMagLabels,filterPars,gridhash,index,parameterIndex=gridStore[key][1]
+      else:
+        modelMagValues,modelMagLabels,filterPars,metadata=grid_cache.read_magnitude_list(filename,nfilters)
+        if metadata is None:
+          gridhash=grid_cache.file_hash(filename)
         else:
-          values=line.split()
-          outvalues.append(values[n])
-      return outvalues
-    except:
-      return None
-  
-  def readMagslist(self,filename,nfilters):
-    try:
-      infile=open(filename,'r')
-      modelMagLabels=[]
-      filterPars=numpy.zeros((nfilters,3),dtype=numpy.float32)
-      line=infile.readline()
-      line=infile.readline()
-      line=infile.readline()
-      line=infile.readline()
-      line=infile.readline()
-      for i in range(nfilters):
-        line=infile.readline()
-        values=line.split()
-        m=len(values)
-        str=''
-        for n in range(2,m-3):
-          str=str+values[n]+' '
-        str=str.replace('filter','')
-        str=str.replace('Filter','')
-        modelMagLabels.append(str)
-        filterPars[i,0]=float(values[-3])
-        filterPars[i,1]=float(values[-2])
-        filterPars[i,2]=float(values[-1])
-      infile.close()
-      modelMagValues=numpy.loadtxt(filename)
+          gridhash=metadata['source_sha1']
+        index=filter_index.FilterIndex(modelMagLabels,gridName(filename))
+        parameterIndex=grid_parameters.ParameterIndex(grid_cache.read_model_parameters(filename,metadata),gridName(filename))
+        gridStore[key]=((status.st_size,status.st_mtime_ns),(modelMagValues,modelMagLabels,filterPars,gridhash,index,parameterIndex))
+      if setopt is not None:
+        self.gridSignatures[setopt]=(os.path.basename(filename),gridhash)
+        self.filterIndexes[setopt]=index
+        self.parameterIndexes[setopt]=parameterIndex
       return modelMagValues,modelMagLabels,filterPars
     except:
       return None,None,None
@@ -458,7 +713,8 @@ class magConGUI():
     if not self.haveData:
       self.putMessage('Error: read in data first.\n',self.messageText)
       return
-    self.fitResults=[None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None,None]
+    self.fitResults=[]
+    self.fitScatter=[]
     filter1=self.mag1box.get()
     filter2=self.mag2box.get()
     filter3=self.mag3box.get()
@@ -468,6 +724,8 @@ class magConGUI():
     mopt1,mopt2,mopt3,mopt4=self.matchFilter(setopt,filter1,filter2,filter3,filter4)
     if mopt1 < 0 or mopt2 < 0 or mopt3 < 0 or mopt4 < 0:
       self.putMessage('Error: could not match the specfied filters, so no transformation can be calculated.\n',self.messageText)
+      for message in self.filterErrors:
+        self.putMessage(message+'\n',self.messageText)
       return
     self.xlabel[1]=filter1+' - '+filter2
     yopt=self.yAxisValue.get()
@@ -475,8 +733,6 @@ class magConGUI():
       self.ylabel[1]=filter1+' - '+filter3
     else:
       self.ylabel[1]=filter2+' - '+filter3
-    ndatapoints=len(self.xdata[0])
-    self.jwstMags=numpy.zeros((ndatapoints,59),dtype=numpy.float32)
     self.yopt=yopt
     norder=int(self.fitOrder.get())
     self.fit1(magopt,setopt,yopt,norder,mopt1,mopt2,mopt3,mopt4,True)
@@ -486,14 +742,13 @@ class magConGUI():
     self.dataLimits[2,1]=ymin
     self.dataLimits[3,1]=ymax
     self.haveTransformation=True
-    self.transformedJWSTMags=numpy.zeros((ndatapoints,50),dtype=numpy.float32)
     self.jwstInds=[mopt1,mopt2,mopt3,mopt4]
     if yopt == 1:
-      self.xdata[2]=numpy.copy(self.xdata[0])
-      self.ydata[2]=numpy.copy(self.jwstMags[:,mopt3])
+      self.xdata[2]=self.xdata[0]
+      self.ydata[2]=self.jwstMagColumn(mopt3)
     else:
-      self.xdata[2]=self.jwstMags[:,mopt3]-self.jwstMags[:,mopt4]
-      self.ydata[2]=self.jwstMags[:,mopt3]
+      self.xdata[2]=self.jwstMagColumn(mopt3)-self.jwstMagColumn(mopt4)
+      self.ydata[2]=self.jwstMagColumn(mopt3)
     xmin,xmax,ymin,ymax=self.getRange(self.xdata[2],self.ydata[2])
     self.dataLimits[0,2]=xmin
     self.dataLimits[1,2]=xmax
@@ -504,61 +759,75 @@ class magConGUI():
     self.putMessage('The transformation has been calculated.\n',self.messageText)
 
   def matchFilter(self,setopt,filter1,filter2,filter3,filter4):
-    mopt1=-10
-    mopt2=-10
-    mopt3=-10
-    mopt4=-10
-    if setopt == 0:
-      for i in range(len(self.kuruczModelMagLabels)):
-        if filter1 in self.kuruczModelMagLabels[i]:
-          mopt1=i
-        if filter2 in self.kuruczModelMagLabels[i]:
-          mopt2=i
-        if filter3 in self.kuruczModelMagLabels[i]:
-          mopt3=i
-        if filter4 in self.kuruczModelMagLabels[i]:
-          mopt4=i
-    if setopt == 1:
-      for i in range(len(self.phoenixModelMagLabels)):
-        if filter1 in self.phoenixModelMagLabels[i]:
-          mopt1=i
-        if filter2 in self.phoenixModelMagLabels[i]:
-          mopt2=i
-        if filter3 in self.phoenixModelMagLabels[i]:
-          mopt3=i
-        if filter4 in self.phoenixModelMagLabels[i]:
-          mopt4=i
-    if setopt == 2:
-      for i in range(len(self.blackbodyModelMagLabels)):
-        if filter1 in self.blackbodyModelMagLabels[i]:
-          mopt1=i
-        if filter2 in self.blackbodyModelMagLabels[i]:
-          mopt2=i
-        if filter3 in self.blackbodyModelMagLabels[i]:
-          mopt3=i
-        if filter4 in self.blackbodyModelMagLabels[i]:
-          mopt4=i
-    if setopt == 3:
-      for i in range(len(self.boszModelMagLabels)):
-        if filter1 in self.boszModelMagLabels[i]:
-          mopt1=i
-        if filter2 in self.boszModelMagLabels[i]:
-          mopt2=i
-        if filter3 in self.boszModelMagLabels[i]:
-          mopt3=i
-        if filter4 in self.boszModelMagLabels[i]:
-          mopt4=i
-    return mopt1,mopt2,mopt3,mopt4
-
-  def doFit(self,x1,y1,y2,n,yopt,norder,interactive):
-# case 1:  something like J - K vs J, do J -K to J - JWST filter
-      if yopt == 0:
-        self.modelCol1=x1-y1
-        self.modelCol2=x1-y2
-# case2: something like B - V vs V, do B - V to V - JWST filter
-      else:
-        self.modelCol1=x1-y1
-        self.modelCol2=y1-y2
+# Returns the grid columns of four filter names, looked up in the filter name
+# index of the model set; a name that cannot be matched gives -10, with the 
+# reason in self.filterErrors.
+    self.filterErrors=[]
+    index=self.filterIndexes[setopt]
+    columns=[]
+    for name in [filter1,filter2,filter3,filter4]:
+      if index is None:
+        self.filterErrors.append('The %s model magnitudes have not been read in.' % (modelSetNames[setopt]))
+        columns.append(-10)
+        continue
+      try:
+        columns.append(index.column(name))
+      except ValueError as error:
+        if not str(error) in self.filterErrors:
+          self.filterErrors.append(str(error))
+        columns.append(-10)
+    return columns[0],columns[1],columns[2],columns[3]
+
+  def getFitCache(self):
+# The fit cache is opened on first use; if it cannot be opened the fits are
+# simply calculated every time.
+# The open caches are kept in fitCacheStore for the other conversions done by 
+# the same process.
+    if self.fitCache is None and self.fitCacheFile != 'none':
+      if self.fitCacheFile is None:
+        self.fitCacheFile=fit_cache.default_cache_file(os.path.join(path,'magslist_old_kurucz.new'))
+      if not self.fitCacheFile in fitCacheStore:
+        fitCacheStore[self.fitCacheFile]=fit_cache.open_fit_cache(self.fitCacheFile)
+      self.fitCache=fitCacheStore[self.fitCacheFile]
+      if self.fitCache is None:
+        self.fitCacheFile='none'
+    return self.fitCache
+
+  def modelValues(self,setopt):
+    names=['kuruczMagValues','phoenixMagValues','blackbodyMagValues','boszMagValues']
+    return getattr(self,names[setopt],None)
+
+  def selectedModelValues(self,setopt):
+# Returns the model magnitudes of a set that the transformations are fitted 
+# to: the rows that meet self.gridSelection, or all of them if there is no 
+# selection.  A selection that no rows meet raises a ValueError.
+    magValues=self.modelValues(setopt)
+    if len(self.gridSelection) == 0 or magValues is None:
+      return magValues
+    rows=self.parameterIndexes[setopt].select(self.gridSelection)
+    return magValues[rows,:]
+
+  def modelLabels(self,setopt):
+    names=['kuruczModelMagLabels','phoenixModelMagLabels','blackbodyModelMagLabels','boszModelMagLabels']
+    return getattr(self,names[setopt],None)
+
+  def fitCacheKey(self,setopt,labels,mopt1,mopt2):
+# The first part of the fit cache key, common to all the target filters: the
+# grid name and hash and the two input filter names.
+    if self.gridSignatures[setopt] is None or self.getFitCache() is None:
+      return None
+    return self.gridSignatures[setopt]+(labels[mopt1].strip(),labels[mopt2].strip())
+
+  def doFit(self,x1,y1,magValues,columns,labels,yopt,norder,interactive,cacheKey=None,evaluate=True):
+# Fits the transformations from the model colour x1 - y1 to each of the target
+# filter columns of magValues in one batched least squares solution (see 
+# fit_engine.py), then applies them to the data.  Fits found in the fit cache 
+# (cacheKey is from fitCacheKey, and the fits of a selection of the grid rows
+# are cached separately) are not redone.  The coefficients are put in
+# self.fitResults, the RMS deviations of the fits in colour bins in 
+# self.fitScatter, and the RMS and minimum/maximum deviations of the fits in 
+# self.fitStatistics, one row per column.
+      self.modelCol1=x1-y1
       try:
         if norder < 2:
           norder=4
@@ -572,29 +841,96 @@ class magConGUI():
           self.putMessage('Error: bad fit order.  Putting the value to 4.',self.messageText)
           self.fitOrder.delete(0,Tk.END)
           self.fitOrder.insert(0,str(norder))
-      self.fitResults[n]=legendre.legfit(self.modelCol1,self.modelCol2,norder)
-      fitvalues=legendre.legval(self.modelCol1,self.fitResults[n])
-      rms=numpy.sqrt(numpy.sum((fitvalues-self.modelCol2)*(fitvalues-self.modelCol2))/len(fitvalues))
-      mindev=numpy.min(numpy.abs(fitvalues-self.modelCol2))
-      maxdev=numpy.max(numpy.abs(fitvalues-self.modelCol2))
-      if interactive:
-        self.putMessage('Transformation RMS value for filter\n %s: %.4f\nRange: %.4f to %.4f\n\n' % (jwstnames[n],rms,mindev,maxdev),self.messageText)
-      else:
-        print('Transformation RMS value for filter\n %s: %.4f\nRange: %.4f to %.4f\n\n' % (jwstnames[n],rms,mindev,maxdev))
+      if len(self.fitResults) != magValues.shape[1]:
+        self.fitResults=[None]*magValues.shape[1]
+        self.fitScatter=[None]*magValues.shape[1]
+      self.fitStatistics=numpy.zeros((len(columns),3),dtype=numpy.float64)
+      fits={}
+      missing=[]
+      selection=grid_parameters.selection_key(self.gridSelection)
+      for n in columns:
+        fit=None
+        if cacheKey is not None:
+          fit=self.fitCache.get(cacheKey+(labels[n].strip(),int(yopt),int(norder),selection))
+# fits cached without the binned deviations are redone
+        if fit is None or fit['scatter'] is None or len(fit['scatter']) != fit_engine.DEFAULT_SCATTER_BINS:
+          missing.append(n)
+        else:
+          fits[n]=(fit['coefficients'],[fit['rms'],fit['mindev'],fit['maxdev']],fit['scatter'])
+      if len(missing) > 0:
+# case 1:  something like J - K vs J, do J -K to J - JWST filter
+        if yopt == 0:
+          modelCol2=x1[:,numpy.newaxis]-magValues[:,missing]
+# case2: something like B - V vs V, do B - V to V - JWST filter
+        else:
+          modelCol2=y1[:,numpy.newaxis]-magValues[:,missing]
+        coefficients,statistics=fit_engine.batch_fit(self.modelCol1,modelCol2,norder)
+        scatter=fit_engine.binned_scatter(self.modelCol1,modelCol2,coefficients)
+        for k in range(len(missing)):
+          n=missing[k]
+          fits[n]=(coefficients[:,k],statistics[k],scatter[:,k])
+          if cacheKey is not None:
+            self.fitCache.put(cacheKey+(labels[n].strip(),int(yopt),int(norder),selection),coefficients[:,k],
+                              numpy.min(self.modelCol1),numpy.max(self.modelCol1),
+                              statistics[k,0],statistics[k,1],statistics[k,2],scatter[:,k])
       self.fitRange[0]=numpy.min(self.modelCol1)    
       self.fitRange[1]=numpy.max(self.modelCol1)
+      for k in range(len(columns)):
+        n=columns[k]
+        self.fitResults[n]=fits[n][0]
+        self.fitScatter[n]=fits[n][2]
+        self.fitStatistics[k,:]=fits[n][1]
+        rms,mindev,maxdev=self.fitStatistics[k,:]
+        if interactive:
+          self.putMessage('Transformation RMS value for filter\n %s: %.4f\nRange: %.4f to %.4f\n\n' % (labels[n],rms,mindev,maxdev),self.messageText)
+        else:
+          print('Transformation RMS value for filter\n %s: %.4f\nRange: %.4f to %.4f\n\n' % (labels[n],rms,mindev,maxdev),file=self.log)
+      if evaluate:
+        self.applyFits(columns,yopt)
+
+  def applyFits(self,columns,yopt,out=None):
+# Applies the transformations for the target columns to the input data, with
+# the colour clamped to the fit range extended by 0.5 on each side.  All the
+# filters are evaluated at once (see fit_engine.py) into self.jwstMags, which 
+# has one column per target in the order of the columns list.  If out is 
+# given, a float32 array of one row per data point and one column per target,
+# the values are put in it instead of a new array.
       xmin=numpy.min(self.modelCol1)-0.5
       xmax=numpy.max(self.modelCol1)+0.5
-      newcol=legendre.legval(self.xdata[0],self.fitResults[n])
-      ymin=legendre.legval(xmin,self.fitResults[n])
-      ymax=legendre.legval(xmax,self.fitResults[n])
-      newcol[self.xdata[0] < xmin]=ymin
-      newcol[self.xdata[0] > xmax]=ymax
-      if yopt == 0:
-        self.jwstMags[:,n]=self.ydata[0]-newcol
+      coefficients=numpy.stack([self.fitResults[n] for n in columns],axis=-1)
+      if self.engine != 'lut':
+        self.jwstMags=fit_engine.evaluate_transformations(self.xdata[0],self.ydata[0],coefficients,xmin,xmax,yopt,out=out)
       else:
-        self.jwstMags[:,n]=self.ydata[0]+self.xdata[0]-newcol
-    
+# The table is only remade when the fits change, so for a chunked conversion
+# it is made once.
+        if self.lookupTable is None or not numpy.array_equal(self.lookupTable[0],coefficients) \
+           or self.lookupTable[1][1:] != (xmin,xmax,self.lutStep):
+          table=fit_engine.build_lookup_table(coefficients,xmin,xmax,self.lutStep)
+          self.lookupTable=(coefficients,table)
+          errors=fit_engine.lookup_table_error(coefficients,table)
+          print('Lookup table step %g: maximum interpolation error %.2e magnitudes.' % (self.lutStep,numpy.max(errors)),file=self.log)
+        self.jwstMags=fit_engine.evaluate_lookup_table(self.xdata[0],self.ydata[0],self.lookupTable[1],yopt,out=out)
+# The uncertainties of the input values, if there are any, are propagated 
+# with the derivatives of the fit polynomials (for either engine).
+      self.jwstErrors=None
+      if self.magErrors is not None:
+        self.jwstErrors=fit_engine.propagate_errors(self.xdata[0],self.magErrors[0],self.magErrors[1],coefficients,
+                                                    xmin,xmax,yopt,self.errorWeights)
+# The model scatter is interpolated in the binned deviations of the fits, 
+# which span the model colour range.
+      self.jwstSystematics=None
+      if self.systematics:
+        scatter=numpy.stack([self.fitScatter[n] for n in columns],axis=-1)
+        self.jwstSystematics=fit_engine.evaluate_scatter(self.xdata[0],scatter,numpy.min(self.modelCol1),
+                                                         numpy.max(self.modelCol1))
+
+  def jwstMagColumn(self,n):
+# Returns the transformed magnitudes for grid column n, or zeros if that 
+# filter was not transformed.
+    if n in self.jwstColumns:
+      return self.jwstMags[:,self.jwstColumns.index(n)]
+    return numpy.zeros(len(self.xdata[0]),dtype=numpy.float32)
+
   def plotOutputData(self):
     self.plotOption=3
     self.makePlot(self.plotOption)
@@ -788,7 +1124,7 @@ class magConGUI():
     if not self.haveData:
       return
     outfilename=tkFileDialog.asksaveasfilename(filetypes=[('data files','*.data'),('data files','*.dat'),('data files','*.txt'),('All files','*')])
-    if isinstance(outfilename,basestring):
+    if isinstance(outfilename,str):
       try:
         outfile=open(outfilename,"w")
         if outfile != None and outfile != '':
@@ -805,14 +1141,14 @@ class magConGUI():
     if not self.haveData:
       return
     outfile=tkFileDialog.asksaveasfilename(filetypes=[('postscript','*.ps')])
-    if isinstance(outfile,basestring) and outfile != '':
+    if isinstance(outfile,str) and outfile != '':
       self.mplfigList[self.plotOption-1].savefig(outfile,format="PS")
 
   def makePNG(self):
     if not self.haveData:
       return
     outfile=tkFileDialog.asksaveasfilename(filetypes=[('PNG','*.png')])
-    if isinstance(outfile,basestring) and outfile != '':
+    if isinstance(outfile,str) and outfile != '':
       self.mplfigList[self.plotOption-1].savefig(outfile,format="PNG")
 
 #  def clearPlot(self):
@@ -850,46 +1186,33 @@ class magConGUI():
     filename=tkFileDialog.askopenfilename(filetypes=[('data files','*.data'),('data files','*.dat'),('data files','*.txt'),('data files','*.out'),('data files','*.tbl'),('fits files','*.fits'),('All files','*')])
     if isinstance(filename,type('string')):
       if '.fits' in filename:
-        hdulist=fits.open(filename)
-        data1=hdulist[1].data
         try:
-          indata1=data1.field(xindex)
-          indata2=data1.field(yindex)
+          indata1,indata2,ravalues,decvalues=catalog_io.read_fits_catalog(filename,xindex,yindex,raindex,decindex)
           if raindex >= 0 and decindex >= 0:
-            try:
-              ravalues=data1.field(raindex)
-              decvalues=data1.field(decindex)
-              print('Have read in the RA/Dec values.')
-            except:
-              ravalues=None
-              decvalues=None
+            print('Have read in the RA/Dec values.')
+        except:
+          try:
+            indata1,indata2,ravalues,decvalues=catalog_io.read_fits_catalog(filename,xindex,yindex,-1,-1)
+            if raindex >= 0 and decindex >= 0:
               s1='Error trying to read the RA/Dec values from columns %d and %d of file %s.  These will not be used.' % (raindex,decindex,filename)
               self.putMessage(s1,self.messageText)
-          hdulist.close()
-        except:
-          hdulist.close()
-          s1='Error trying to read columns %i and %i in file %s.\nPlease check your inputs.\n' % (xindex,yindex,filename)
-          self.putMessage(s1,self.messageText)
-          return
+          except:
+            s1='Error trying to read columns %i and %i in file %s.\nPlease check your inputs.\n' % (xindex,yindex,filename)
+            self.putMessage(s1,self.messageText)
+            return
       else:
+# The magnitude and RA/Dec columns are read together in one pass through the
+# file; if that fails the magnitudes are read again without the RA/Dec values.
         try:
-          indata1=numpy.loadtxt(filename,usecols=(xindex,))
-          indata2=numpy.loadtxt(filename,usecols=(yindex,))
+          indata1,indata2,ravalues,decvalues=catalog_io.read_text_catalog(filename,xindex,yindex,raindex,decindex)
         except:
           try:
-            indata1=numpy.loadtxt(filename,usecols=(xindex,),comments=['#','\\','|'])
-            indata2=numpy.loadtxt(filename,usecols=(yindex,),comments=['#','\\','|'])
+            indata1,indata2,ravalues,decvalues=catalog_io.read_text_catalog(filename,xindex,yindex,-1,-1)
           except:
             s1='Error trying to read columns %i and %i in file %s.\nPlease check your inputs.\n' % (xindex,yindex,filename)
             self.putMessage(s1,self.messageText)
             return
-        if raindex >= 0 and decindex >= 0:
-          try:
-            ravalues=self.gettext(filename,raindex)
-            decvalues=self.gettext(filename,decindex)
-          except:
-            ravalues=None
-            decvalues=None
+          if raindex >= 0 and decindex >= 0:
             s1='Error trying to read the RA/Dec values from columns %d and %d of file %s.  These will not be used.' % (raindex,decindex,filename)
             self.putMessage(s1,self.messageText)
       if not ravalues is None:
@@ -903,7 +1226,7 @@ class magConGUI():
           self.putMessage(s1,self.messageText)
       label1=self.mag1box.get()
       label2=self.mag2box.get()
-      xdata,ydata,xlabel,ylabel=self.makexy(opt1,opt2,opt3,label1,label2,indata1,indata2)
+      xdata,ydata,xlabel,ylabel=self.makexy(opt1,opt2,opt3,label1,label2,indata1,indata2,True)
       self.haveData=True
       xmin,xmax,ymin,ymax=self.getRange(xdata,ydata)
       self.dataLimits[0,0]=xmin
@@ -913,8 +1236,8 @@ class magConGUI():
       npoints=len(xdata)
       s1='Have read in %d points from file %s\n' % (npoints,filename)
       self.putMessage(s1,self.messageText)
-      self.xdata[0]=numpy.copy(xdata)
-      self.ydata[0]=numpy.copy(ydata)
+      self.xdata[0]=xdata
+      self.ydata[0]=ydata
       self.xlabel[0]=xlabel
       self.ylabel[0]=ylabel
       self.ravalues=ravalues
@@ -925,7 +1248,15 @@ class magConGUI():
         else:
           self.subplotList[i].clear()
 
-  def makexy(self,opt1,opt2,opt3,label1,label2,indata1,indata2):
+  def makexy(self,opt1,opt2,opt3,label1,label2,indata1,indata2,inplace=False):
+# Returns the colour (x) and magnitude (y) values of the data and their labels
+# from the two input columns.  With inplace=True no new arrays are made: the 
+# values returned are the input arrays themselves, one of which may have been 
+# overwritten by the sum or difference, so the caller must not use indata1 and
+# indata2 afterwards.  (Columns of different types, as can come from a FITS 
+# table, are not combined in place.)
+    if inplace and numpy.asarray(indata1).dtype == numpy.asarray(indata2).dtype:
+      return self.makexyInplace(opt1,opt2,opt3,label1,label2,indata1,indata2)
     if opt1 == 0 and opt2 == 0:
       xdata=indata1-indata2
       xlabel=label1+' - '+label2
@@ -958,17 +1289,67 @@ class magConGUI():
         xlabel=label2+' - '+label1
         ylabel=label1
     return xdata,ydata,xlabel,ylabel
+
+  def makexyWeights(self,opt1,opt2,opt3):
+# Returns the weights (xa, xb, ya, yb) of the two input columns a and b in the
+# colour x and the magnitude y made by makexy, so that x = xa*a + xb*b and
+# y = ya*a + yb*b, for the propagation of the uncertainties of a and b.
+    if opt1 == 0 and opt2 == 0:
+      if opt3 == 0:
+        return (1.,-1.,1.,0.)
+      return (1.,-1.,0.,1.)
+    if opt1 == 0 and opt2 == 1:
+      if opt3 == 0:
+        return (0.,1.,1.,0.)
+      return (0.,1.,1.,1.)
+    if opt3 == 1:
+      return (1.,0.,0.,1.)
+    return (1.,0.,1.,1.)
+
+  def makexyInplace(self,opt1,opt2,opt3,label1,label2,indata1,indata2):
+# The same as makexy, with the sum or difference of the two columns put in 
+# the input column that is not otherwise returned.
+    if opt1 == 0 and opt2 == 0:
+      xlabel=label1+' - '+label2
+      if opt3 == 0:
+        ydata=indata1
+        ylabel=label1
+        xdata=numpy.subtract(indata1,indata2,out=indata2)
+      else:
+        ydata=indata2
+        ylabel=label2
+        xdata=numpy.subtract(indata1,indata2,out=indata1)
+    if opt1 == 0 and opt2 == 1:
+      xlabel=label1+' - '+label2
+      xdata=indata2
+      if opt3 == 0:
+        ydata=indata1
+        ylabel=label1
+      else:
+        ydata=numpy.add(indata2,indata1,out=indata1)
+        ylabel=label2
+    if opt1 == 1 and opt2 == 0:
+      xlabel=label2+' - '+label1
+      xdata=indata1
+      if opt3 == 1:
+        ydata=indata2
+        ylabel=label2
+      else:
+        ydata=numpy.add(indata1,indata2,out=indata2)
+        ylabel=label1
+    return xdata,ydata,xlabel,ylabel
           
   def writeTransformation(self):
     if not self.haveTransformation:
       return
     outfilename=tkFileDialog.asksaveasfilename(filetypes=[('data files','*.data'),('data files','*.dat'),('data files','*.txt'),('All files','*')])
-    if isinstance(outfilename,basestring):
+    if isinstance(outfilename,str):
       try:
         outfile=open(outfilename,'w')
         if self.yopt == 0:
-          for n in range(59):
-            self.writeParams(self.fitResults[n],jwstnames[n],n,outfile)
+          for k in range(len(self.jwstColumns)):
+            n=self.jwstColumns[k]
+            self.writeParams(self.fitResults[n],self.jwstColumnLabels[k].strip(),n,outfile)
         if self.yopt == 1:
           self.writeParams(self.fitResults[self.jwstInds[2]],jwstnames[self.jwstInds[2]],self.jwstInds[n],outfile)
         if self.yopt == 2:
@@ -1015,80 +1396,180 @@ class magConGUI():
   def onExit(self):
     self.root.quit()
 
-  def fit1(self,magopt,setopt,yopt,norder,mopt1,mopt2,mopt3,mopt4,interactive):
-    ndatapoints=len(self.xdata[0])
-    self.jwstMags=numpy.zeros((ndatapoints,59),dtype=numpy.float32)
+  def fit1(self,magopt,setopt,yopt,norder,mopt1,mopt2,mopt3,mopt4,interactive,targets=None,evaluate=True):
+# magopt selects the target filters: 0 for all the JWST filters, 1 for mopt3, 
+# and 2 for mopt3 and mopt4.  Alternatively targets is a list of the grid 
+# columns of the target filters.  The columns fitted are saved in 
+# self.jwstColumns in output order, with their names in self.jwstColumnLabels.
+# If evaluate is False the fits are done but not applied to the data.
     self.yopt=yopt
-    if setopt == 0:
-      if magopt == 0:
-        for n in range(59):
-          self.doFit(self.kuruczMagValues[:,mopt1],self.kuruczMagValues[:,mopt2],self.kuruczMagValues[:,n],n,yopt,norder,interactive)
-      if magopt == 1:
-        self.doFit(self.kuruczMagValues[:,mopt1],self.kuruczMagValues[:,mopt2],self.kuruczMagValues[:,mopt3],mopt3,yopt,norder,interactive)
-      if magopt == 2:
-        self.doFit(self.kuruczMagValues[:,mopt1],self.kuruczMagValues[:,mopt2],self.kuruczMagValues[:,mopt3],mopt3,yopt,norder,interactive)
-        self.doFit(self.kuruczMagValues[:,mopt1],self.kuruczMagValues[:,mopt2],self.kuruczMagValues[:,mopt4],mopt4,yopt,norder,interactive)
-      self.xdata[1]=self.kuruczMagValues[:,mopt1]-self.kuruczMagValues[:,mopt2]
-      if yopt == 0:
-        self.ydata[1]=self.kuruczMagValues[:,mopt1]-self.kuruczMagValues[:,mopt3]
-      else:
-        self.ydata[1]=self.kuruczMagValues[:,mopt2]-self.kuruczMagValues[:,mopt3]
-    if setopt == 1:
-      if magopt == 0:
-        for n in range(59):
-          self.doFit(self.phoenixMagValues[:,mopt1],self.phoenixMagValues[:,mopt2],self.phoenixMagValues[:,n],n,yopt,norder,interactive)
-      if magopt == 1:
-        self.doFit(self.phoenixMagValues[:,mopt1],self.phoenixMagValues[:,mopt2],self.phoenixMagValues[:,mopt3],mopt3,yopt,norder,interactive)
-      if magopt == 2:
-        self.doFit(self.phoenixMagValues[:,mopt1],self.phoenixMagValues[:,mopt2],self.phoenixMagValues[:,mopt3],mopt3,yopt,norder,interactive)
-        self.doFit(self.phoenixMagValues[:,mopt1],self.phoenixMagValues[:,mopt2],self.phoenixMagValues[:,mopt4],mopt4,yopt,norder,interactive)
-      self.xdata[1]=self.phoenixMagValues[:,mopt1]-self.phoenixMagValues[:,mopt2]
-      self.ydata[1]=self.phoenixMagValues[:,mopt1]-self.phoenixMagValues[:,mopt3]
-    if setopt == 2:
-      if magopt == 0:
-        for n in range(59):
-          self.doFit(self.blackbodyMagValues[:,mopt1],self.blackbodyMagValues[:,mopt2],self.blackbodyMagValues[:,n],n,yopt,norder,interactive)
-      if magopt == 1:
-        self.doFit(self.blackbodyMagValues[:,mopt1],self.blackbodyMagValues[:,mopt2],self.blackbodyMagValues[:,mopt3],mopt3,yopt,norder,interactive)
-      if magopt == 2:
-        self.doFit(self.blackbodyMagValues[:,mopt1],self.blackbodyMagValues[:,mopt2],self.blackbodyMagValues[:,mopt3],mopt3,yopt,norder,interactive)
-        self.doFit(self.blackbodyMagValues[:,mopt1],self.blackbodyMagValues[:,mopt2],self.blackbodyMagValues[:,mopt4],mopt4,yopt,norder,interactive)
-      self.xdata[1]=self.blackbodyMagValues[:,mopt1]-self.blackbodyMagValues[:,mopt2]
-      self.ydata[1]=self.blackbodyMagValues[:,mopt1]-self.blackbodyMagValues[:,mopt3]
-    if setopt == 3:
+    magValues=self.selectedModelValues(setopt)
+    labels=self.modelLabels(setopt)
+    cacheKey=self.fitCacheKey(setopt,labels,mopt1,mopt2)
+    if targets is None:
       if magopt == 0:
-        for n in range(12):
-          self.doFit(self.boszMagValues[:,mopt1],self.boszMagValues[:,mopt2],self.boszMagValues[:,n],n,yopt,norder,interactive)
+        targets=self.filterIndexes[setopt].instrument_columns(jwstinstruments)
       if magopt == 1:
-        self.doFit(self.boszMagValues[:,mopt1],self.boszMagValues[:,mopt2],self.boszMagValues[:,mopt3],mopt3,yopt,norder,interactive)
+        targets=[mopt3]
       if magopt == 2:
-        self.doFit(self.boszMagValues[:,mopt1],self.boszMagValues[:,mopt2],self.boszMagValues[:,mopt3],mopt3,yopt,norder,interactive)
-        self.doFit(self.boszMagValues[:,mopt1],self.boszMagValues[:,mopt2],self.boszMagValues[:,mopt4],mopt4,yopt,norder,interactive)
-      self.xdata[1]=self.boszMagValues[:,mopt1]-self.boszMagValues[:,mopt2]
-      self.ydata[1]=self.boszMagValues[:,mopt1]-self.boszMagValues[:,mopt3]
-    
+        targets=[mopt3,mopt4]
+    self.jwstColumns=[]
+    for n in targets:
+      if not n in self.jwstColumns:
+        self.jwstColumns.append(n)
+    self.jwstColumnLabels=[labels[n] for n in self.jwstColumns]
+    self.doFit(magValues[:,mopt1],magValues[:,mopt2],magValues,self.jwstColumns,labels,yopt,norder,interactive,cacheKey,evaluate)
+    self.xdata[1]=magValues[:,mopt1]-magValues[:,mopt2]
+    if yopt == 0:
+      self.ydata[1]=magValues[:,mopt1]-magValues[:,mopt3]
+    else:
+      self.ydata[1]=magValues[:,mopt2]-magValues[:,mopt3]
+
+  def matchTargets(self,setopt,targetnames):
+# Returns the grid columns for a list of target filter names, where an entry 
+# "all" stands for all the JWST filters and "all NIRISS", "all NIRCam", etc. 
+# for all the filters of one instrument.  If any name cannot be matched None 
+# is returned, with the reason in self.filterErrors.
+    self.filterErrors=[]
+    try:
+      return self.filterIndexes[setopt].target_columns(targetnames)
+    except ValueError as error:
+      self.filterErrors.append(str(error))
+      return None
+
+  def startStage(self,name):
+# Marks the start and the end of a stage of the run for the profile, if any.
+    if self.profile is not None:
+      self.profile.start_stage(name)
+
+  def endStage(self,name):
+    if self.profile is not None:
+      self.profile.end_stage(name)
+
+  def clampedRows(self):
+# Returns the number of data points with colours outside the range over which
+# the transformations are used (see applyFits); these get the values at the 
+# end of the range.
+    xmin=numpy.min(self.modelCol1)-0.5
+    xmax=numpy.max(self.modelCol1)+0.5
+    return int(numpy.count_nonzero((self.xdata[0] < xmin) | (self.xdata[0] > xmax)))
+
+  def streamTransform(self,filename,xindex,yindex,raindex,decindex,chunksize,opt1,opt2,opt3,filter1,filter2,
+                      setopt,yaxis,norder,mopt1,mopt2,mopt3,mopt4,targets,outfilename):
+# Converts the catalogue chunksize rows at a time: the fits are done once,
+# then each chunk is read, transformed, and written out, so the memory use 
+# does not depend on the catalogue length.  The output file is the same as 
+# from writeMags.  The reading, the transformation, and the writing are done
+# at the same time for successive chunks by the threads of pipeline.py, with 
+# up to self.queueDepth chunks waiting between them.
+# When the run is profiled the stages are done one after the other, so that 
+# the time and memory of each can be measured.
+    self.startStage('fitting')
+    self.fit1(2,setopt,yaxis,norder,mopt1,mopt2,mopt3,mopt4,False,targets,False)
+    self.endStage('fitting')
+    output=[None]
+    queueDepth=self.queueDepth
+    if self.profile is not None:
+      queueDepth=0
+# When the stages are run one after the other each chunk is written before 
+# the next is converted, so the transformed magnitudes of all the chunks are 
+# put in the same array, buffer[0].
+    buffer=[None]
+
+    def convertChunk(chunk):
+      indata1,indata2,ravalues,decvalues=chunk[0:4]
+      if self.errorIndexes is not None:
+        self.magErrors=chunk[4:6]
+      self.startStage('makexy')
+      self.xdata[0],self.ydata[0],self.xlabel[0],self.ylabel[0]=self.makexy(opt1,opt2,opt3,filter1,filter2,
+                                                                            indata1,indata2,True)
+      self.ravalues=ravalues
+      self.decvalues=decvalues
+      self.endStage('makexy')
+      self.startStage('evaluation')
+      out=None
+      if queueDepth == 0:
+        npoints=len(self.xdata[0])
+        if buffer[0] is None or len(buffer[0]) < npoints:
+          buffer[0]=numpy.empty((npoints,len(self.jwstColumns)),dtype=numpy.float32)
+        out=buffer[0][0:npoints]
+      self.applyFits(self.jwstColumns,yaxis,out)
+      self.endStage('evaluation')
+      if self.profile is not None:
+        self.profile.count('rows',len(self.xdata[0]))
+        self.profile.count('clamped_rows',self.clampedRows())
+      return (self.xdata[0],self.ydata[0],self.jwstMags,ravalues,decvalues,self.jwstErrors,self.jwstSystematics)
+
+    def writeChunk(chunk):
+      self.startStage('output_write')
+      self.writeChunkOutput(output,outfilename,chunk)
+      self.endStage('output_write')
+
+    try:
+      chunks=catalog_io.read_chunks(filename,xindex,yindex,raindex,decindex,chunksize,self.rowRange,self.computeType,
+                                    self.errorIndexes)
+      if self.profile is not None:
+        chunks=self.profile.iterate('catalog_read',chunks)
+      self.pipelineStages=pipeline.run_pipeline(chunks,convertChunk,writeChunk,queueDepth)
+    finally:
+      if output[0] is not None:
+        output[0].close()
+    for stage in self.pipelineStages:
+      print(stage.summary(),file=self.log)
+
+  def writeChunkOutput(self,output,outfilename,chunk):
+# Writes a converted chunk for streamTransform, opening the output file 
+# (output[0]) for the first chunk.
+    if output[0] is None and self.outputFormat == 'fits':
+      output[0]=self.openFitsOutput(outfilename,chunk)
+    elif output[0] is None:
+      output[0]=open(outfilename,'w')
+      self.writeMagsHeader(output[0])
+    if self.outputFormat == 'fits':
+      output[0].write(self.outputColumns(chunk))
+    else:
+      columns=list(chunk[0:3])
+      for values in chunk[5:7]:
+        if not values is None:
+          columns.append(values)
+      catalog_io.write_rows(output[0],columns,chunk[3],chunk[4])
+
   def autoTransform(self,parameters):
+# optional: profile the run, writing the time and memory use of each stage to
+# a JSON file next to the output file (see profiler.py)
+    try:
+      profile=str(parameters['Output_Filter_Values']['profile']).lower()
+    except KeyError:
+      profile='no'
+    if profile in ['yes','true']:
+      self.profile=profiler.RunProfile()
     try:
+      self.startStage('grid_load')
       if parameters['Output_Filter_Values']['modelset'] == 'Kurucz':
         setopt=0
-        self.kuruczMagValues,self.kuruczModelMagLabels,self.kuruczFilterPars=self.readMagslist(os.path.join(path,'magslist_old_kurucz.new'),142)
+        self.kuruczMagValues,self.kuruczModelMagLabels,self.kuruczFilterPars=self.readMagslist(os.path.join(path,'magslist_old_kurucz.new'),142,0)
         if self.kuruczMagValues is None:
-          self.exit()
+          print('Error: could not read the Kurucz model magnitudes.',file=self.log)
+          sys.exit()
       if parameters['Output_Filter_Values']['modelset'] == 'Phoenix':
         setopt=1
-        self.phoenixMagValues,self.phoenixModelMagLabels,self.phoenixFilterPars=self.readMagslist(os.path.join(path,'magslist_phoenix_grid.new'),121)
+        self.phoenixMagValues,self.phoenixModelMagLabels,self.phoenixFilterPars=self.readMagslist(os.path.join(path,'magslist_phoenix_grid.new'),121,1)
         if self.phoenixMagValues is None:
-          self.exit()
+          print('Error: could not read the Phoenix model magnitudes.',file=self.log)
+          sys.exit()
       if parameters['Output_Filter_Values']['modelset'] == 'blackbody':
         setopt=2
-        self.blackbodyMagValues,self.blackbodyMagLabels,self.blackbodyFilterPars=self.readMagslist(os.path.join(path,'magslist_backbody.new'),142)
+        self.blackbodyMagValues,self.blackbodyModelMagLabels,self.blackbodyFilterPars=self.readMagslist(os.path.join(path,'magslist_blackbody.new'),142,2)
         if self.blackbodyMagValues is None:
-          self.exit()
+          print('Error: could not read the blackbody model magnitudes.',file=self.log)
+          sys.exit()
       if parameters['Output_Filter_Values']['modelset'] == 'BOSZ':
         setopt=3
-        self.boszMagValues,self.boszModelMagLabels,self.boszFilterPars=self.readMagslist(os.path.join(path,'magslist_bosz_normal.new'),142)
+        self.boszMagValues,self.boszModelMagLabels,self.boszFilterPars=self.readMagslist(os.path.join(path,'magslist_bosz_normal.new'),142,3)
         if self.boszMagValues is None:
-          self.exit()
+          print('Error: could not read the BOSZ model magnitudes.',file=self.log)
+          sys.exit()
+      self.endStage('grid_load')
       if parameters['Input_Magnitude_Parameters']['column1type'] == 'magnitude':
         opt1=0
       else:
@@ -1099,136 +1580,281 @@ class magConGUI():
         opt2=1
       filter1=parameters['Input_Magnitude_Parameters']['filter1'].replace('_',' ')
       filter2=parameters['Input_Magnitude_Parameters']['filter2'].replace('_',' ')
-      filter3=parameters['Output_Filter_Values']['jwst1'].replace('_',' ')
-      filter4=parameters['Output_Filter_Values']['jwst2'].replace('_',' ')
+# The target filters are either given as a list in jwstfilters, with entries
+# such as "NIRISS F200W", "all NIRCam", or "all", or as the two filters jwst1 
+# and jwst2.
+      if 'jwstfilters' in parameters['Output_Filter_Values']:
+        targetnames=parameters['Output_Filter_Values']['jwstfilters']
+        if not isinstance(targetnames,list):
+          targetnames=[targetnames]
+      else:
+        targetnames=[parameters['Output_Filter_Values']['jwst1'],parameters['Output_Filter_Values']['jwst2']]
+      targetnames=[x.replace('_',' ') for x in targetnames]
       norder=int(parameters['Output_Filter_Values']['fitorder'])
+# optional: the fit cache database to use, or 'none' to always do the fits
+      if 'fitcache' in parameters['Output_Filter_Values']:
+        self.fitCacheFile=parameters['Output_Filter_Values']['fitcache']
+# optional: the evaluation engine, legendre or lut, and the lut colour step
+      if 'engine' in parameters['Output_Filter_Values']:
+        self.engine=parameters['Output_Filter_Values']['engine'].lower()
+        if not self.engine in ['legendre','lut']:
+          print('Error: the engine must be legendre or lut, not %s.' % (self.engine),file=self.log)
+          sys.exit()
+      if 'lutstep' in parameters['Output_Filter_Values']:
+        self.lutStep=float(parameters['Output_Filter_Values']['lutstep'])
+        if self.lutStep <= 0.:
+          print('Error: the lutstep colour step must be positive, not %g.' % (self.lutStep),file=self.log)
+          sys.exit()
+# optional: yes to write the model scatter about the fits at the colour of 
+# each star as a systematic uncertainty of the transformed magnitudes
+      if 'systematics' in parameters['Output_Filter_Values']:
+        self.systematics=str(parameters['Output_Filter_Values']['systematics']).lower() in ['yes','true']
+# optional: fit only the grid rows whose model parameters meet the conditions
+# of the selection, such as "teff=3500..6000, logg<3, [M/H]<-1" (see
+# grid_parameters.py)
+      if 'selection' in parameters['Output_Filter_Values']:
+        try:
+          self.gridSelection=grid_parameters.parse_selection(parameters['Output_Filter_Values']['selection'])
+          nrows=len(self.selectedModelValues(setopt))
+        except ValueError as error:
+          print('Error: %s' % (error),file=self.log)
+          sys.exit()
+        if nrows <= norder:
+          print('Error: only %d model grid rows meet the selection, too few for a fit of order %d.' % (nrows,norder),file=self.log)
+          sys.exit()
+        if len(self.gridSelection) > 0:
+          print('%d of %d model grid rows meet the selection.' % (nrows,len(self.modelValues(setopt))),file=self.log)
       if norder < 2:
+        print('Error: the fit order must be at least 2, not %d.' % (norder),file=self.log)
+        sys.exit()
+      mopt1,mopt2,mopt3,mopt4=self.matchFilter(setopt,filter1,filter2,filter1,filter2)
+      if mopt1 < 0 or mopt2 < 0:
+        print('\n'.join(self.filterErrors),file=self.log)
         sys.exit()
-      mopt1,mopt2,mopt3,mopt4=self.matchFilter(setopt,filter1,filter2,filter3,filter4)
-      if mopt1 < 0 or mopt2 < 0 or mopt3 < 0 or mopt4 < 0:
+      targets=self.matchTargets(setopt,targetnames)
+      if targets is None or len(targets) == 0:
+        print('\n'.join(self.filterErrors),file=self.log)
         sys.exit()
+      mopt3=targets[0]
+      mopt4=targets[-1]
+      filter3=self.modelLabels(setopt)[mopt3].strip()
+      filter4=self.modelLabels(setopt)[mopt4].strip()
       self.jwstInds=[mopt1,mopt2,mopt3,mopt4]
       xindex=int(parameters['Input_Magnitude_Parameters']['column1'])-1
       yindex=int(parameters['Input_Magnitude_Parameters']['column2'])-1
       raindex=int(parameters['Input_Magnitude_Parameters']['racolumn'])-1
       decindex=int(parameters['Input_Magnitude_Parameters']['deccolumn'])-1
       if xindex == yindex or xindex < 0 or yindex < 0:
+        print('Error: column1 and column2 must be different columns, counting from 1.',file=self.log)
         sys.exit()
       if opt1 == 1 & opt2 == 1:
+        print('Error: column1 and column2 cannot both be colours.',file=self.log)
         sys.exit()
       yaxis=int(parameters['Input_Magnitude_Parameters']['yvalue'])-1
       filename=parameters['Input_Magnitude_Parameters']['datafile']
-      if '.fits' in filename[-5:]:
-        hdulist=fits.open(filename)
-        data1=hdulist[1].data
-        indata1=data1.field(xindex)
-        indata2=data1.field(yindex)
-        if raindex >= 0 and decindex >= 0:
-          ravalues=data1.field(raindex)
-          decvalues=data1.field(decindex)
-        else:
-          ravalues=None
-          decvalues=None
-      else:
-        try:
-          indata1=numpy.loadtxt(filename,usecols=(xindex,))
-          indata2=numpy.loadtxt(filename,usecols=(yindex,))
-        except:
-          indata1=numpy.loadtxt(filename,usecols=(xindex,),comments=['#','\\','|'])
-          indata2=numpy.loadtxt(filename,usecols=(yindex,),comments=['#','\\','|'])
-        if raindex >= 0 and decindex >= 0:
-          ravalues=self.gettext(filename,raindex)
-          decvalues=self.gettext(filename,decindex)
-        else:
-          ravalues=None
-          decvalues=None
+      outfilename=parameters['Output_Filter_Values']['outfilename']
+      outpath=outfilename
+      if self.outputPath is not None:
+        outpath=self.outputPath
+# optional: the output file format, text or fits (by default fits if the 
+# output file name ends in .fits)
+      if 'outputformat' in parameters['Output_Filter_Values']:
+        self.outputFormat=parameters['Output_Filter_Values']['outputformat'].lower()
+      elif outfilename[-5:].lower() == '.fits':
+        self.outputFormat='fits'
+      if not self.outputFormat in ['text','fits']:
+        print('Error: the output format must be text or fits, not %s.' % (self.outputFormat),file=self.log)
+        sys.exit()
+# optional: the first and last rows (counting from 1) of a FITS input table to
+# convert
+      if 'firstrow' in parameters['Input_Magnitude_Parameters'] or 'lastrow' in parameters['Input_Magnitude_Parameters']:
+        firstrow=int(parameters['Input_Magnitude_Parameters'].get('firstrow',1))
+        lastrow=parameters['Input_Magnitude_Parameters'].get('lastrow',None)
+        if lastrow is not None:
+          lastrow=int(lastrow)
+        if firstrow < 1 or (lastrow is not None and lastrow < firstrow):
+          print('Error: the firstrow and lastrow values must count from 1, with lastrow not before firstrow.',file=self.log)
+          sys.exit()
+        self.rowRange=(firstrow-1,lastrow)
+# optional: convert the catalogue in chunks of this many rows (0 to read it 
+# all at once)
+      try:
+        chunksize=int(parameters['Input_Magnitude_Parameters']['chunksize'])
+      except KeyError:
+        chunksize=0
+# optional: the number of chunks held between the pipeline stages of a chunked
+# conversion (0 to not overlap the stages)
+      if 'queuedepth' in parameters['Input_Magnitude_Parameters']:
+        self.queueDepth=int(parameters['Input_Magnitude_Parameters']['queuedepth'])
+# optional: float32 to read and convert the catalogue values in single 
+# precision
+      if 'computetype' in parameters['Input_Magnitude_Parameters']:
+        computetype=parameters['Input_Magnitude_Parameters']['computetype'].lower()
+        if not computetype in ['float32','float64']:
+          print('Error: the compute type must be float32 or float64, not %s.' % (computetype),file=self.log)
+          sys.exit()
+        self.computeType=numpy.dtype(computetype).type
       opt3=0
-      xdata,ydata,xlabel,ylabel=self.makexy(opt1,opt2,opt3,filter1,filter2,indata1,indata2)
-      self.xdata[0]=numpy.copy(xdata)
-      self.ydata[0]=numpy.copy(ydata)
-      self.xlabel[0]=xlabel
-      self.ylabel[0]=ylabel
-      if filter1 == filter2:
-        magopt=1
+# optional: the columns of the uncertainties of the two input values (counting
+# from 1, 0 for none), to be propagated to the transformed magnitudes
+      if 'error1column' in parameters['Input_Magnitude_Parameters'] or 'error2column' in parameters['Input_Magnitude_Parameters']:
+        error1index=int(parameters['Input_Magnitude_Parameters'].get('error1column',0))-1
+        error2index=int(parameters['Input_Magnitude_Parameters'].get('error2column',0))-1
+        if error1index in [xindex,yindex] or error2index in [xindex,yindex]:
+          print('Error: the uncertainty columns (error1column %d, error2column %d) must not be the magnitude columns (column1 %d, column2 %d).' % (error1index+1,error2index+1,xindex+1,yindex+1),file=self.log)
+          sys.exit()
+        if error1index >= 0 or error2index >= 0:
+          self.errorIndexes=(error1index,error2index)
+          self.errorWeights=self.makexyWeights(opt1,opt2,opt3)
+      if self.profile is not None:
+        self.profile.information.update({'status': 'ok', 'datafile': filename, 'outfilename': outfilename,
+                                         'modelset': parameters['Output_Filter_Values']['modelset'],
+                                         'targets': len(targets), 'fitorder': norder, 'engine': self.engine,
+                                         'chunksize': chunksize, 'outputformat': self.outputFormat,
+                                         'computetype': 'input' if self.computeType is None else numpy.dtype(self.computeType).name})
+      if chunksize > 0:
+        self.streamTransform(filename,xindex,yindex,raindex,decindex,chunksize,opt1,opt2,opt3,filter1,filter2,
+                             setopt,yaxis,norder,mopt1,mopt2,mopt3,mopt4,targets,outpath)
       else:
-        magopt=2
-      ndatapoints=len(self.xdata[0])
-      self.jwstMags=numpy.zeros((ndatapoints,59),dtype=numpy.float32)
-      self.fit1(magopt,setopt,yaxis,norder,mopt1,mopt2,mopt3,mopt4,False)
-      outfilename=parameters['Output_Filter_Values']['outfilename']
-      self.ravalues=ravalues
-      self.decvalues=decvalues
-      self.writeMags(outfilename)
-      print('Output file %s has been written.' % (outfilename))
-      xmin=numpy.min(self.xdata[1])-0.5
-      xmax=numpy.max(self.xdata[1])+0.5
-      delx=(xmax-xmin)/1000.
-      xmodel=numpy.arange(xmin,xmax,delx)
-      setnames=['kurucz','phoenix','blackbody','bosz']
-      for n in range(2):
-        if n == yaxis:
-          ymodel=legendre.legval(xmodel,self.fitResults[self.jwstInds[2]])
-          matplotlib.pyplot.plot(self.xdata[1],self.ydata[1],'o',markersize=1.,color='red')
-        else:
-          if setopt == 0:
-            xd1=self.kuruczMagValues[:,mopt1]-self.kuruczMagValues[:,mopt2]
-            if yaxis == 0:
-              yd1=self.kuruczMagValues[:,mopt1]-self.kuruczMagValues[:,mopt4]
-            else:
-              yd1=self.kuruczMagValues[:,mopt2]-self.kuruczMagValues[:,mopt4]
-            matplotlib.pyplot.plot(xd1,yd1,'o',markersize=1.,color='red')
-          if setopt == 1:
-            xd1=self.phoenixMagValues[:,mopt1]-self.phoenixMagValues[:,mopt2]
-            if yaxis == 0:
-              yd1=self.phoenixMagValues[:,mopt1]-self.phoenixMagValues[:,mopt4]
-            else:
-              yd1=self.phoenixMagValues[:,mopt2]-self.phoenixMagValues[:,mopt4]
-            matplotlib.pyplot.plot(xd1,yd1,'o',markersize=1.,color='red')
-          if setopt == 2:
-            xd1=self.blackbodyMagValues[:,mopt1]-self.blackbodyMagValues[:,mopt2]
-            if yaxis == 0:
-              yd1=self.blackbodyMagValues[:,mopt1]-self.blackbodyMagValues[:,mopt4]
-            else:
-              yd1=self.blackbodyMagValues[:,mopt2]-self.blackbodyMagValues[:,mopt4]
-            matplotlib.pyplot.plot(xd1,yd1,'o',markersize=1.,color='red')
-          if setopt == 4:
-            xd1=self.boszMagValues[:,mopt1]-self.boszMagValues[:,mopt2]
-            if yaxis == 0:
-              yd1=self.boszMagValues[:,mopt1]-self.boszMagValues[:,mopt4]
-            else:
-              yd1=self.boszMagValues[:,mopt2]-self.boszMagValues[:,mopt4]
-            matplotlib.pyplot.plot(xd1,yd1,'o',markersize=1.,color='red')
-          ymodel=legendre.legval(xmodel,self.fitResults[self.jwstInds[3]])
-          xd1=self.kuruczMagValues[:,mopt1]-self.kuruczMagValues[:,mopt2]
-          if yaxis == 0:
-            yd1=self.kuruczMagValues[:,mopt1]-self.kuruczMagValues[:,mopt4]
-          else:
-            yd1=self.kuruczMagValues[:,mopt2]-self.kuruczMagValues[:,mopt4]
-        matplotlib.pyplot.plot(xmodel,ymodel,color='cyan')
-        if n == 0:
-          matplotlib.pyplot.ylabel(ylabel+' - JWST '+filter3)
-          figname='transformation '+xlabel+' to '+ylabel+' - '+filter3+' '+setnames[setopt]+'.png'
+        self.startStage('catalog_read')
+        if '.fits' in filename[-5:]:
+          values=catalog_io.read_fits_catalog(filename,xindex,yindex,raindex,decindex,self.rowRange,self.computeType,
+                                              self.errorIndexes)
         else:
-          matplotlib.pyplot.ylabel(ylabel+' - JWST '+filter4)
-          figname='transformation '+xlabel+' to '+ylabel+' - '+filter4+' '+setnames[setopt]+'.png'
-        matplotlib.pyplot.xlabel(xlabel)
-        figname=figname.replace(' ','_')
-        figname=figname.replace('-','minus')
-        matplotlib.pyplot.savefig(figname)
-        matplotlib.pyplot.close()
+          values=catalog_io.read_text_catalog(filename,xindex,yindex,raindex,decindex,self.computeType,
+                                              self.errorIndexes)
+        indata1,indata2,ravalues,decvalues=values[0:4]
+        if self.errorIndexes is not None:
+          self.magErrors=values[4:6]
+        del values
+        self.endStage('catalog_read')
+        self.startStage('makexy')
+        self.xdata[0],self.ydata[0],self.xlabel[0],self.ylabel[0]=self.makexy(opt1,opt2,opt3,filter1,filter2,
+                                                                              indata1,indata2,True)
+        del indata1,indata2
+        self.endStage('makexy')
+        self.startStage('fitting')
+        self.fit1(2,setopt,yaxis,norder,mopt1,mopt2,mopt3,mopt4,False,targets,False)
+        self.endStage('fitting')
+        self.startStage('evaluation')
+        self.applyFits(self.jwstColumns,yaxis)
+        self.endStage('evaluation')
+        if self.profile is not None:
+          self.profile.count('rows',len(self.xdata[0]))
+          self.profile.count('clamped_rows',self.clampedRows())
+        self.ravalues=ravalues
+        self.decvalues=decvalues
+        self.startStage('output_write')
+        self.writeMags(outpath)
+        self.endStage('output_write')
+      print('Output file %s has been written.' % (outfilename),file=self.log)
+# the checks above print the reason before they stop the conversion, so that
+# is left as the last message (which runBatch and the service report)
+    except SystemExit:
+      if self.profile is not None:
+        self.profile.fail(sys.exc_info()[1])
+        self.writeProfile(parameters)
+      raise
     except:
-      print('Error trying to do the transformation.')
+      print('Error trying to do the transformation.',file=self.log)
+      print('Error: %s' % (sys.exc_info()[1]),file=self.log)
+      if self.profile is not None:
+        self.profile.fail(sys.exc_info()[1])
+        self.writeProfile(parameters)
       sys.exit()
+# The diagnostic plots of the transformations are only made if asked for, 
+# after the output file has been written.
+    try:
+      plotmode=parameters['Output_Filter_Values']['plots'].lower()
+    except KeyError:
+      plotmode='none'
+    if plotmode in ['yes','background']:
+      try:
+        plotdirectory=parameters['Output_Filter_Values']['plotdirectory']
+      except KeyError:
+        plotdirectory='.'
+      try:
+        plotname=parameters['Output_Filter_Values']['plotname']
+      except KeyError:
+        plotname=defaultPlotName
+      try:
+        self.startStage('plotting')
+        plotlist=self.transformationPlots(setopt,yaxis,mopt1,mopt2,plotdirectory,plotname,outfilename)
+        if plotmode == 'background':
+          import multiprocessing
+          process=multiprocessing.Process(target=renderPlots,args=(plotlist,))
+          process.start()
+          print('The transformation plots are being made in process %d.' % (process.pid),file=self.log)
+        else:
+          renderPlots(plotlist)
+        self.endStage('plotting')
+      except:
+        print('Error trying to make the transformation plots.',file=self.log)
+    if self.profile is not None:
+      self.writeProfile(parameters)
+
+  def writeProfile(self,parameters):
+# Writes the profile of the run next to the output file, or in the current 
+# directory if there is no output file name.
+    try:
+      filename=profiler.profile_file_name(parameters['Output_Filter_Values']['outfilename'])
+    except KeyError:
+      filename='jwst_magnitude_converter_profile.json'
+    try:
+      self.profile.write(filename)
+      print('The run profile has been written to %s.' % (filename),file=self.log)
+    except:
+      print('Error trying to write the run profile %s.' % (filename),file=self.log)
+    self.profile=None
+
+  def transformationPlots(self,setopt,yaxis,mopt1,mopt2,plotdirectory,plotname,outfilename):
+# Returns a list of the plots of the transformations to each of the target 
+# filters: for each a tuple of the model colours, the fitted curve, the axis 
+# labels, and the file name.  The file name is made from the plotname 
+# template, with {xlabel}, {ylabel}, {filter}, {modelset}, and {output} (the
+# output file name without the extension) replaced by the values for the plot, with spaces made into _ and - into minus.
+    setnames=['kurucz','phoenix','blackbody','bosz']
+    magValues=self.selectedModelValues(setopt)
+    xdata=magValues[:,mopt1]-magValues[:,mopt2]
+    if yaxis == 0:
+      ycolumn=mopt1
+    else:
+      ycolumn=mopt2
+    xmin=numpy.min(xdata)-0.5
+    xmax=numpy.max(xdata)+0.5
+    delx=(xmax-xmin)/1000.
+    xmodel=numpy.arange(xmin,xmax,delx)
+    outname=os.path.splitext(os.path.basename(outfilename))[0]
+    plotlist=[]
+    for k in range(len(self.jwstColumns)):
+      n=self.jwstColumns[k]
+      filtername=self.jwstColumnLabels[k].strip()
+      ydata=magValues[:,ycolumn]-magValues[:,n]
+      ymodel=legendre.legval(xmodel,self.fitResults[n])
+      values={'xlabel': self.xlabel[0], 'ylabel': self.ylabel[0], 'filter': filtername,
+              'modelset': setnames[setopt], 'output': outname}
+      for key in values:
+        values[key]=values[key].replace(' ','_').replace('-','minus')
+      figname=os.path.join(plotdirectory,plotname.format(**values))
+      plotlist.append((numpy.array(xdata),ydata,xmodel,ymodel,self.xlabel[0],
+                       self.ylabel[0]+' - JWST '+filtername,figname))
+    return plotlist
+
     
-def parseArguments(argv):
+def parseArguments(argv,log=None):
+# Reads the cfg file named last in argv, printing to the stream log (None for
+# sys.stdout).  Returns the parameters, or None if there is no cfg file.
   sectionlist=['Input_Magnitude_Parameters','Input_Magnitude_Parameters','Input_Magnitude_Parameters','Input_Magnitude_Parameters','Input_Magnitude_Parameters','Input_Magnitude_Parameters','Input_Magnitude_Parameters','Input_Magnitude_Parameters','Input_Magnitude_Parameters','Input_Magnitude_Parameters','Output_Filter_Values','Output_Filter_Values','Output_Filter_Values','Output_Filter_Values','Output_Filter_Values']
   keylist=['filter1','filter2','column1','column2','column1type','column2type','yvalue','datafile','racolumn','deccolumn','jwst1','jwst2','modelset','fitorder','outfilename']
   try:
     filename=argv[-1]
     if '.cfg' in filename: 
-      print('Reading cfg file %s' % filename)   
+      print('Reading cfg file %s' % filename,file=log)
       config=ConfigObj(filename)
       for i in range(len(sectionlist)):
+# jwst1 and jwst2 are not needed if the list of filters jwstfilters is given
+        if keylist[i] in ['jwst1','jwst2'] and 'jwstfilters' in config[sectionlist[i]]:
+          continue
         value=config[sectionlist[i]][keylist[i]]
       return config
     else:
@@ -1236,11 +1862,228 @@ def parseArguments(argv):
   except KeyError:
     raise RuntimeError('Failed to parse {}'.format(filename))
 
+def parseOptions(argv):
+# Takes the command line options out of argv, returning a dictionary of the 
+# option values and the remaining arguments.  The options are
+#
+#   --chunksize N    convert the catalogue N rows at a time (overrides the 
+#                    chunksize value in the cfg file)
+#   --plots MODE     make the transformation plots: none, yes, or background
+#   --plotdir DIR    the directory for the transformation plots
+#   --workers N      run the cfg files given as a batch on N processes (0 for 
+#                    one per processor)
+#   --queuedepth N   the number of chunks held between the read, convert, and 
+#                    write stages of a chunked conversion (0 for no overlap)
+#   --profile        write the time and memory use of each stage of the run to
+#                    a JSON file next to the output file
+#   --serve ADDRESS  run as a conversion service on a localhost port 
+#                    ([host:]port) or a Unix socket (unix:path) rather than 
+#                    doing a conversion (see conversion_service.py)
+#   --workdir DIR    the directory the files of the conversions of the service
+#                    must be in (by default the current directory)
+  options={}
+  args=[]
+  n=0
+  while n < len(argv):
+    if argv[n] == '--chunksize' and n+1 < len(argv):
+      options['chunksize']=int(argv[n+1])
+      n=n+2
+    elif argv[n] == '--plots' and n+1 < len(argv):
+      options['plots']=argv[n+1]
+      n=n+2
+    elif argv[n] == '--plotdir' and n+1 < len(argv):
+      options['plotdirectory']=argv[n+1]
+      n=n+2
+    elif argv[n] == '--workers' and n+1 < len(argv):
+      options['workers']=int(argv[n+1])
+      n=n+2
+    elif argv[n] == '--queuedepth' and n+1 < len(argv):
+      options['queuedepth']=int(argv[n+1])
+      n=n+2
+    elif argv[n] == '--profile':
+      options['profile']='yes'
+      n=n+1
+    elif argv[n] == '--serve' and n+1 < len(argv):
+      options['serve']=argv[n+1]
+      n=n+2
+    elif argv[n] == '--workdir' and n+1 < len(argv):
+      options['workdir']=argv[n+1]
+      n=n+2
+    else:
+      args.append(argv[n])
+      n=n+1
+  return options,args
+
+def applyOptions(parameters,options):
+# Puts the command line option values into the cfg file parameters.
+  for key in ['chunksize','queuedepth']:
+    if key in options:
+      parameters['Input_Magnitude_Parameters'][key]=options[key]
+  for key in ['plots','plotdirectory','profile']:
+    if key in options:
+      parameters['Output_Filter_Values'][key]=options[key]
+
+def runJob(cfgfile,options):
+# Does the conversion for one cfg file in a runBatch worker process.  Any 
+# failure, including the sys.exit() calls of autoTransform, is caught so that
+# it only affects this job.  Returns the cfg file name, True or False for 
+# success, the run time, and the text printed by the conversion.
+# cfgfile can also be the cfg file parameters themselves (a ConfigObj), as 
+# for the conversions of the service (see conversion_service.py), so the 
+# messages of the conversion are printed to its own stream rather than to 
+# sys.stdout.  The output is written to a temporary file next to outfilename
+# that replaces it only when the conversion is done, so a failed job leaves
+# an existing file of that name as it was.
+  import time
+  import uuid
+  from io import StringIO
+  start=time.time()
+  log=StringIO()
+  outpath=None
+  try:
+    if isinstance(cfgfile,dict):
+      parameters=cfgfile
+    else:
+      parameters=parseArguments([cfgfile],log)
+    if parameters is None:
+      raise RuntimeError('%s is not a cfg file' % (cfgfile))
+    applyOptions(parameters,options)
+    outfilename=parameters['Output_Filter_Values']['outfilename']
+    directory,name=os.path.split(os.path.abspath(outfilename))
+    outpath=os.path.join(directory,'.%s.%s.tmp' % (name,uuid.uuid4().hex))
+    x=magConGUI()
+    x.log=log
+    x.outputPath=outpath
+    x.autoTransform(parameters)
+    status=os.path.isfile(outpath) and os.path.getsize(outpath) > 0
+    if status:
+      os.replace(outpath,outfilename)
+  except SystemExit:
+    status=False
+  except Exception as error:
+    print('Error: %s' % (error),file=log)
+    status=False
+  finally:
+    if outpath is not None and os.path.isfile(outpath):
+      os.remove(outpath)
+  return cfgfile,status,time.time()-start,log.getvalue()
+
+def runBatch(cfgfiles,options,nworkers):
+# Runs the conversions for a list of cfg files (or glob patterns of cfg files)
+# on a pool of nworkers processes, printing the result of each job as it is 
+# done.  The model grids are shared by all the workers (see shareGrids).  
+# Returns the number of jobs that failed.
+  import glob
+  import multiprocessing
+  jobs=[]
+  for name in cfgfiles:
+    matches=sorted(glob.glob(name))
+    if len(matches) == 0:
+      matches=[name]
+    jobs.extend(matches)
+  if nworkers < 1:
+    nworkers=multiprocessing.cpu_count()
+  nworkers=min(nworkers,len(jobs))
+  nfailed=0
+  memories=[]
+  try:
+    if nworkers <= 1:
+      results=(runJob(cfgfile,options) for cfgfile in jobs)
+      pool=None
+    else:
+      descriptors,memories=shareGrids(jobs)
+      pool=multiprocessing.Pool(nworkers,initializer=attachGrids,initargs=(descriptors,))
+      results=pool.imap_unordered(runJobArguments,[(cfgfile,options) for cfgfile in jobs])
+    for cfgfile,status,runtime,log in results:
+      if status:
+        print('Done   %s (%.2f s)' % (cfgfile,runtime))
+      else:
+        nfailed=nfailed+1
+        lines=log.strip().split('\n')
+        print('FAILED %s (%.2f s): %s' % (cfgfile,runtime,lines[-1]))
+    if pool is not None:
+      pool.close()
+      pool.join()
+  finally:
+    for memory in memories:
+      memory.close()
+      memory.unlink()
+  print('%d of %d jobs done, %d failed.' % (len(jobs)-nfailed,len(jobs),nfailed))
+  return nfailed
+
+def runJobArguments(arguments):
+  return runJob(*arguments)
+
+def gridName(filename):
+# Returns the model set name of a grid file, for messages, or the file name 
+# if it is not one of the model set grids.
+  import magnitude_converter
+  for modelset in magnitude_converter.model_sets:
+    if magnitude_converter.model_sets[modelset][0] == os.path.basename(filename):
+      return modelset
+  return os.path.basename(filename)
+
+def shareGrids(cfgfiles):
+# Reads the grids of the model sets used by a list of cfg files once, before 
+# the worker processes are started, so that the workers share them rather 
+# than each reading its own copy (see grid_cache.share_grid).  Returns the 
+# grid descriptions for attachGrids and the shared memory blocks to free when
+# the batch is done.
+  import magnitude_converter
+  descriptors=[]
+  memories=[]
+  modelsets=[]
+  for cfgfile in cfgfiles:
+    try:
+      modelset=ConfigObj(cfgfile)['Output_Filter_Values']['modelset']
+    except:
+      continue
+    if modelset in magnitude_converter.model_sets and not modelset in modelsets:
+      modelsets.append(modelset)
+  for modelset in modelsets:
+    filename,nfilters=magnitude_converter.model_sets[modelset]
+    try:
+      descriptor,memory=grid_cache.share_grid(os.path.join(path,filename),nfilters)
+    except:
+      continue
+    descriptors.append(descriptor)
+    if memory is not None:
+      memories.append(memory)
+  return descriptors,memories
+
+def attachGrids(descriptors):
+# Puts the grids shared by shareGrids into gridStore in a worker process, as 
+# read-only views of the shared values.  The shared memory blocks are kept in
+# sharedGrids while the process runs.
+  for descriptor in descriptors:
+    values,labels,filterPars,memory=grid_cache.attach_grid(descriptor)
+    key=(descriptor['source'],descriptor['number_of_filters'])
+    index=filter_index.FilterIndex(labels,gridName(descriptor['source']))
+    parameterIndex=grid_parameters.ParameterIndex(descriptor['model_parameters'],gridName(descriptor['source']))
+    gridStore[key]=(tuple(descriptor['source_status']),(values,labels,filterPars,descriptor['source_sha1'],index,parameterIndex))
+    sharedGrids.append(memory)
+
 def main(argv):
   # print('Calling main function')
+  options,argv=parseOptions(argv)
+# With --serve the program stays running, doing the conversions sent to it.
+  if 'serve' in options:
+    import conversion_service
+    conversion_service.serve(options['serve'],options)
+    return
+# With several cfg files, or with the --workers option, the jobs are run as a 
+# batch on a pool of processes.
+  if 'workers' in options or len([x for x in argv[1:] if '.cfg' in x]) > 1:
+    nfailed=runBatch(argv[1:],options,options.get('workers',0))
+    if nfailed > 0:
+      sys.exit(1)
+    return
   parameters=parseArguments(argv)
   print('Parameters', parameters)
+  if parameters is not None:
+    applyOptions(parameters,options)
   if parameters is None:
+    importGUI()
     root=Tk.Tk()
     root.title("JWST Magnitude Simulation Tool")
     x=magConGUI()
@@ -0,0 +1,402 @@
+#! /usr/bin/env python
+#
+"""
+This module provides a library interface to the magnitude conversions done by
+jwst_magnitude_converter.py, for use from other python code without the
+interface, configuration files, or intermediate files.
+
+A MagnitudeConverter object is made once for a model set: the grid of
+simulated magnitudes is read (through the binary grid cache, see
+grid_cache.py) and the fit cache (see fit_cache.py) is opened.  Its convert
+method then takes numpy arrays of the two input magnitudes (or a magnitude and
+a colour) and returns the array of transformed JWST magnitudes, with the same
+values as a non-interactive run of jwst_magnitude_converter.py:
+
+    import magnitude_converter
+    converter = magnitude_converter.MagnitudeConverter('Kurucz')
+    jwst_mags = converter.convert(f814w, f160w, ['HST ACS F814W', 'HST WFC3 F160W'],
+                                  ['NIRISS F115W', 'NIRISS F200W'])
+
+The fits are kept in memory as well as in the fit cache, so repeated calls for
+the same filters only evaluate the transformations.  The methods take a
+selection of the grid rows to fit, such as "teff=3500..6000, logg<3" (see
+grid_parameters.py), whose fits are kept apart from those of the full grid.
+The systematics method gives the matching systematic uncertainty from the
+model scatter about the fits.  The convert method does not change the state of
+the object (other than these saved fits), and errors are raised as exceptions
+rather than ending the program.
+"""
+import os
+import numpy
+import grid_cache
+import fit_cache
+import fit_engine
+import filter_index
+import grid_parameters
+
+# The grid file and number of filters of each model set, under the names used
+# for the modelset parameter of jwst_magnitude_converter.py.
+model_sets = {'Kurucz': ('magslist_old_kurucz.new', 142),
+              'Phoenix': ('magslist_phoenix_grid.new', 121),
+              'blackbody': ('magslist_blackbody.new', 142),
+              'BOSZ': ('magslist_bosz_normal.new', 142)}
+
+# The instrument names of the JWST filters, as at the start of the filter names.
+jwst_instruments = filter_index.jwst_instruments
+
+
+def grid_directory():
+    """
+This routine returns the directory holding the simulated magnitude grids:
+$SIMULATED_MAGNITUDES_PATH if it is set, otherwise the directory of this code.
+    """
+    try:
+        return os.environ['SIMULATED_MAGNITUDES_PATH']
+    except KeyError:
+        return os.path.dirname(os.path.abspath(__file__))
+
+
+def colour_magnitude(mag1, mag2, column_types=('magnitude', 'magnitude')):
+    """
+This routine makes the colour (x) and magnitude (y) values that the
+transformations are applied to from the two input columns, in the same way as
+the non-interactive jwst_magnitude_converter.py.
+
+Parameters:
+
+    mag1, mag2  :  numpy float arrays
+
+        The values of the two input columns.
+
+    column_types  :  tuple of two strings
+
+        The type of each column, 'magnitude' or 'colour'.  At most one of the
+        columns can be a colour, which is taken as filter1 - filter2.
+
+Returns:
+
+    xdata, ydata  :  numpy float arrays
+
+        The colour filter1 - filter2 and the filter1 magnitude.
+
+    """
+    mag1 = numpy.asarray(mag1)
+    mag2 = numpy.asarray(mag2)
+    colour1 = column_types[0] != 'magnitude'
+    colour2 = column_types[1] != 'magnitude'
+    if colour1 and colour2:
+        raise ValueError('Two colours cannot be converted; one column must be a magnitude.')
+    if colour1:
+        return mag1, mag1+mag2
+    if colour2:
+        return mag2, mag1
+    return mag1-mag2, mag1
+
+
+class MagnitudeConverter():
+    """
+This class converts arrays of magnitudes to JWST magnitudes for one model set.
+    """
+    def __init__(self, model_set='Kurucz', fit_cache_file=None, directory=None):
+        """
+Read the model grid and open the fit cache.
+
+Parameters:
+
+    model_set  :  string
+
+        One of 'Kurucz', 'Phoenix', 'blackbody', or 'BOSZ'.
+
+    fit_cache_file  :  string or None
+
+        The fit cache database, None for the default one next to the grids,
+        or 'none' to not use a fit cache.
+
+    directory  :  string or None
+
+        The directory of the grid files, by default from grid_directory().
+
+Errors in reading the grid raise an exception.
+        """
+        if model_set not in model_sets:
+            raise ValueError('Unknown model set %s; the model sets are %s.' %
+                             (model_set, ', '.join(sorted(model_sets))))
+        if directory is None:
+            directory = grid_directory()
+        file_name = os.path.join(directory, model_sets[model_set][0])
+        self.model_set = model_set
+        self.values, self.labels, self.filter_parameters, metadata = \
+            grid_cache.read_magnitude_list(file_name, model_sets[model_set][1])
+        if metadata is None:
+            grid_hash = grid_cache.file_hash(file_name)
+        else:
+            grid_hash = metadata['source_sha1']
+        self.grid_signature = (os.path.basename(file_name), grid_hash)
+        self.names = [label.strip() for label in self.labels]
+        self.index = filter_index.FilterIndex(self.labels, model_set)
+        self.parameter_index = grid_parameters.ParameterIndex(
+            grid_cache.read_model_parameters(file_name, metadata), model_set)
+        if fit_cache_file == 'none':
+            self.fit_cache = None
+        else:
+            if fit_cache_file is None:
+                fit_cache_file = fit_cache.default_cache_file(file_name)
+            self.fit_cache = fit_cache.open_fit_cache(fit_cache_file)
+        self._fits = {}
+        self._tables = {}
+        # The number of fits taken from memory, taken from the fit cache, and
+        # made, for the statistics of conversion_service.py.
+        self.fit_counts = {'memory': 0, 'cache': 0, 'fitted': 0}
+
+    def filter_column(self, name):
+        """
+Return the grid column of a filter, from the filter name index of the grid
+(see filter_index.py).  An unknown or ambiguous name raises a ValueError that
+lists the closest filter names.
+        """
+        return self.index.column(name)
+
+    def target_columns(self, target_filters):
+        """
+Return the grid columns of a list of target filters, in order and without
+repeats.  An entry "all" stands for all the JWST filters and "all NIRISS",
+"all NIRCam", and so on for all the filters of one instrument.
+        """
+        columns = []
+        for n in self.index.target_columns(target_filters):
+            if n not in columns:
+                columns.append(n)
+        return columns
+
+    def selected_rows(self, selection):
+        """
+Return the grid rows that meet a selection (see grid_parameters.parse_selection)
+and the selection key for the fit caches; the rows are None for all of them.
+A selection that cannot be read, or that no rows meet, raises a ValueError.
+        """
+        conditions = grid_parameters.parse_selection(selection)
+        return self.parameter_index.select(conditions), grid_parameters.selection_key(conditions)
+
+    def fit(self, input_filters, target_filters, yvalue=1, norder=4, selection=None):
+        """
+This routine returns the transformation fits for a pair of input filters and
+a list of target filters, taking them from memory or the fit cache when they
+have been done before.
+
+Parameters:
+
+    input_filters  :  tuple of two strings
+
+        The names of the two input filters, such as ('HST ACS F814W', 'HST WFC3 F160W').
+
+    target_filters  :  list of strings
+
+        The names of the target filters (see target_columns).
+
+    yvalue  :  integer
+
+        1 if the transformations are from the colour to filter1 - target, or
+        2 if to filter2 - target, as the yvalue parameter of the configuration
+        files.
+
+    norder  :  integer
+
+        The order of the Legendre polynomial fits, at least 2.
+
+    selection  :  string, list of strings, or None
+
+        The conditions on the model parameters of the grid rows to fit, such
+        as "teff=3500..6000, logg<3" (see grid_parameters.parse_selection),
+        or None to fit all the rows.
+
+Returns:
+
+    coefficients  :  numpy float array
+
+        The (norder+1) x K array of fit coefficients, one column per target.
+
+    fit_range  :  tuple of two floats
+
+        The model colour range of the fits.
+
+    statistics  :  numpy float array
+
+        The K x 3 array of the RMS, minimum, and maximum deviations of the fits.
+
+    labels  :  list of strings
+
+        The names of the K target filters.
+
+        """
+        keys, fit_range, labels = self._fit_entries(input_filters, target_filters, yvalue, norder, selection)
+        coefficients = numpy.stack([self._fits[key][0] for key in keys], axis=-1)
+        statistics = numpy.stack([self._fits[key][1] for key in keys])
+        return coefficients, fit_range, statistics, labels
+
+    def _fit_entries(self, input_filters, target_filters, yvalue, norder, selection=None):
+        """
+Make sure the fits for the given filters are in self._fits, taking them from
+the fit cache or fitting them, and return their keys, the model colour range,
+and the target filter names.  The parameters are the same as for fit.
+        """
+        if norder < 2:
+            raise ValueError('The fit order must be at least 2.')
+        if yvalue not in [1, 2]:
+            raise ValueError('yvalue must be 1 or 2.')
+        yopt = yvalue-1
+        column1 = self.filter_column(input_filters[0])
+        column2 = self.filter_column(input_filters[1])
+        columns = self.target_columns(target_filters)
+        rows, selection_key = self.selected_rows(selection)
+        values = self.values
+        if rows is not None:
+            if len(rows) <= norder:
+                raise ValueError('Only %d model grid rows meet the selection, too few for a fit of order %d.' %
+                                 (len(rows), norder))
+            values = self.values[rows, :]
+        x1 = values[:, column1]
+        y1 = values[:, column2]
+        model_colour = x1-y1
+        fit_range = (float(numpy.min(model_colour)), float(numpy.max(model_colour)))
+        keys = [self.grid_signature+(self.names[column1], self.names[column2], self.names[n],
+                                     int(yopt), int(norder), selection_key) for n in columns]
+        missing = []
+        for k in range(len(columns)):
+            if keys[k] in self._fits:
+                self.fit_counts['memory'] = self.fit_counts['memory']+1
+            else:
+                fit = None
+                if self.fit_cache is not None:
+                    fit = self.fit_cache.get(keys[k])
+                if fit is None or fit['scatter'] is None or len(fit['scatter']) != fit_engine.DEFAULT_SCATTER_BINS:
+                    missing.append(k)
+                else:
+                    self.fit_counts['cache'] = self.fit_counts['cache']+1
+                    self._fits[keys[k]] = (fit['coefficients'],
+                                           numpy.array([fit['rms'], fit['mindev'], fit['maxdev']]),
+                                           fit['scatter'])
+        if len(missing) > 0:
+            self.fit_counts['fitted'] = self.fit_counts['fitted']+len(missing)
+            if yopt == 0:
+                model_values = x1[:, numpy.newaxis]-values[:, [columns[k] for k in missing]]
+            else:
+                model_values = y1[:, numpy.newaxis]-values[:, [columns[k] for k in missing]]
+            new_coefficients, new_statistics = fit_engine.batch_fit(model_colour, model_values, norder)
+            new_scatter = fit_engine.binned_scatter(model_colour, model_values, new_coefficients)
+            for m in range(len(missing)):
+                key = keys[missing[m]]
+                self._fits[key] = (new_coefficients[:, m], new_statistics[m], new_scatter[:, m])
+                if self.fit_cache is not None:
+                    self.fit_cache.put(key, new_coefficients[:, m], fit_range[0], fit_range[1],
+                                       new_statistics[m, 0], new_statistics[m, 1], new_statistics[m, 2],
+                                       new_scatter[:, m])
+        return keys, fit_range, [self.labels[n] for n in columns]
+
+    def fit_scatter(self, input_filters, target_filters, yvalue=1, norder=4, selection=None):
+        """
+This routine returns the RMS deviations of the model values from the fits in
+fit_engine.DEFAULT_SCATTER_BINS equal bins of the model colour (see
+fit_engine.binned_scatter), as an nbins x K array, and the model colour range
+of the bins.  The parameters are the same as for fit.
+        """
+        keys, fit_range, labels = self._fit_entries(input_filters, target_filters, yvalue, norder, selection)
+        return numpy.stack([self._fits[key][2] for key in keys], axis=-1), fit_range
+
+    def lookup_table(self, input_filters, target_filters, yvalue=1, norder=4,
+                     lut_step=fit_engine.DEFAULT_TABLE_STEP, selection=None):
+        """
+This routine returns the lookup table of the transformations for the 'lut'
+engine of convert (see fit_engine.build_lookup_table), and the largest
+interpolation error of the table for each target filter.  The tables are kept
+in memory for later calls.  The parameters are the same as for fit, plus the
+colour step lut_step of the table.
+        """
+        coefficients, fit_range, statistics, labels = self.fit(input_filters, target_filters, yvalue, norder,
+                                                               selection)
+        key = (coefficients.tobytes(), fit_range, lut_step)
+        if key not in self._tables:
+            table = fit_engine.build_lookup_table(coefficients, fit_range[0]-0.5, fit_range[1]+0.5, lut_step)
+            self._tables[key] = (table, fit_engine.lookup_table_error(coefficients, table))
+        return self._tables[key]
+
+    def convert(self, mag1, mag2, input_filters, target_filters, column_types=('magnitude', 'magnitude'),
+                yvalue=1, norder=4, dtype=numpy.float32, engine='legendre',
+                lut_step=fit_engine.DEFAULT_TABLE_STEP, selection=None):
+        """
+This routine converts arrays of input magnitudes to JWST magnitudes.
+
+Parameters:
+
+    mag1, mag2  :  numpy float arrays
+
+        The values of the two input columns, each of length N.
+
+    input_filters  :  tuple of two strings
+
+        The names of the filters of the two columns.
+
+    target_filters  :  list of strings
+
+        The names of the JWST (or other) filters to convert to (see
+        target_columns).
+
+    column_types  :  tuple of two strings
+
+        The type of each column, 'magnitude' or 'colour' (see colour_magnitude).
+
+    yvalue  :  integer
+
+        The transformation type, 1 or 2 as the yvalue configuration parameter.
+
+    norder  :  integer
+
+        The order of the fits.
+
+    dtype  :  numpy dtype
+
+        The type of the returned array; float32 as in the output files.
+
+    engine  :  string
+
+        'legendre' to evaluate the fitted polynomials, or 'lut' to interpolate
+        in a table of them (see lookup_table for its interpolation error).
+
+    lut_step  :  float
+
+        The colour step of the table for the 'lut' engine.
+
+    selection  :  string, list of strings, or None
+
+        The grid rows to fit, as for fit.
+
+Returns:
+
+    magnitudes  :  numpy array
+
+        The N x K array of the transformed magnitudes, one column per target
+        filter in the order of target_columns(target_filters).
+
+        """
+        xdata, ydata = colour_magnitude(mag1, mag2, column_types)
+        if engine == 'lut':
+            table, errors = self.lookup_table(input_filters, target_filters, yvalue, norder, lut_step, selection)
+            return fit_engine.evaluate_lookup_table(xdata, ydata, table, yvalue-1, dtype)
+        if engine != 'legendre':
+            raise ValueError('Unknown engine %s; the engines are legendre and lut.' % (engine))
+        coefficients, fit_range, statistics, labels = self.fit(input_filters, target_filters, yvalue, norder,
+                                                               selection)
+        return fit_engine.evaluate_transformations(xdata, ydata, coefficients, fit_range[0]-0.5,
+                                                   fit_range[1]+0.5, yvalue-1, dtype)
+
+    def systematics(self, mag1, mag2, input_filters, target_filters, column_types=('magnitude', 'magnitude'),
+                    yvalue=1, norder=4, dtype=numpy.float32, selection=None):
+        """
+This routine returns the systematic uncertainty of the transformed magnitudes
+from convert: the model scatter about each fit at the colour of each row,
+interpolated in the binned deviations of fit_scatter (see
+fit_engine.evaluate_scatter).  The parameters are the same as for convert,
+and the N x K array returned is in the same layout as the magnitudes.
+        """
+        xdata, ydata = colour_magnitude(mag1, mag2, column_types)
+        scatter, fit_range = self.fit_scatter(input_filters, target_filters, yvalue, norder, selection)
+        return fit_engine.evaluate_scatter(xdata, scatter, fit_range[0], fit_range[1], dtype)
@@ -21,6 +21,7 @@ import astropy.io.fits as fits
 from configobj import ConfigObj
 import sys
 import os
+import grid_cache
 import tkinter as Tk
 import tkinter.ttk as ttk
 from tkinter.scrolledtext import ScrolledText
@@ -564,30 +565,10 @@ If there is any error in trying to read the file the three values are None.
         """
         if (number_of_filters != len(phoenix_filter_names)) & (number_of_filters != len(kurucz_filter_names)):
             return None,None,None
+        # The values are taken from the binary cache of the grid (see 
+        # grid_cache.py) unless the text file has changed since it was built.
         try:
-            infile = open(input_file_name,'r')
-            model_magnitude_labels = []
-            filter_parameters = numpy.zeros((number_of_filters,3),dtype=numpy.float32)
-            line = infile.readline()
-            line = infile.readline()
-            line = infile.readline()
-            line = infile.readline()
-            line = infile.readline()
-            for i in range(number_of_filters):
-                line = infile.readline()
-                values = line.split()
-                m = len(values)
-                str = ''
-                for n in range(2,m-3):
-                    str = str+values[n]+' '
-                    str = str.replace('filter','')
-                    str = str.replace('Filter','')
-                model_magnitude_labels.append(str)
-                filter_parameters[i,0] = float(values[-3])
-                filter_parameters[i,1] = float(values[-2])
-                filter_parameters[i,2] = float(values[-1])
-            infile.close()
-            model_magnitude_values = numpy.loadtxt(input_file_name)
+            model_magnitude_values,model_magnitude_labels,filter_parameters,metadata = grid_cache.read_magnitude_list(input_file_name,number_of_filters)
             return model_magnitude_values,model_magnitude_labels,filter_parameters
         except:
             return None,None,None
@@ -849,7 +830,7 @@ This saves the current plot as a positscript output file.  There are no
 parameters and no return values.
         """
         outfilename = tkFileDialog.asksaveasfilename(filetypes=[('postscript','*.ps')])
-        if isinstance(outfilename,basestring) and outfilename != '':
+        if isinstance(outfilename,str) and outfilename != '':
             self.plot_figure.savefig(outfile,format="PS")
 
     def makePNG(self):
@@ -858,7 +839,7 @@ This saves the current plot as a PNG output file.  There are not parameters and
 no return values.
         """
         outfilename = tkFileDialog.asksaveasfilename(filetypes=[('PNG','*.png')])
-        if isinstance(outfilename,basestring) and outfilename != '':
+        if isinstance(outfilename,str) and outfilename != '':
             self.plot_figure.savefig(outfile,format="PNG")
 
     def set_plot_position(self,event):
@@ -0,0 +1,213 @@
+#! /usr/bin/env python
+#
+"""
+This module runs the chunked catalogue conversion of
+jwst_magnitude_converter.py as a three stage pipeline: one thread reads (and
+parses) the chunks of the catalogue, one converts them, and one writes them
+out.  The stages are connected by queues holding at most queue_depth chunks,
+so while chunk N is being converted chunk N+1 can be read and chunk N-1
+written, and the memory use is still bounded.  The chunks are written in the
+order they are read, so the output is the same as from a simple loop.
+
+The time each stage spends working, waiting for its input, and waiting for
+room in its output queue is recorded in a PipelineStage object, to show which
+stage limits the conversion.  With queue_depth 0 the stages are run one after
+the other for each chunk in the calling thread, with the same timing.
+"""
+import queue
+import threading
+import time
+
+# The default number of chunks held between two stages of the pipeline.
+DEFAULT_QUEUE_DEPTH = 2
+
+# How long (seconds) a blocked stage waits before checking whether the
+# pipeline has been stopped by an error in another stage.
+POLL_INTERVAL = 0.1
+
+_end_of_data = object()
+
+
+class PipelineStage():
+    """
+This class holds the timing of one stage of the pipeline.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.
+        self.input_wait = 0.
+        self.output_wait = 0.
+
+    def idle(self):
+        """
+Return the total time, in seconds, that the stage spent waiting.
+        """
+        return self.input_wait+self.output_wait
+
+    def summary(self):
+        """
+Return a one line description of the timing of the stage.
+        """
+        return '%-8s %6d chunks   busy %8.3f s   waiting for input %8.3f s   waiting for output %8.3f s' % (
+            self.name, self.items, self.busy, self.input_wait, self.output_wait)
+
+
+def _get(work_queue, stop, stage):
+    """
+Take the next item from a queue, adding the time spent waiting to the input
+wait of the stage.  Returns _end_of_data if the pipeline has been stopped.
+    """
+    start = time.perf_counter()
+    while True:
+        try:
+            item = work_queue.get(timeout=POLL_INTERVAL)
+            break
+        except queue.Empty:
+            if stop.is_set():
+                item = _end_of_data
+                break
+    stage.input_wait = stage.input_wait+time.perf_counter()-start
+    return item
+
+
+def _put(work_queue, item, stop, stage):
+    """
+Put an item on a queue, adding the time spent waiting for room to the output
+wait of the stage.  Returns False if the pipeline has been stopped.
+    """
+    start = time.perf_counter()
+    while True:
+        try:
+            work_queue.put(item, timeout=POLL_INTERVAL)
+            result = True
+            break
+        except queue.Full:
+            if stop.is_set():
+                result = False
+                break
+    stage.output_wait = stage.output_wait+time.perf_counter()-start
+    return result
+
+
+def run_pipeline(chunks, convert, write, queue_depth=DEFAULT_QUEUE_DEPTH):
+    """
+This routine reads, converts, and writes a sequence of chunks with the three
+stages running at the same time in separate threads.
+
+Parameters:
+
+    chunks  :  iterable
+
+        The chunks to convert, such as the generator from
+        catalog_io.read_chunks; the reading is done as it is iterated.
+
+    convert  :  function
+
+        Called with each chunk, returning the converted chunk.
+
+    write  :  function
+
+        Called with each converted chunk, in order.
+
+    queue_depth  :  integer
+
+        The largest number of chunks waiting between two stages, or 0 to run
+        the stages one after the other in the calling thread.
+
+Returns:
+
+    stages  :  list of PipelineStage
+
+        The timing of the read, convert, and write stages.
+
+An exception in any of the stages stops the pipeline and is raised again
+here once all the threads have finished.
+    """
+    stages = [PipelineStage('read'), PipelineStage('convert'), PipelineStage('write')]
+    if queue_depth <= 0:
+        iterator = iter(chunks)
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                stages[0].busy = stages[0].busy+time.perf_counter()-start
+                break
+            middle = time.perf_counter()
+            result = convert(chunk)
+            end = time.perf_counter()
+            write(result)
+            stages[0].busy = stages[0].busy+middle-start
+            stages[1].busy = stages[1].busy+end-middle
+            stages[2].busy = stages[2].busy+time.perf_counter()-end
+            for stage in stages:
+                stage.items = stage.items+1
+        return stages
+
+    read_queue = queue.Queue(queue_depth)
+    write_queue = queue.Queue(queue_depth)
+    stop = threading.Event()
+    errors = []
+
+    def read_stage():
+        stage = stages[0]
+        try:
+            iterator = iter(chunks)
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    stage.busy = stage.busy+time.perf_counter()-start
+                    break
+                stage.busy = stage.busy+time.perf_counter()-start
+                stage.items = stage.items+1
+                if not _put(read_queue, chunk, stop, stage):
+                    return
+        except BaseException as error:
+            errors.append(error)
+            stop.set()
+        _put(read_queue, _end_of_data, stop, stage)
+
+    def write_stage():
+        stage = stages[2]
+        try:
+            while not stop.is_set():
+                result = _get(write_queue, stop, stage)
+                if result is _end_of_data:
+                    break
+                start = time.perf_counter()
+                write(result)
+                stage.busy = stage.busy+time.perf_counter()-start
+                stage.items = stage.items+1
+        except BaseException as error:
+            errors.append(error)
+            stop.set()
+
+    threads = [threading.Thread(target=read_stage, name='pipeline read'),
+               threading.Thread(target=write_stage, name='pipeline write')]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    stage = stages[1]
+    try:
+        while not stop.is_set():
+            chunk = _get(read_queue, stop, stage)
+            if chunk is _end_of_data:
+                break
+            start = time.perf_counter()
+            result = convert(chunk)
+            stage.busy = stage.busy+time.perf_counter()-start
+            stage.items = stage.items+1
+            if not _put(write_queue, result, stop, stage):
+                break
+    except BaseException as error:
+        errors.append(error)
+        stop.set()
+    _put(write_queue, _end_of_data, stop, stage)
+    for thread in threads:
+        thread.join()
+    if len(errors) > 0:
+        raise errors[0]
+    return stages
@@ -0,0 +1,162 @@
+#! /usr/bin/env python
+#
+"""
+This module records where the time and memory of a conversion go, for the
+--profile option (or "profile = yes") of jwst_magnitude_converter.py.
+
+A RunProfile collects, for each named stage of a run (grid load, catalogue
+read, makexy, fitting, evaluation, output write, plotting):
+
+    wall          the elapsed time, in seconds
+
+    cpu           the processor time of the process, in seconds (more than
+                  the wall time if numpy used several threads)
+
+    peak_memory   the largest memory in use during the stage by python and
+                  numpy, in bytes, from tracemalloc (this includes the memory
+                  held from the earlier stages)
+
+    max_rss       the largest resident size of the process so far, in bytes,
+                  when the stage ended
+
+    calls         the number of times the stage was run, as a chunked
+                  conversion runs the stages once per chunk (the times are
+                  summed and the memory values are the largest)
+
+together with counters such as the number of rows converted and the number of
+rows with colours outside the fit range.  The report is written as a JSON
+file.
+
+The stages must not overlap in time, so the stages of a chunked conversion
+are run one after the other (queue depth 0) when it is profiled.
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def max_rss():
+    """
+This routine returns the largest resident set size of the process so far in
+bytes, or None where it is not available.
+    """
+    if resource is None:
+        return None
+    value = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    if sys.platform == 'darwin':
+        return int(value)
+    return int(value)*1024
+
+
+class RunProfile():
+    """
+This class collects the stage timings and counters of one run.
+    """
+    def __init__(self):
+        self.stages = {}
+        self.order = []
+        self.counters = {}
+        self.information = {}
+        self._started = {}
+        self._tracing = not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+
+    def start_stage(self, name):
+        """
+Mark the start of a stage.
+        """
+        tracemalloc.reset_peak()
+        self._started[name] = (time.perf_counter(), time.process_time())
+
+    def end_stage(self, name):
+        """
+Mark the end of a stage started with start_stage, adding its time to the
+stage record.
+        """
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        start_wall, start_cpu = self._started.pop(name)
+        if name not in self.stages:
+            self.stages[name] = {'wall': 0., 'cpu': 0., 'peak_memory': 0, 'max_rss': None, 'calls': 0}
+            self.order.append(name)
+        record = self.stages[name]
+        record['wall'] = record['wall']+wall-start_wall
+        record['cpu'] = record['cpu']+cpu-start_cpu
+        record['peak_memory'] = max(record['peak_memory'], tracemalloc.get_traced_memory()[1])
+        record['max_rss'] = max_rss()
+        record['calls'] = record['calls']+1
+
+    def iterate(self, name, iterable):
+        """
+This is a generator that yields the items of an iterable, timing the
+production of each item as a run of the stage name (for example the reading
+of the chunks of a catalogue).
+        """
+        iterator = iter(iterable)
+        while True:
+            self.start_stage(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.end_stage(name)
+                return
+            self.end_stage(name)
+            yield item
+
+    def fail(self, error):
+        """
+Record that the run failed with an exception, and in which stages.
+        """
+        self.information['status'] = 'failed'
+        self.information['error'] = repr(error)
+        self.information['failed_stages'] = sorted(self._started)
+
+    def count(self, name, value):
+        """
+Add value to the counter name.
+        """
+        self.counters[name] = self.counters.get(name, 0)+int(value)
+
+    def report(self):
+        """
+Return the profile as a dictionary: the stages in the order they were first
+run, the counters, the totals, and the other information set in
+self.information.
+        """
+        values = dict(self.information)
+        values['total'] = {'wall': time.perf_counter()-self.start_wall,
+                           'cpu': time.process_time()-self.start_cpu,
+                           'max_rss': max_rss()}
+        values['stages'] = [dict([('name', name)]+sorted(self.stages[name].items())) for name in self.order]
+        values['counters'] = dict(self.counters)
+        return values
+
+    def write(self, file_name):
+        """
+Write the profile report to a JSON file, and stop the memory tracing if it
+was started for this profile.
+        """
+        with open(file_name, 'w') as outfile:
+            json.dump(self.report(), outfile, indent=1)
+        if self._tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+            self._tracing = False
+
+
+def profile_file_name(output_file_name):
+    """
+Return the name of the profile report of an output file: the output file
+name without its extension and with _profile.json added.
+    """
+    return os.path.splitext(output_file_name)[0]+'_profile.json'
@@ -13,6 +13,7 @@ setup(name="jwst_magnitude_conversion",
                  'Topic :: Software Development :: Libraries :: Python Modules'],
     py_modules=[x.split(".py")[0] for x in glob.glob("*py") if "setup.py" not in x],
     packages=find_packages(),
+    python_requires=">=3.9",
 
     # dependencies should be taken care of by the environment file
     install_requires=["setuptools", "matplotlib", "astropy", "configobj", "numpy"
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""Tests for the asyncio interface to the magnitude conversion."""
+
+import asyncio
+import concurrent.futures
+import os
+import sys
+
+from configobj import ConfigObj
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../'))
+import async_converter
+import jwst_magnitude_converter
+import magnitude_converter
+
+data_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../m31_f814_f160_subset.data')
+
+input_filters = ['HST ACS F814W', 'HST WFC3 F160W']
+targets = ['NIRISS F115W', 'NIRISS F200W']
+
+
+def make_config(outfilename):
+    config = ConfigObj()
+    config['Input_Magnitude_Parameters'] = {'filter1': 'HST_ACS_F814W', 'filter2': 'HST_WFC3_F160W',
+                                            'column1': 3, 'column2': 4, 'column1type': 'magnitude',
+                                            'column2type': 'magnitude', 'yvalue': 2,
+                                            'datafile': data_file, 'racolumn': 1, 'deccolumn': 2}
+    config['Output_Filter_Values'] = {'jwstfilters': targets, 'modelset': 'Kurucz', 'fitorder': 4,
+                                      'fitcache': 'none', 'outfilename': outfilename,
+                                      'systematics': 'yes'}
+    return config
+
+
+def test_convert_catalog(tmp_path):
+    """Test that concurrent catalogue conversions write the same files as autoTransform, with one fit."""
+    config = make_config(str(tmp_path / 'expected.txt'))
+    config.filename = str(tmp_path / 'expected.cfg')
+    config.write()
+    jwst_magnitude_converter.main(['jwst_magnitude_converter.py', config.filename])
+
+    async def convert_all(converter):
+        jobs = []
+        for n in range(3):
+            config = make_config(str(tmp_path / ('out%d.txt' % (n))))
+            config['Input_Magnitude_Parameters']['chunksize'] = 5000
+            jobs.append(converter.convert_catalog(config))
+        return await asyncio.gather(*jobs)
+
+    converter = async_converter.AsyncConverter(fit_cache_file='none')
+    nrows = asyncio.run(convert_all(converter))
+    assert nrows == [24150]*3
+    with open(str(tmp_path / 'expected.txt')) as infile:
+        expected = infile.read()
+    for n in range(3):
+        with open(str(tmp_path / ('out%d.txt' % (n)))) as infile:
+            assert infile.read() == expected
+    # the three conversions share one fit of the two filters
+    assert converter.converters['Kurucz'].fit_counts['fitted'] == 2
+    assert converter.coalesced >= 2
+
+
+def test_convert_process_executor():
+    """Test array conversions evaluated in another process."""
+    data = np.loadtxt(data_file, usecols=(2, 3))
+    library = magnitude_converter.MagnitudeConverter('Kurucz', fit_cache_file='none')
+    expected = library.convert(data[:, 0], data[:, 1], input_filters, targets, yvalue=2, engine='lut')
+    expected_systematics = library.systematics(data[:, 0], data[:, 1], input_filters, targets, yvalue=2)
+
+    async def convert(converter):
+        return await converter.convert(data[:, 0], data[:, 1], input_filters, targets, yvalue=2, engine='lut',
+                                       systematics=True)
+
+    with concurrent.futures.ProcessPoolExecutor(1) as executor:
+        converter = async_converter.AsyncConverter(fit_cache_file='none', executor=executor)
+        magnitudes, systematics = asyncio.run(convert(converter))
+    assert np.array_equal(magnitudes, expected)
+    assert np.array_equal(systematics, expected_systematics)
+
+
+def test_convert_catalog_errors(tmp_path):
+    """Test that bad parameters are refused and a failed conversion closes the catalogue."""
+    config = make_config(str(tmp_path / 'out.txt'))
+    config['Input_Magnitude_Parameters']['computetype'] = 'int8'
+    converter = async_converter.AsyncConverter(fit_cache_file='none')
+    with pytest.raises(ValueError):
+        asyncio.run(converter.convert_catalog(config))
+
+    async def fail(*args):
+        raise RuntimeError('evaluation failed')
+
+    config['Input_Magnitude_Parameters']['computetype'] = 'float32'
+    config['Input_Magnitude_Parameters']['chunksize'] = 5000
+    converter.evaluate = fail
+    with pytest.raises(RuntimeError):
+        asyncio.run(converter.convert_catalog(config))
+    if os.path.isdir('/proc/self/fd'):
+        names = [os.path.realpath(os.path.join('/proc/self/fd', x)) for x in os.listdir('/proc/self/fd')]
+        assert os.path.realpath(data_file) not in names
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""Tests for the catalogue input and output routines."""
+
+import io
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../'))
+import catalog_io
+
+
+def test_read_text_catalog(tmp_path):
+    """Test the single pass reader on an IPAC style table."""
+    filename = str(tmp_path / 'catalog.tbl')
+    with open(filename, 'w') as outfile:
+        outfile.write('\\ an IPAC style header\n')
+        outfile.write('| ra | dec | mag1 | mag2 |\n')
+        outfile.write('1.0 2.0 20.5 19.25\n')
+        outfile.write('00:04:12.123456789012345 -12:01:00.12345678901234 21.0 20.0\n')
+
+    mag1, mag2, ravalues, decvalues = catalog_io.read_text_catalog(filename, 2, 3, 0, 1)
+    assert np.array_equal(mag1, [20.5, 21.0])
+    assert np.array_equal(mag2, [19.25, 20.0])
+    assert list(ravalues) == ['1.0', '00:04:12.123456789012345']
+    assert list(decvalues) == ['2.0', '-12:01:00.12345678901234']
+
+    mag1, mag2, ravalues, decvalues = catalog_io.read_text_catalog(filename, 2, 3, -1, -1)
+    assert ravalues is None and decvalues is None
+
+    chunks = list(catalog_io.read_text_chunks(filename, 2, 3, 0, 1, 3))
+    assert len(chunks) == 2
+    assert list(chunks[1][2]) == ['00:04:12.123456789012345']
+
+    mag1, mag2, ravalues, decvalues = catalog_io.read_text_catalog(filename, 2, 3, 0, 1, np.float32)
+    assert mag1.dtype == np.float32 and mag2.dtype == np.float32
+    assert np.array_equal(mag2, [19.25, 20.0])
+
+
+def test_write_rows():
+    """Test that the block writer matches per-value %10.5f formatting."""
+    values = np.array([0.000005, -0.000005, -0.0, np.nan, np.inf, 12345.678, -1234.5,
+                       -999.999995, 9999.999996, 0.125, -0.125, 21.234375, 3.3333333, -12.0])
+    magnitudes = np.linspace(15., 25., 2*len(values)).astype(np.float32).reshape(len(values), 2)
+    ravalues = np.array(['%.6f' % (10.+n/7.) for n in range(len(values))])
+    expected = ''
+    for n in range(len(values)):
+        expected = expected+'%10.5f %10.5f %10.5f %10.5f %s %s\n' % (
+            values[n], 20., magnitudes[n, 0], magnitudes[n, 1], ravalues[n], ravalues[n])
+    outfile = io.StringIO()
+    catalog_io.write_rows(outfile, [values, np.full(len(values), 20.), magnitudes],
+                          ravalues, ravalues, block_size=5)
+    assert outfile.getvalue() == expected
+
+
+def test_fits_table(tmp_path):
+    """Test the FITS table reader over row ranges and the block writer."""
+    import astropy.io.fits as fits
+
+    filename = str(tmp_path / 'catalog.fits')
+    nrows = 1000
+    magnitudes = np.linspace(15., 25., 2*nrows).reshape(nrows, 2)
+    columns = [fits.Column(name='ra', format='D', array=np.arange(nrows)/10.),
+               fits.Column(name='dec', format='D', array=-np.arange(nrows)/10.),
+               fits.Column(name='mag1', format='E', array=magnitudes[:, 0]),
+               fits.Column(name='mag2', format='D', array=magnitudes[:, 1])]
+    fits.BinTableHDU.from_columns(columns).writeto(filename)
+
+    mag1, mag2, ravalues, decvalues = catalog_io.read_fits_catalog(filename, 2, 3, 0, 1, (10, 20))
+    assert mag1.dtype == np.float32 and mag1.dtype.isnative
+    assert np.array_equal(mag2, magnitudes[10:20, 1])
+    assert np.array_equal(ravalues, np.arange(10, 20)/10.)
+    chunks = list(catalog_io.read_fits_chunks(filename, 2, 3, -1, -1, 300, (100, None)))
+    assert [len(chunk[0]) for chunk in chunks] == [300, 300, 300]
+    assert chunks[0][2] is None
+
+    outname = str(tmp_path / 'output.fits')
+    writer = catalog_io.FitsTableWriter(outname, ['HST ACS F814W - HST WFC3 F160W', 'NIRISS F200W', 'RA'],
+                                        [np.float64, np.float32, np.dtype('U12')], ['mag', 'mag', None])
+    for start in range(0, nrows, 300):
+        writer.write([magnitudes[start:start+300, 0], magnitudes[start:start+300, 1].astype(np.float32),
+                      np.array(['%.3f' % x for x in range(start, min(start+300, nrows))])])
+    writer.close()
+    with fits.open(outname) as hdulist:
+        hdulist.verify('exception')
+        data = hdulist[1].data
+        assert data.columns.names == ['HST_ACS_F814W_minus_HST_WFC3_F160W', 'NIRISS_F200W', 'RA']
+        assert hdulist[1].header['TCOMM2'] == 'NIRISS F200W'
+        assert len(data) == nrows
+        assert np.array_equal(data['HST_ACS_F814W_minus_HST_WFC3_F160W'], magnitudes[:, 0])
+        assert np.array_equal(data['NIRISS_F200W'], magnitudes[:, 1].astype(np.float32))
+        assert data['RA'][999] == '999.000'
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+"""Tests for the conversion service."""
+
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../'))
+import conversion_service
+import magnitude_converter
+
+data_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../m31_f814_f160_subset.data')
+
+targets = ['NIRISS F115W', 'NIRISS F200W']
+
+
+def start_server(address, work_directory=None):
+    """Start the service in a thread, returning the server and its address."""
+    server = conversion_service.make_server(address, verbose=False, fit_cache_file='none',
+                                            work_directory=work_directory)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    if isinstance(server.server_address, tuple):
+        return server, '127.0.0.1:%d' % (server.server_address[1])
+    return server, 'unix:%s' % (server.server_address)
+
+
+def stop_server(server):
+    server.shutdown()
+    server.server_close()
+
+
+def test_parse_address():
+    """Test the service addresses."""
+    assert conversion_service.parse_address('8765') == ('tcp', ('127.0.0.1', 8765))
+    assert conversion_service.parse_address('localhost:8765') == ('tcp', ('localhost', 8765))
+    assert conversion_service.parse_address('unix:/tmp/x.sock') == ('unix', '/tmp/x.sock')
+    with pytest.raises(ValueError):
+        conversion_service.parse_address('0.0.0.0:8765')
+
+
+def test_service(tmp_path):
+    """Test array and catalogue conversions and the statistics of the service."""
+    shutil.copy(data_file, str(tmp_path / 'catalog.data'))
+    server, address = start_server('127.0.0.1:0', str(tmp_path))
+    try:
+        data = np.loadtxt(data_file, usecols=(2, 3))
+        payload = {'mag1': data[:, 0].tolist(), 'mag2': data[:, 1].tolist(), 'filter1': 'HST_ACS_F814W',
+                   'filter2': 'HST WFC3 F160W', 'jwstfilters': targets, 'yvalue': 2, 'format': 'json'}
+        converter = magnitude_converter.MagnitudeConverter('Kurucz', fit_cache_file='none')
+        expected = converter.convert(data[:, 0], data[:, 1], ['HST ACS F814W', 'HST WFC3 F160W'],
+                                     targets, yvalue=2)
+        status, body = conversion_service.request(address, '/convert', payload)
+        assert status == 200
+        values = json.loads(body.decode())
+        assert values['filters'] == targets
+        assert np.array_equal(np.array(values['magnitudes'], dtype=np.float32), expected)
+
+        # the text format has the layout of the output files
+        payload['format'] = 'text'
+        status, body = conversion_service.request(address, '/convert', payload)
+        assert status == 200
+        lines = body.decode().split('\n')
+        assert lines[0] == '# colour magnitude NIRISS_F115W NIRISS_F200W'
+        assert np.allclose(np.loadtxt(lines[1:])[:, 2:], expected, atol=1.e-5)
+
+        # a catalogue conversion with the output file sent back
+        cfg = {'Input_Magnitude_Parameters': {'filter1': 'HST_ACS_F814W', 'filter2': 'HST_WFC3_F160W',
+                                              'column1': '3', 'column2': '4', 'column1type': 'magnitude',
+                                              'column2type': 'magnitude', 'yvalue': '2',
+                                              'datafile': 'catalog.data', 'racolumn': '-1', 'deccolumn': '-1'},
+               'Output_Filter_Values': {'jwstfilters': targets, 'modelset': 'Kurucz', 'fitorder': '4',
+                                        'fitcache': 'none'}}
+        status, body = conversion_service.request(address, '/catalog', cfg)
+        assert status == 200
+        assert np.allclose(np.loadtxt(body.decode().split('\n'))[:, 2:4], expected, atol=1.e-5)
+
+        # and written to a file in the working directory
+        cfg['Output_Filter_Values']['outfilename'] = 'out.txt'
+        status, body = conversion_service.request(address, '/catalog', cfg)
+        assert status == 200
+        assert json.loads(body.decode())['status'] == 'done'
+        assert np.allclose(np.loadtxt(str(tmp_path / 'out.txt'))[:, 2:4], expected, atol=1.e-5)
+
+        # requests that cannot be done
+        status, body = conversion_service.request(address, '/convert', {'mag1': [20.]})
+        assert status == 400
+        assert 'mag2' in json.loads(body.decode())['error']
+        # a failed conversion leaves the earlier output file as it was
+        with open(str(tmp_path / 'out.txt')) as infile:
+            output = infile.read()
+        cfg['Input_Magnitude_Parameters']['filter1'] = 'HST_ACS_F999W'
+        status, body = conversion_service.request(address, '/catalog', cfg)
+        assert status == 422
+        assert 'F999W is not in the Kurucz model set' in json.loads(body.decode())['error']
+        with open(str(tmp_path / 'out.txt')) as infile:
+            assert infile.read() == output
+        assert sorted(os.listdir(str(tmp_path))) == ['catalog.data', 'out.txt']
+        # files outside the working directory are refused
+        for section, key, value in [('Output_Filter_Values', 'outfilename', '../outside.txt'),
+                                    ('Input_Magnitude_Parameters', 'datafile', data_file),
+                                    ('Output_Filter_Values', 'plotname', '../{filter}.png')]:
+            request = {'Input_Magnitude_Parameters': dict(cfg['Input_Magnitude_Parameters']),
+                       'Output_Filter_Values': dict(cfg['Output_Filter_Values'])}
+            request[section][key] = value
+            status, body = conversion_service.request(address, '/catalog', request)
+            assert status in [400, 403]
+        status, body = conversion_service.request(address, '/catalog', {'cfgfile': '/etc/passwd'})
+        assert status == 403
+        assert not os.path.exists(str(tmp_path / '..' / 'outside.txt'))
+
+        # the latency of a request is recorded once its answer has been sent
+        for n in range(100):
+            status, body = conversion_service.request(address, '/stats')
+            assert status == 200
+            values = json.loads(body.decode())
+            if values['requests']['/catalog']['count'] == 7:
+                break
+            time.sleep(0.01)
+        assert values['requests']['/convert']['count'] == 3
+        assert values['requests']['/convert']['failed'] == 1
+        assert values['requests']['/catalog']['count'] == 7
+        assert values['fits']['fitted'] == 2
+        assert values['fits']['memory'] == 2
+        assert 'Kurucz' in values['model_sets']
+    finally:
+        stop_server(server)
+
+
+def test_service_unix_socket():
+    """Test the service on a Unix socket."""
+    socket_dir = tempfile.mkdtemp()
+    try:
+        server, address = start_server('unix:%s' % (os.path.join(socket_dir, 'service.sock')))
+        try:
+            assert conversion_service.request(address, '/health') == (200, b'ok\n')
+        finally:
+            stop_server(server)
+        assert not os.path.exists(os.path.join(socket_dir, 'service.sock'))
+    finally:
+        shutil.rmtree(socket_dir)
+
+
+def test_service_error_after_start(monkeypatch):
+    """Test that an error during a chunked answer only closes the connection."""
+    def failing_write_rows(stream, columns):
+        stream.write('x'*conversion_service.SEND_BUFFER_SIZE)
+        raise RuntimeError('the rows cannot be written')
+
+    monkeypatch.setattr(conversion_service.catalog_io, 'write_rows', failing_write_rows)
+    server, address = start_server('127.0.0.1:0')
+    try:
+        payload = json.dumps({'mag1': [20.0, 21.0], 'mag2': [19.0, 20.0], 'filter1': 'HST_ACS_F814W',
+                              'filter2': 'HST WFC3 F160W', 'jwstfilters': targets, 'yvalue': 2}).encode()
+        host, port = address.split(':')
+        connection = socket.create_connection((host, int(port)), timeout=60)
+        try:
+            connection.sendall(b'POST /convert HTTP/1.1\r\nHost: localhost\r\nContent-Length: %d\r\n\r\n'
+                               % (len(payload)) + payload)
+            answer = b''
+            while True:
+                data = connection.recv(65536)
+                if len(data) == 0:
+                    break
+                answer = answer+data
+        finally:
+            connection.close()
+        # one answer, whose chunked body is left without its end
+        assert answer.startswith(b'HTTP/1.1 200')
+        assert answer.count(b'HTTP/1.1') == 1
+        assert not answer.endswith(b'0\r\n\r\n')
+    finally:
+        stop_server(server)
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+"""Tests for the filter name index of the model grids."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../'))
+import filter_index
+import grid_cache
+
+grid_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                         'magslist_old_kurucz.new')
+
+
+def test_filter_index():
+    """Test exact, underscore, and alias lookups and the errors."""
+    labels = grid_cache.read_magnitude_list(grid_file, 142)[1]
+    index = filter_index.FilterIndex(labels, 'Kurucz')
+    names = [label.strip() for label in labels]
+    for name in names:
+        assert index.column(name) == names.index(name)
+        assert index.column(name.replace(' ', '_').upper()) == names.index(name)
+
+    assert names[index.column('NIRCam F150W')] == 'NIRCam F150W'
+    assert names[index.column('NIRCam_F150W2')] == 'NIRCam F150W2'
+    assert names[index.column('ACS F814W')] == 'HST ACS F814W'
+    assert names[index.column('Bessel U')] == 'Bessell U'
+    assert names[index.column('IRAC 3.6')] == 'IRAC [3.6]'
+    assert names[index.column('F1000W')] == 'MIRI F1000W'
+
+    with pytest.raises(ValueError, match='NIRISS F200W, NIRCam F200W'):
+        index.column('F200W')
+    with pytest.raises(ValueError, match='closest filters are NIRISS F200W'):
+        index.column('NIRISS F20W')
+
+    assert len(index.target_columns(['all'])) == 59
+    assert index.target_columns(['all NIRISS', 'NIRCam_F444W']) == list(range(12)) + [38]
+    with pytest.raises(ValueError):
+        index.target_columns(['all NIRSPC'])
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""Tests for the persistent store of transformation fits."""
+
+import os
+import sqlite3
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../'))
+import fit_cache
+
+
+def test_fit_cache(tmp_path):
+    """Test storage, LRU eviction, and invalidation of fits."""
+    cache = fit_cache.FitCache(str(tmp_path / 'fits.sqlite'), max_entries=2)
+    coefficients = np.array([1.0, 0.5, -0.25, 0.125, 0.0625])
+
+    keys = [('magslist_old_kurucz.new', 'hash1', 'HST ACS F814W', 'HST WFC3 F160W',
+             target, 0, 4) for target in ['NIRISS F115W', 'NIRISS F200W', 'NIRISS F277W']]
+    assert cache.get(keys[0]) is None
+    cache.put(keys[0], coefficients, -1., 3., 0.01, 0., 0.05, np.array([0.01, 0.02, 0.005]))
+    fit = cache.get(keys[0])
+    assert np.array_equal(fit['coefficients'], coefficients)
+    assert np.array_equal(fit['scatter'], [0.01, 0.02, 0.005])
+    assert fit['xmax'] == 3.
+
+    # the least recently used fit is dropped once the store is full
+    cache.put(keys[1], coefficients, -1., 3., 0.01, 0., 0.05)
+    cache.get(keys[0])
+    cache.put(keys[2], coefficients, -1., 3., 0.01, 0., 0.05)
+    assert len(cache) == 2
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+
+    # a store that cannot be written still gives its fits
+    connection = cache.connection
+    cache.connection = sqlite3.connect('file:%s?mode=ro' % (str(tmp_path / 'fits.sqlite')), uri=True)
+    hits = cache.hits
+    assert np.array_equal(cache.get(keys[0])['coefficients'], coefficients)
+    assert cache.hits == hits + 1
+    cache.connection.close()
+    cache.connection = connection
+
+    # a new grid hash removes the fits made from the old grid
+    new_key = keys[0][:1] + ('hash2',) + keys[0][2:]
+    assert cache.get(new_key) is None
+    assert len(cache) == 0
+    cache.close()
+
+
+def test_fit_cache_old_schema(tmp_path):
+    """Test that a store made without the binned scatter column is remade."""
+    import sqlite3
+
+    file_name = str(tmp_path / 'fits.sqlite')
+    connection = sqlite3.connect(file_name)
+    connection.execute('create table fits (model_set text, grid_hash text, filter1 text, filter2 text, '
+                       'target text, yopt integer, norder integer, coefficients blob, xmin real, '
+                       'xmax real, rms real, mindev real, maxdev real, last_used real)')
+    connection.commit()
+    connection.close()
+
+    cache = fit_cache.FitCache(file_name)
+    key = ('magslist_old_kurucz.new', 'hash1', 'HST ACS F814W', 'HST WFC3 F160W', 'NIRISS F115W', 0, 4)
+    cache.put(key, np.array([1.0, 0.5, -0.25]), -1., 3., 0.01, 0., 0.05)
+    assert cache.get(key)['scatter'] is None
+    cache.close()
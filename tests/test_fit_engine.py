@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+"""Tests for the batched Legendre transformation fits."""
+
+import os
+import sys
+
+import numpy as np
+import numpy.polynomial.legendre as legendre
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../'))
+import fit_engine
+import grid_cache
+
+grid_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                         'magslist_blackbody.new')
+
+
+def test_batch_fit():
+    """Test that the batched fits match separate legfit calls."""
+    values = grid_cache.parse_magnitude_list(grid_file, 142)[0]
+    xvalues = values[:, 110] - values[:, 83]
+    yvalues = values[:, 110][:, np.newaxis] - values[:, 0:59]
+
+    results = fit_engine.batch_fit(xvalues, yvalues, [2, 4, 6])
+    for norder, (coefficients, statistics) in zip([2, 4, 6], results):
+        assert coefficients.shape == (norder + 1, 59)
+        assert statistics.shape == (59, 3)
+        for n in [0, 5, 58]:
+            single = legendre.legfit(xvalues, yvalues[:, n], norder)
+            assert np.allclose(coefficients[:, n], single, rtol=1e-10, atol=1e-12)
+            deviations = legendre.legval(xvalues, single) - yvalues[:, n]
+            assert np.isclose(statistics[n, 0], np.sqrt(np.mean(deviations**2)))
+            assert np.isclose(statistics[n, 2], np.max(np.abs(deviations)))
+
+
+def test_evaluate_transformations():
+    """Test the one-pass evaluation against legval with clamping."""
+    values = grid_cache.parse_magnitude_list(grid_file, 142)[0]
+    xmodel = values[:, 110] - values[:, 83]
+    ymodel = values[:, 110][:, np.newaxis] - values[:, [1, 5]]
+    coefficients = fit_engine.legendre_fit(xmodel, ymodel, 4)
+    xmin = np.min(xmodel) - 0.5
+    xmax = np.max(xmodel) + 0.5
+
+    rng = np.random.default_rng(1)
+    xdata = rng.uniform(xmin - 2., xmax + 2., 1000)
+    ydata = rng.uniform(15., 25., 1000)
+    for yopt in [0, 1]:
+        magnitudes = fit_engine.evaluate_transformations(xdata, ydata, coefficients,
+                                                         xmin, xmax, yopt)
+        assert magnitudes.shape == (1000, 2)
+        assert magnitudes.dtype == np.float32
+        for k in range(2):
+            newcol = legendre.legval(xdata, coefficients[:, k])
+            newcol[xdata < xmin] = legendre.legval(xmin, coefficients[:, k])
+            newcol[xdata > xmax] = legendre.legval(xmax, coefficients[:, k])
+            expected = ydata - newcol if yopt == 0 else ydata + xdata - newcol
+            assert np.allclose(magnitudes[:, k], expected.astype(np.float32), atol=1e-5)
+
+
+def test_lookup_table():
+    """Test the lookup table engine against the polynomial evaluation."""
+    values = grid_cache.parse_magnitude_list(grid_file, 142)[0]
+    xmodel = values[:, 110] - values[:, 83]
+    ymodel = values[:, 110][:, np.newaxis] - values[:, [1, 5, 40]]
+    coefficients = fit_engine.legendre_fit(xmodel, ymodel, 4)
+    xmin = np.min(xmodel) - 0.5
+    xmax = np.max(xmodel) + 0.5
+
+    rng = np.random.default_rng(2)
+    xdata = rng.uniform(xmin - 2., xmax + 2., 50000)
+    ydata = rng.uniform(15., 25., 50000)
+    for step in [0.001, 0.05]:
+        table = fit_engine.build_lookup_table(coefficients, xmin, xmax, step)
+        errors = fit_engine.lookup_table_error(coefficients, table)
+        assert errors.shape == (3,)
+        for yopt in [0, 1]:
+            expected = fit_engine.evaluate_transformations(xdata, ydata, coefficients,
+                                                           xmin, xmax, yopt)
+            magnitudes = fit_engine.evaluate_lookup_table(xdata, ydata, table, yopt)
+            assert magnitudes.dtype == np.float32
+            assert np.all(np.abs(magnitudes - expected) <= errors + 1e-5)
+    assert np.all(errors > fit_engine.lookup_table_error(
+        coefficients, fit_engine.build_lookup_table(coefficients, xmin, xmax, 0.001)))
+
+
+def test_propagate_errors():
+    """Test the propagated uncertainties against numerical derivatives."""
+    values = grid_cache.parse_magnitude_list(grid_file, 142)[0]
+    xmodel = values[:, 110] - values[:, 83]
+    ymodel = values[:, 110][:, np.newaxis] - values[:, [1, 5]]
+    coefficients = fit_engine.legendre_fit(xmodel, ymodel, 4)
+    xmin = np.min(xmodel) - 0.5
+    xmax = np.max(xmodel) + 0.5
+
+    rng = np.random.default_rng(3)
+    mag1 = rng.uniform(15., 25., 1000)
+    mag2 = mag1 - rng.uniform(xmin - 1., xmax + 1., 1000)
+    errors1 = rng.uniform(0.01, 0.1, 1000)
+    errors2 = rng.uniform(0.01, 0.1, 1000)
+    # both input columns magnitudes, the magnitude being the first or the second
+    for weights in [(1., -1., 1., 0.), (1., -1., 0., 1.)]:
+        for yopt in [0, 1]:
+            def transform(a, b):
+                xdata = weights[0] * a + weights[1] * b
+                ydata = weights[2] * a + weights[3] * b
+                return fit_engine.evaluate_transformations(xdata, ydata, coefficients, xmin, xmax,
+                                                           yopt, np.float64)
+
+            delta = 1.e-6
+            slope1 = (transform(mag1 + delta, mag2) - transform(mag1 - delta, mag2)) / (2 * delta)
+            slope2 = (transform(mag1, mag2 + delta) - transform(mag1, mag2 - delta)) / (2 * delta)
+            expected = np.sqrt((slope1 * errors1[:, np.newaxis]) ** 2 + (slope2 * errors2[:, np.newaxis]) ** 2)
+            propagated = fit_engine.propagate_errors(mag1 - mag2, errors1, errors2, coefficients,
+                                                     xmin, xmax, yopt, weights)
+            assert propagated.shape == (1000, 2)
+            assert np.allclose(propagated, expected, rtol=1e-4, atol=1e-6)
+            only1 = fit_engine.propagate_errors(mag1 - mag2, errors1, None, coefficients,
+                                                xmin, xmax, yopt, weights)
+            assert np.allclose(only1, np.abs(slope1 * errors1[:, np.newaxis]), rtol=1e-4, atol=1e-6)
+
+
+def test_binned_scatter():
+    """Test the binned fit deviations and their interpolation to the data colours."""
+    values = grid_cache.parse_magnitude_list(grid_file, 142)[0]
+    xmodel = values[:, 110] - values[:, 83]
+    ymodel = values[:, 110][:, np.newaxis] - values[:, [1, 5]]
+    coefficients = fit_engine.legendre_fit(xmodel, ymodel, 4)
+
+    scatter = fit_engine.binned_scatter(xmodel, ymodel, coefficients, 10)
+    assert scatter.shape == (10, 2)
+    edges = np.linspace(np.min(xmodel), np.max(xmodel), 11)
+    index = np.minimum(np.searchsorted(edges, xmodel, side='right') - 1, 9)
+    deviations = np.dot(legendre.legvander(xmodel, 4), coefficients) - ymodel
+    for n in range(10):
+        if np.any(index == n):
+            expected = np.sqrt(np.mean(deviations[index == n] ** 2, axis=0))
+            assert np.allclose(scatter[n], expected)
+    # the overall RMS is recovered from the bins weighted by their counts
+    counts = np.bincount(index, minlength=10)
+    rms = fit_engine.fit_residuals(xmodel, ymodel, coefficients)[:, 0]
+    assert np.allclose(np.sqrt(np.sum(counts[:, np.newaxis] * scatter ** 2, axis=0) / len(xmodel)), rms)
+
+    centres = 0.5 * (edges[0:-1] + edges[1:])
+    xdata = np.concatenate([centres, [edges[0] - 1., edges[-1] + 1., 0.5 * (centres[3] + centres[4])]])
+    systematics = fit_engine.evaluate_scatter(xdata, scatter, edges[0], edges[-1])
+    assert systematics.dtype == np.float32
+    assert np.allclose(systematics[0:10], scatter, rtol=1e-6)
+    assert np.allclose(systematics[10], scatter[0], rtol=1e-6)
+    assert np.allclose(systematics[11], scatter[-1], rtol=1e-6)
+    assert np.allclose(systematics[12], 0.5 * (scatter[3] + scatter[4]), rtol=1e-6)
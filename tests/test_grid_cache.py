@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""Tests for the binary cache of the simulated magnitude grids."""
+
+import os
+import shutil
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../'))
+import grid_cache
+
+grid_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                         'magslist_blackbody.new')
+
+
+def test_grid_cache(tmp_path):
+    """Test that the cached grid matches the text grid and follows changes."""
+    source = str(tmp_path / 'magslist_blackbody.new')
+    shutil.copy(grid_file, source)
+
+    values, labels, filter_parameters = grid_cache.parse_magnitude_list(source, 142)
+    cached_values, cached_labels, cached_parameters, metadata = \
+        grid_cache.read_magnitude_list(source, 142)
+
+    assert metadata is not None
+    assert isinstance(cached_values, np.memmap)
+    assert cached_values.flags['F_CONTIGUOUS']
+    assert np.array_equal(values, cached_values)
+    assert labels == cached_labels
+    assert np.array_equal(filter_parameters, cached_parameters)
+
+    # modify the text grid: the cache has to be rebuilt
+    with open(source, 'r') as infile:
+        lines = infile.readlines()
+    with open(source, 'w') as outfile:
+        outfile.writelines(lines[:-1])
+    new_values, new_labels, new_parameters, new_metadata = \
+        grid_cache.read_magnitude_list(source, 142)
+    assert new_values.shape[0] == values.shape[0] - 1
+    assert new_metadata['source_sha1'] != metadata['source_sha1']
+
+    # each build writes its values to a new file named in its metadata, and
+    # the values of the earlier build are removed
+    assert new_metadata['build'] != metadata['build']
+    assert os.path.isfile(grid_cache.cache_file_names(source, new_metadata)[0])
+    assert not os.path.exists(grid_cache.cache_file_names(source, metadata)[0])
+
+
+def test_share_grid(tmp_path):
+    """Test sharing a grid through the cache file and through shared memory."""
+    source = str(tmp_path / 'magslist_blackbody.new')
+    shutil.copy(grid_file, source)
+    values, labels, filter_parameters = grid_cache.parse_magnitude_list(source, 142)
+
+    for use_cache in [True, False]:
+        descriptor, memory = grid_cache.share_grid(source, 142, use_cache)
+        assert (memory is None) == use_cache
+        shared_values, shared_labels, shared_parameters, shared_memory = \
+            grid_cache.attach_grid(descriptor)
+        assert np.array_equal(values, shared_values)
+        assert not shared_values.flags['WRITEABLE']
+        assert shared_labels == labels
+        del shared_values
+        if memory is not None:
+            shared_memory.close()
+            memory.close()
+            memory.unlink()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""Tests for the selection of model grid rows by the model parameters."""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../'))
+import grid_parameters
+
+grid_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def test_parse_selection():
+    """Test reading selections and their fit cache keys."""
+    conditions = grid_parameters.parse_selection('teff=3500..6000, log(g)<3, [Fe/H]>=-1')
+    assert conditions == [('teff', 3500., 6000., True, True), ('logg', None, 3., False, False),
+                          ('[M/H]', -1., None, True, False)]
+    # a list from a configobj file, in another order and spelling, is the same selection
+    same = grid_parameters.parse_selection(['Fe/H >= -1.0', 'T = 3500 .. 6000', 'logg < 3'])
+    assert grid_parameters.selection_key(same) == grid_parameters.selection_key(conditions)
+    assert grid_parameters.parse_selection(None) == []
+    assert grid_parameters.parse_selection('all') == []
+    assert grid_parameters.selection_key([]) == ''
+    for selection in ['teff', 'mass<3', 'teff<3..5', 'logg=high']:
+        with pytest.raises(ValueError):
+            grid_parameters.parse_selection(selection)
+
+
+def test_parameter_index():
+    """Test the index selections against a pass over the grid parameters."""
+    parameters = grid_parameters.parse_grid_parameters(os.path.join(grid_directory, 'magslist_old_kurucz.new'))
+    assert parameters.shape == (412, 3)
+    assert not np.any(np.isnan(parameters))
+    index = grid_parameters.ParameterIndex(parameters, 'Kurucz')
+    assert index.select([]) is None
+
+    teff, logg = parameters[:, 0], parameters[:, 1]
+    for selection, mask in [('teff=3500..6000', (teff >= 3500) & (teff <= 6000)),
+                            ('teff>6000, logg<=3', (teff > 6000) & (logg <= 3)),
+                            ('logg=4.5', logg == 4.5),
+                            ('teff<5000, z=0', teff < 5000)]:
+        rows = index.select(grid_parameters.parse_selection(selection))
+        assert np.array_equal(rows, np.nonzero(mask)[0])
+
+    with pytest.raises(ValueError):
+        index.select(grid_parameters.parse_selection('teff>1.e6'))
+
+    # the blackbodies have temperatures only
+    parameters = grid_parameters.parse_grid_parameters(os.path.join(grid_directory, 'magslist_blackbody.new'))
+    index = grid_parameters.ParameterIndex(parameters, 'blackbody')
+    assert index.counts[0] == len(parameters) and index.counts[1] == 0
+    assert np.isnan(index.ranges()['logg'][0])
+    with pytest.raises(ValueError):
+        index.select(grid_parameters.parse_selection('logg<3'))
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""Tests for the library interface to the magnitude conversion."""
+
+import os
+import sys
+
+from configobj import ConfigObj
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../'))
+import jwst_magnitude_converter
+import magnitude_converter
+
+data_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../m31_f814_f160_subset.data')
+
+
+def test_convert(tmp_path):
+    """Test that convert gives the values written by a non-interactive run."""
+    targets = ['NIRISS F115W', 'NIRISS F200W', 'NIRCam F444W']
+    config = ConfigObj()
+    config['Input_Magnitude_Parameters'] = {'filter1': 'HST_ACS_F814W', 'filter2': 'HST_WFC3_F160W',
+                                            'column1': 3, 'column2': 4, 'column1type': 'magnitude',
+                                            'column2type': 'magnitude', 'yvalue': 2,
+                                            'datafile': data_file, 'racolumn': -1, 'deccolumn': -1}
+    config['Output_Filter_Values'] = {'jwstfilters': targets, 'modelset': 'Kurucz', 'fitorder': 4,
+                                      'fitcache': 'none', 'outfilename': str(tmp_path / 'out.txt'),
+                                      'systematics': 'yes'}
+    config.filename = str(tmp_path / 'convert.cfg')
+    config.write()
+    jwst_magnitude_converter.main(['jwst_magnitude_converter.py', config.filename])
+    expected = np.loadtxt(str(tmp_path / 'out.txt'))[:, 2:5]
+    expected_systematics = np.loadtxt(str(tmp_path / 'out.txt'))[:, 5:]
+
+    converter = magnitude_converter.MagnitudeConverter('Kurucz', fit_cache_file='none')
+    data = np.loadtxt(data_file, usecols=(2, 3))
+    for n in range(2):
+        magnitudes = converter.convert(data[:, 0], data[:, 1], ['HST ACS F814W', 'HST_WFC3_F160W'],
+                                       targets, yvalue=2)
+        assert magnitudes.shape == (len(data), 3)
+        assert np.max(np.abs(magnitudes-expected)) < 1.e-5
+    systematics = converter.systematics(data[:, 0], data[:, 1], ['HST ACS F814W', 'HST_WFC3_F160W'],
+                                        targets, yvalue=2)
+    assert systematics.shape == (len(data), 3)
+    assert np.max(np.abs(systematics-expected_systematics)) < 1.e-5
+
+    with pytest.raises(ValueError):
+        converter.convert(data[:, 0], data[:, 1], ['HST ACS F814W', 'HST WFC3 F160W'], ['NIRISS F999W'])
+
+
+def test_convert_selection(tmp_path):
+    """Test fits to a selection of the grid rows, in a non-interactive run and in convert."""
+    targets = ['NIRISS F115W', 'NIRISS F200W']
+    selection = 'teff=3500..6000, logg<=3'
+    config = ConfigObj()
+    config['Input_Magnitude_Parameters'] = {'filter1': 'HST_ACS_F814W', 'filter2': 'HST_WFC3_F160W',
+                                            'column1': 3, 'column2': 4, 'column1type': 'magnitude',
+                                            'column2type': 'magnitude', 'yvalue': 2,
+                                            'datafile': data_file, 'racolumn': -1, 'deccolumn': -1}
+    config['Output_Filter_Values'] = {'jwstfilters': targets, 'modelset': 'Kurucz', 'fitorder': 4,
+                                      'fitcache': str(tmp_path / 'fits.sqlite'),
+                                      'outfilename': str(tmp_path / 'out.txt'), 'selection': selection}
+    config.filename = str(tmp_path / 'selection.cfg')
+    config.write()
+    jwst_magnitude_converter.main(['jwst_magnitude_converter.py', config.filename])
+    expected = np.loadtxt(str(tmp_path / 'out.txt'))[:, 2:4]
+
+    # the fits of the selection and of the whole grid are cached apart
+    converter = magnitude_converter.MagnitudeConverter('Kurucz', fit_cache_file=str(tmp_path / 'fits.sqlite'))
+    data = np.loadtxt(data_file, usecols=(2, 3))
+    input_filters = ['HST ACS F814W', 'HST WFC3 F160W']
+    magnitudes = converter.convert(data[:, 0], data[:, 1], input_filters, targets, yvalue=2,
+                                   selection=selection)
+    assert converter.fit_counts['cache'] == 2 and converter.fit_counts['fitted'] == 0
+    assert np.max(np.abs(magnitudes-expected)) < 1.e-5
+    all_rows = converter.convert(data[:, 0], data[:, 1], input_filters, targets, yvalue=2)
+    assert converter.fit_counts['fitted'] == 2
+    assert np.max(np.abs(all_rows-magnitudes)) > 1.e-3
+    assert np.array_equal(converter.convert(data[:, 0], data[:, 1], input_filters, targets, yvalue=2,
+                                            selection='all'), all_rows)
+
+    with pytest.raises(ValueError):
+        converter.convert(data[:, 0], data[:, 1], input_filters, targets, selection='teff>1.e6')
@@ -8,7 +8,9 @@ Authors
 
 """
 
+import json
 import os
+import shutil
 import sys
 
 from astropy.table import Table
@@ -103,3 +105,232 @@ def test_niriss():
 
 
     catalog.pprint()
+
+
+def make_config(out_dir, cfg_name):
+    """Write the NIRISS test catalog and return a converter configuration for it."""
+    catalog_file = os.path.join(test_data_dir, 'niriss', 'catalog.txt')
+    catalog = Table.read(catalog_file, format='ascii.basic', delimiter=',')
+    temp_cat_file = os.path.join(out_dir, 'temp_catalog.txt')
+    catalog.write(temp_cat_file, format='ascii.no_header', overwrite=True)
+
+    mag_conv_config = ConfigObj()
+    mag_conv_config['Input_Magnitude_Parameters'] = {}
+    mag_conv_config['Input_Magnitude_Parameters']['filter1'] = 'HST_ACS_F606W'
+    mag_conv_config['Input_Magnitude_Parameters']['filter2'] = '2MASS_Ks'
+    mag_conv_config['Input_Magnitude_Parameters']['column1'] = catalog.colnames.index('vcal') + 1
+    mag_conv_config['Input_Magnitude_Parameters']['column2'] = catalog.colnames.index('kuse') + 1
+    mag_conv_config['Input_Magnitude_Parameters']['column1type'] = 'magnitude'
+    mag_conv_config['Input_Magnitude_Parameters']['column2type'] = 'magnitude'
+    mag_conv_config['Input_Magnitude_Parameters']['yvalue'] = 1
+    mag_conv_config['Input_Magnitude_Parameters']['datafile'] = temp_cat_file
+    mag_conv_config['Input_Magnitude_Parameters']['racolumn'] = catalog.colnames.index('ra') + 1
+    mag_conv_config['Input_Magnitude_Parameters']['deccolumn'] = catalog.colnames.index('dec') + 1
+    mag_conv_config['Output_Filter_Values'] = {}
+    mag_conv_config['Output_Filter_Values']['modelset'] = 'Kurucz'
+    mag_conv_config['Output_Filter_Values']['fitorder'] = 4
+    mag_conv_config.filename = os.path.join(out_dir, cfg_name)
+    return catalog, mag_conv_config
+
+
+def test_niriss_multiple_filters():
+    """Test conversion to several NIRISS filters in a single run."""
+    instrument = 'NIRISS'
+
+    out_dir = os.path.join(test_data_dir, 'temporary_data')
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    niriss_filters = ['{} {}'.format(instrument, filter) for filter in
+                      ['F200W', 'F277W', 'F380M', 'F480M']]
+    catalog, mag_conv_config = make_config(out_dir, 'mag_conv_multiple.cfg')
+
+    # the listed filters, then all the NIRISS filters, in one run each
+    for name, filters, number_of_filters in [('list', niriss_filters, 4),
+                                             ('all', 'all NIRISS', 12)]:
+        filename = os.path.join(out_dir, 'converted_magnitudes_{}.txt'.format(name))
+        mag_conv_config['Output_Filter_Values']['jwstfilters'] = filters
+        mag_conv_config['Output_Filter_Values']['outfilename'] = filename
+        mag_conv_config.write()
+        jwst_magnitude_converter.main(['jwst_magnitude_converter.py',
+                                       mag_conv_config.filename])
+
+        niriss_mags = np.loadtxt(filename)
+        assert niriss_mags.shape == (len(catalog), number_of_filters + 4)
+        with open(filename) as infile:
+            header = infile.readline()
+        for niriss_filter in niriss_filters:
+            assert niriss_filter in header
+
+
+def test_other_grid_filters():
+    """Test conversion to grid filters that are not JWST filters."""
+    out_dir = os.path.join(test_data_dir, 'temporary_data')
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    catalog, mag_conv_config = make_config(out_dir, 'mag_conv_other.cfg')
+    filename = os.path.join(out_dir, 'converted_magnitudes_other.txt')
+    mag_conv_config['Output_Filter_Values']['jwstfilters'] = ['all WISE', 'Johnson V']
+    mag_conv_config['Output_Filter_Values']['outfilename'] = filename
+    mag_conv_config.write()
+    jwst_magnitude_converter.main(['jwst_magnitude_converter.py', mag_conv_config.filename])
+
+    magnitudes = np.loadtxt(filename)
+    assert magnitudes.shape == (len(catalog), 5 + 4)
+    with open(filename) as infile:
+        header = infile.readline()
+    assert 'WISE W4' in header and 'Johnson V' in header
+
+
+def test_niriss_chunked():
+    """Test that chunked conversion writes the same file as a single pass."""
+    out_dir = os.path.join(test_data_dir, 'temporary_data')
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    catalog, mag_conv_config = make_config(out_dir, 'mag_conv_chunked.cfg')
+    mag_conv_config['Output_Filter_Values']['jwstfilters'] = 'all NIRISS'
+    output = {}
+    for chunksize in [0, 1000]:
+        filename = os.path.join(out_dir, 'converted_magnitudes_{}.txt'.format(chunksize))
+        mag_conv_config['Output_Filter_Values']['outfilename'] = filename
+        mag_conv_config.write()
+        jwst_magnitude_converter.main(['jwst_magnitude_converter.py', '--chunksize',
+                                       str(chunksize), mag_conv_config.filename])
+        with open(filename) as infile:
+            output[chunksize] = infile.read()
+
+    assert output[0] == output[1000]
+
+
+def test_niriss_float32():
+    """Test that a single precision conversion agrees with the double precision one."""
+    out_dir = os.path.join(test_data_dir, 'temporary_data')
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    catalog, mag_conv_config = make_config(out_dir, 'mag_conv_float32.cfg')
+    mag_conv_config['Output_Filter_Values']['jwstfilters'] = 'all NIRISS'
+    output = {}
+    for computetype in ['float64', 'float32']:
+        for chunksize in [0, 1000]:
+            filename = os.path.join(out_dir, 'converted_{}_{}.txt'.format(computetype, chunksize))
+            mag_conv_config['Input_Magnitude_Parameters']['computetype'] = computetype
+            mag_conv_config['Output_Filter_Values']['outfilename'] = filename
+            mag_conv_config.write()
+            jwst_magnitude_converter.main(['jwst_magnitude_converter.py', '--chunksize', str(chunksize),
+                                           '--queuedepth', '0', mag_conv_config.filename])
+            output[computetype, chunksize] = np.loadtxt(filename)
+
+    assert np.array_equal(output['float64', 0], output['float64', 1000])
+    assert np.array_equal(output['float32', 0], output['float32', 1000])
+    assert np.max(np.abs(output['float32', 0] - output['float64', 0])) <= 2.e-5
+
+
+def test_niriss_errors():
+    """Test that the uncertainties of the input magnitudes are propagated and written out."""
+    out_dir = os.path.join(test_data_dir, 'temporary_data')
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    catalog, mag_conv_config = make_config(out_dir, 'mag_conv_errors.cfg')
+    catalog['vcal_error'] = 0.02
+    catalog['kuse_error'] = 0.05
+    catalog.write(mag_conv_config['Input_Magnitude_Parameters']['datafile'], format='ascii.no_header',
+                  overwrite=True)
+    mag_conv_config['Input_Magnitude_Parameters']['error1column'] = catalog.colnames.index('vcal_error') + 1
+    mag_conv_config['Input_Magnitude_Parameters']['error2column'] = catalog.colnames.index('kuse_error') + 1
+    niriss_filters = ['NIRISS F200W', 'NIRISS F277W']
+    mag_conv_config['Output_Filter_Values']['jwstfilters'] = niriss_filters
+    output = {}
+    for chunksize in [0, 1000]:
+        filename = os.path.join(out_dir, 'converted_errors_{}.txt'.format(chunksize))
+        mag_conv_config['Output_Filter_Values']['outfilename'] = filename
+        mag_conv_config.write()
+        jwst_magnitude_converter.main(['jwst_magnitude_converter.py', '--chunksize', str(chunksize),
+                                       mag_conv_config.filename])
+        with open(filename) as infile:
+            output[chunksize] = infile.read()
+    assert output[0] == output[1000]
+
+    header = output[0].split('\n')[0]
+    for niriss_filter in niriss_filters:
+        assert niriss_filter + ' error' in header
+    niriss_mags = np.loadtxt(filename)
+    # J = V - f(V - K), so the error is sqrt(((1 - f') 0.02)**2 + (f' 0.05)**2),
+    # which is just the V error where the colour is outside the fit range
+    assert np.all(niriss_mags[:, 4:6] >= 0.0185) and np.all(niriss_mags[:, 4:6] <= 0.06)
+    clamped = niriss_mags[:, 0] > 6.5
+    assert np.any(clamped)
+    assert np.allclose(niriss_mags[clamped, 4:6], 0.02)
+
+
+def test_niriss_profile():
+    """Test the run profile written with --profile, for single pass and chunked runs."""
+    out_dir = os.path.join(test_data_dir, 'temporary_data')
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    catalog, mag_conv_config = make_config(out_dir, 'mag_conv_profile.cfg')
+    mag_conv_config['Output_Filter_Values']['jwstfilters'] = ['NIRISS F200W', 'NIRISS F277W']
+    stages = ['grid_load', 'catalog_read', 'makexy', 'fitting', 'evaluation', 'output_write']
+    for chunksize in [0, 1000]:
+        filename = os.path.join(out_dir, 'profiled_{}.txt'.format(chunksize))
+        mag_conv_config['Output_Filter_Values']['outfilename'] = filename
+        mag_conv_config.write()
+        jwst_magnitude_converter.main(['jwst_magnitude_converter.py', '--profile', '--chunksize',
+                                       str(chunksize), mag_conv_config.filename])
+        with open(os.path.join(out_dir, 'profiled_{}_profile.json'.format(chunksize))) as infile:
+            profile = json.load(infile)
+        assert profile['status'] == 'ok'
+        assert sorted([stage['name'] for stage in profile['stages']]) == sorted(stages)
+        assert profile['counters']['rows'] == len(catalog)
+        assert 0 <= profile['counters']['clamped_rows'] <= len(catalog)
+        for stage in profile['stages']:
+            assert stage['wall'] >= 0. and stage['cpu'] >= 0. and stage['peak_memory'] > 0
+
+
+def test_niriss_plots():
+    """Test that the transformation plots are only made when asked for."""
+    out_dir = os.path.join(test_data_dir, 'temporary_data')
+    plot_dir = os.path.join(out_dir, 'plots')
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    # plots left by an earlier run
+    if os.path.isdir(plot_dir):
+        shutil.rmtree(plot_dir)
+
+    catalog, mag_conv_config = make_config(out_dir, 'mag_conv_plots.cfg')
+    mag_conv_config['Output_Filter_Values']['jwstfilters'] = ['NIRISS F200W', 'NIRISS F277W']
+    mag_conv_config['Output_Filter_Values']['outfilename'] = os.path.join(out_dir, 'plotted.txt')
+    mag_conv_config['Output_Filter_Values']['plotname'] = '{output}_{filter}.png'
+    mag_conv_config.write()
+    jwst_magnitude_converter.main(['jwst_magnitude_converter.py', '--plotdir', plot_dir,
+                                   mag_conv_config.filename])
+    assert not os.path.isdir(plot_dir)
+
+    jwst_magnitude_converter.main(['jwst_magnitude_converter.py', '--plots', 'yes',
+                                   '--plotdir', plot_dir, mag_conv_config.filename])
+    assert sorted(os.listdir(plot_dir)) == ['plotted_NIRISS_F200W.png', 'plotted_NIRISS_F277W.png']
+
+
+def test_niriss_batch():
+    """Test a batch of cfg files on a process pool, with one failing job."""
+    out_dir = os.path.join(test_data_dir, 'temporary_data', 'batch')
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    for n, filters in enumerate(['NIRISS F200W', 'NIRISS F277W', 'NIRISS F999W']):
+        catalog, mag_conv_config = make_config(out_dir, 'batch_{}.cfg'.format(n))
+        mag_conv_config['Output_Filter_Values']['jwstfilters'] = filters
+        mag_conv_config['Output_Filter_Values']['outfilename'] = os.path.join(
+            out_dir, 'batch_{}.txt'.format(n))
+        mag_conv_config.write()
+
+    nfailed = jwst_magnitude_converter.runBatch([os.path.join(out_dir, 'batch_*.cfg')], {}, 2)
+    assert nfailed == 1
+    for n in range(2):
+        niriss_mags = np.loadtxt(os.path.join(out_dir, 'batch_{}.txt'.format(n)))
+        assert niriss_mags.shape == (len(catalog), 5)
+    assert not os.path.isfile(os.path.join(out_dir, 'batch_2.txt'))
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+"""Tests for the threaded read / convert / write pipeline."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../'))
+import pipeline
+
+
+def test_run_pipeline():
+    """Test that the chunks are written in order and errors are raised."""
+    for queue_depth in [0, 1, 3]:
+        written = []
+        stages = pipeline.run_pipeline(iter(range(50)), lambda x: x*x, written.append, queue_depth)
+        assert written == [x*x for x in range(50)]
+        assert [stage.name for stage in stages] == ['read', 'convert', 'write']
+        assert [stage.items for stage in stages] == [50, 50, 50]
+        assert all(stage.busy >= 0. and stage.idle() >= 0. for stage in stages)
+
+    def convert(x):
+        if x == 7:
+            raise ValueError('bad chunk')
+        return x
+
+    def chunks():
+        for x in range(1000):
+            yield x
+
+    for queue_depth in [0, 2]:
+        written = []
+        with pytest.raises(ValueError, match='bad chunk'):
+            pipeline.run_pipeline(chunks(), convert, written.append, queue_depth)
+        assert len(written) <= 7 and written == list(range(len(written)))